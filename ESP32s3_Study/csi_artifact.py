@@ -0,0 +1,201 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from csi_compress import CompressedFingerprintModel, PCAReducer
+from csi_index import BruteForceIndex, IVFIndex
+
+# --- โมเดลแบบ artifact: โหลดเร็ว ใช้ numpy อย่างเดียวตอนทำนาย (ไม่ต้องมี sklearn / joblib) ---
+# 1 artifact = 1 โฟลเดอร์ <name>.csimodel
+#   manifest.json = เวอร์ชันของรูปแบบ, ชนิด index, จำนวน feature, k, weights, ข้อมูลการฝึก และรายการ array
+#   <array>.npy   = array แต่ละตัว: fingerprint (float32 หรือ uint8 ของ IVF int8), labels,
+#                   ค่า PCA (keep / mean / components) และช่วงของ int8 (vmin / scale)
+# ฝั่งโหลดเปิด .npy ด้วย np.load(mmap_mode='r') ไม่คัดลอก fingerprint เข้าหน่วยความจำ
+# (OS โหลดเฉพาะหน้าที่ใช้ และหลายโปรแกรมใช้หน้าเดียวกันได้) แล้วประกอบเป็น BruteForceIndex / IVFIndex /
+# CompressedFingerprintModel เดิมของ csi_index / csi_compress
+# KNeighborsRegressor (sklearn) ถูกแปลงเป็น BruteForceIndex แบบ float32 (ผลเท่ากัน ขนาดครึ่งหนึ่งของ float64)
+# ใช้งาน: train_model.py export ให้เอง (EXPORT_ARTIFACT) หรือ python csi_artifact.py <model.joblib> [ปลายทาง]
+
+ARTIFACT_SUFFIX = '.csimodel'
+ARTIFACT_FORMAT = 'csimodel'
+ARTIFACT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+
+
+def _sklearn_knn_arrays(model):
+    """ดึง fingerprint จาก KNeighborsRegressor (ไม่ import sklearn) รองรับเฉพาะระยะแบบ euclidean"""
+    metric = getattr(model, 'effective_metric_', None)
+    if metric != 'euclidean' and not (metric == 'minkowski' and getattr(model, 'effective_metric_params_', {})
+                                      .get('p') == 2):
+        raise ValueError(f"cannot export k-NN with metric '{metric}' (only euclidean distance is supported)")
+    if model.weights not in ('uniform', 'distance'):
+        raise ValueError(f"cannot export k-NN with weights={model.weights!r}")
+    refs = np.ascontiguousarray(model._fit_X, dtype=np.float32)
+    labels = np.ascontiguousarray(np.asarray(model._y).reshape(len(refs), -1), dtype=np.float32)
+    params = {'kind': 'brute', 'n_neighbors': int(model.n_neighbors), 'weights': model.weights}
+    return params, {'refs': refs, 'labels': labels, 'refs_sq': np.einsum('ij,ij->i', refs, refs)}
+
+
+def _index_arrays(index):
+    """คืนค่า (พารามิเตอร์, dict ของ array) ของ index 1 ตัว"""
+    if hasattr(index, '_fit_X'):
+        return _sklearn_knn_arrays(index)
+    index._merge_pending()
+    params = {'n_neighbors': int(index.n_neighbors), 'weights': index.weights}
+    if isinstance(index, BruteForceIndex):
+        params['kind'] = 'brute'
+        return params, {'refs': index.refs_, 'labels': index.labels_, 'refs_sq': index.refs_sq_}
+    if isinstance(index, IVFIndex):
+        params.update(kind='ivf', n_lists=int(index.n_lists), n_probe=int(index.n_probe), quantize=index.quantize)
+        arrays = {'centroids': index.centroids_, 'codes': index.codes_, 'labels': index.labels_,
+                  'codes_sq': index.codes_sq_, 'offsets': index.offsets_, 'ids': index.ids_}
+        if index.quantize == 'int8':
+            arrays.update(vmin=index.vmin_, scale=index.scale_)
+        return params, arrays
+    raise ValueError(f"cannot export model of type {type(index).__name__}")
+
+
+def export_artifact(model, path, metadata=None):
+    """
+    บันทึกโมเดล (KNeighborsRegressor / BruteForceIndex / IVFIndex / CompressedFingerprintModel) เป็น artifact
+    metadata = dict ที่บันทึกใน manifest (เช่นไฟล์ที่ใช้ฝึก ความแม่นยำ) คืนค่า manifest
+    """
+    if isinstance(model, CompressedFingerprintModel):
+        index_params, arrays = _index_arrays(model.index_)
+        if model.reducer_ is not None:
+            arrays.update(pca_keep=model.reducer_.keep_, pca_mean=model.reducer_.mean_,
+                          pca_components=model.reducer_.components_)
+        reducer = {'n_components': model.n_components, 'max_prototypes': model.max_prototypes,
+                   'pca': model.reducer_ is not None}
+    else:
+        index_params, arrays = _index_arrays(model)
+        reducer = None
+
+    manifest = {
+        'format': ARTIFACT_FORMAT,
+        'version': ARTIFACT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'n_features_in': int(model.n_features_in_),
+        'index': index_params,
+        'compressed': reducer,
+        'metadata': metadata or {},
+        'arrays': {},
+    }
+    # เขียนลงโฟลเดอร์ชั่วคราวก่อน แล้วค่อยแทนที่ของเดิม (predictor ไม่เห็น artifact ที่เขียนไม่ครบ)
+    tmp_path = path.rstrip('/\\') + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(tmp_path, name + '.npy'), array)
+        manifest['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != ARTIFACT_FORMAT or manifest.get('version') != ARTIFACT_VERSION:
+        raise ValueError(f"{path}: unsupported model artifact (format={manifest.get('format')!r}, "
+                         f"version={manifest.get('version')!r}, expected version {ARTIFACT_VERSION})")
+    return manifest
+
+
+def _load_arrays(path, manifest, mmap=True):
+    arrays = {}
+    for name, spec in manifest['arrays'].items():
+        # array ว่าง memory-map ไม่ได้ (ขนาด 0 ไบต์)
+        mode = 'r' if mmap and np.prod(spec['shape']) > 0 else None
+        array = np.load(os.path.join(path, name + '.npy'), mmap_mode=mode)
+        if array.dtype.str != spec['dtype'] or list(array.shape) != spec['shape']:
+            raise ValueError(f"{path}: array '{name}' is {array.dtype.str}{list(array.shape)}, "
+                             f"manifest says {spec['dtype']}{spec['shape']}")
+        arrays[name] = array
+    return arrays
+
+
+def _build_index(params, arrays):
+    if params['kind'] == 'brute':
+        index = BruteForceIndex(params['n_neighbors'], params['weights'])
+        index.refs_, index.labels_, index.refs_sq_ = arrays['refs'], arrays['labels'], arrays['refs_sq']
+        index.n_features_in_ = index.refs_.shape[1]
+    elif params['kind'] == 'ivf':
+        index = IVFIndex(params['n_neighbors'], params['n_lists'], params['n_probe'], params['quantize'],
+                         params['weights'])
+        index.centroids_ = arrays['centroids']
+        index.centroids_sq_ = np.einsum('ij,ij->i', index.centroids_, index.centroids_)
+        index.codes_, index.labels_ = arrays['codes'], arrays['labels']
+        index.codes_sq_, index.offsets_, index.ids_ = arrays['codes_sq'], arrays['offsets'], arrays['ids']
+        if params['quantize'] == 'int8':
+            index.vmin_, index.scale_ = arrays['vmin'], arrays['scale']
+        index.n_features_in_ = index.centroids_.shape[1]
+    else:
+        raise ValueError(f"unknown index kind '{params['kind']}' in model artifact")
+    index._pending = []
+    return index
+
+
+def load_artifact(path, mmap=True):
+    """โหลด artifact เป็นโมเดลที่มี predict / n_features_in_ (mmap=False = อ่านทั้งหมดเข้าหน่วยความจำ)"""
+    manifest = read_manifest(path)
+    arrays = _load_arrays(path, manifest, mmap)
+    params = manifest['index']
+    index = _build_index(params, arrays)
+    compressed = manifest['compressed']
+    if compressed is None:
+        model = index
+    else:
+        model = CompressedFingerprintModel(compressed['n_components'], compressed['max_prototypes'],
+                                           params['kind'], params['n_neighbors'], params['weights'])
+        model.reducer_ = None
+        if compressed['pca']:
+            model.reducer_ = PCAReducer(compressed['n_components'])
+            model.reducer_.keep_ = arrays['pca_keep']
+            model.reducer_.mean_ = arrays['pca_mean']
+            model.reducer_.components_ = arrays['pca_components']
+            model.reducer_.n_features_in_ = manifest['n_features_in']
+        model.index_ = index
+        model.n_features_in_ = manifest['n_features_in']
+    model.manifest_ = manifest
+    return model
+
+
+def is_artifact(path):
+    return path.rstrip('/\\').endswith(ARTIFACT_SUFFIX) or os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def load_model(path, mmap=True):
+    """โหลด artifact (.csimodel) หรือไฟล์ joblib เดิม (import joblib / sklearn เฉพาะกรณีหลัง)"""
+    if is_artifact(path):
+        return load_artifact(path, mmap)
+    import joblib
+    return joblib.load(path)
+
+
+def artifact_nbytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+if __name__ == "__main__":
+    import sys
+    # ใช้งาน: python csi_artifact.py <model.joblib> [ปลายทาง.csimodel]
+    if len(sys.argv) < 2:
+        print("Usage: python csi_artifact.py <model.joblib> [output.csimodel]")
+        sys.exit(1)
+    source = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + ARTIFACT_SUFFIX
+    try:
+        manifest = export_artifact(load_model(source), target, {'source': os.path.basename(source)})
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"Exported '{source}' ({os.path.getsize(source) / 1024:.1f} KB) -> '{target}' "
+          f"({artifact_nbytes(target) / 1024:.1f} KB, {manifest['index']['kind']}, "
+          f"{manifest['n_features_in']} features)")
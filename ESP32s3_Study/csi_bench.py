@@ -0,0 +1,382 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+
+from csi_capture import CaptureWriter, iter_capture_blocks, iter_csv_blocks
+from csi_framer import READ_CHUNK_SIZE, CsiFramer, read_frames
+from csi_metrics import IngestMetrics, MetricsRegistry
+from csi_motion import MotionDetector
+from csi_phase import LTF_SUBCARRIERS, iq_features
+from csi_replay import build_stream, encode_binary_frames, encode_iq_frames, encode_text_frames, synthesize_iq
+
+# --- ชุดวัดประสิทธิภาพของ pipeline: parse -> predict -> เขียนไฟล์ / แสดงผล ---
+# ใช้ข้อมูลที่บันทึกไว้ผ่าน ReplaySerial (ไม่ต้องมีบอร์ด) รายงาน frames/s, latency p50/p99
+# และหน่วยความจำสูงสุดที่จองระหว่างทำงาน (tracemalloc)
+# ผลลัพธ์ถูกบันทึกใน BENCH_RESULTS_FILE และเทียบกับผลครั้งก่อน เพื่อให้เห็น regression ก่อนใช้งานจริง
+# ใช้งาน: python csi_bench.py [ไฟล์หรือโฟลเดอร์ข้อมูล]
+
+BENCH_FRAMES = 5000             # จำนวนเฟรมต่อการวัด (ข้อมูลถูกวนซ้ำให้ครบ)
+BENCH_RESULTS_FILE = 'bench_results.json'
+REGRESSION_THRESHOLD = 0.10     # frames/s ลดลงเกินสัดส่วนนี้เทียบกับครั้งก่อน = regression
+MODEL_FILENAME = 'csi_knn_model.joblib'
+PREDICT_BATCH_SIZES = [1, 32]
+VISUALIZER_TICKS = 200
+FANOUT_READERS = 3
+FANOUT_CHUNK_FRAMES = 16       # จำนวนเฟรมที่ writer เขียนก่อน reader ทุกตัวอ่าน 1 รอบ
+MULTILAT_ANCHORS = [(0.0, 0.0), (4.0, 0.0), (0.0, 4.0), (4.0, 4.0)]
+MULTILAT_RATE_HZ = 500          # จำนวนระยะต่อวินาทีต่อ anchor ที่จำลอง
+PHASE_BLOCK_ROWS = 256          # จำนวนเฟรมต่อบล็อกของ I/Q -> amplitude + phase
+
+
+def load_bench_data(path, n_frames=BENCH_FRAMES):
+    """โหลด (amplitudes, labels) จากไฟล์หรือโฟลเดอร์ แล้ววนซ้ำให้ได้ n_frames แถว"""
+    if os.path.isdir(path) and not path.rstrip('/\\').endswith('.csicap'):
+        files = sorted(glob.glob(os.path.join(path, '*.csicap'))) or \
+            sorted(glob.glob(os.path.join(path, 'csi_data_x*.csv')))
+    else:
+        files = [path]
+    X, y = [], []
+    for file in files:
+        blocks = iter_capture_blocks(file) if file.rstrip('/\\').endswith('.csicap') else iter_csv_blocks(file)
+        for X_block, y_block, _ in blocks:
+            X.append(X_block)
+            y.append(y_block)
+    if not X:
+        return None, None
+    X, y = np.concatenate(X), np.concatenate(y)
+    order = np.arange(n_frames) % len(X)
+    return X[order], y[order]
+
+
+def summarize(name, n_frames, elapsed, latencies, peak_bytes):
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        'name': name,
+        'frames': int(n_frames),
+        'frames_per_sec': n_frames / elapsed if elapsed > 0 else float('inf'),
+        'p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else 0.0,
+        'p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else 0.0,
+        'peak_kb': peak_bytes / 1024,
+    }
+
+
+def run_bench(name, workload):
+    """
+    เรียก workload() 2 รอบ: รอบแรกจับเวลา (คืนค่า (จำนวนเฟรม, latency ต่อหน่วยงาน))
+    รอบที่สองเปิด tracemalloc เพื่อวัดหน่วยความจำสูงสุด (แยกรอบเพราะ tracemalloc ทำให้ช้าลง)
+    """
+    start = time.perf_counter()
+    n_frames, latencies = workload()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    workload()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(name, n_frames, elapsed, latencies, peak)
+
+
+def bench_parse(stream):
+    """แยกเฟรมจากสตรีมทีละ READ_CHUNK_SIZE ไบต์ (latency = เวลาต่อการ feed 1 ครั้ง)"""
+    def workload():
+        framer = CsiFramer('auto')
+        latencies = []
+        for start in range(0, len(stream), READ_CHUNK_SIZE):
+            t0 = time.perf_counter()
+            framer.feed(stream[start:start + READ_CHUNK_SIZE])
+            latencies.append(time.perf_counter() - t0)
+        return framer.frames, latencies
+    return workload
+
+
+class BufferSerial:
+    """Serial จำลองที่อ่านจาก bytes ในหน่วยความจำทันที (ไม่หน่วงเวลาเหมือน ReplaySerial)"""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    @property
+    def in_waiting(self):
+        return len(self.data) - self.pos
+
+    def read(self, size=1):
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+def bench_read_frames(stream, with_metrics):
+    """read_frames ทั้งสตรีม มี/ไม่มี IngestMetrics (เทียบ overhead ของ metrics) latency = ต่อการอ่าน 1 ครั้ง"""
+    def workload():
+        framer = CsiFramer('auto')
+        ser = BufferSerial(bytes(stream))
+        ingest = None
+        if with_metrics:
+            ingest = IngestMetrics(MetricsRegistry())
+            ingest.track(framer)
+        latencies = []
+        while ser.in_waiting:
+            t0 = time.perf_counter()
+            read_frames(ser, framer, ingest)
+            latencies.append(time.perf_counter() - t0)
+        return framer.frames, latencies
+    return workload
+
+
+def bench_predict(model, X, batch_size):
+    """ทำนายผ่าน FrameBatcher ของ csi_predictor (latency = ตั้งแต่เฟรมเข้า batch จนทำนายเสร็จ)"""
+    from csi_predictor import FrameBatcher, predict_batch
+    from csi_protocol import CsiFrame
+
+    frames = [CsiFrame(None, None, None, row) for row in X]
+
+    def workload():
+        batcher = FrameBatcher(model.n_features_in_, batch_size, window_sec=1.0)
+        latencies = []
+        for frame in frames:
+            if batcher.add(frame, time.perf_counter(), 0.0):
+                _, _, _, arrival_times = batcher.take()
+                predict_batch(model, batcher.features[:len(arrival_times)])
+                latencies.append(time.perf_counter() - arrival_times)
+        if batcher.count:
+            features, _, _, arrival_times = batcher.take()
+            predict_batch(model, features)
+            latencies.append(time.perf_counter() - arrival_times)
+        return len(frames), np.concatenate(latencies)
+    return workload
+
+
+def bench_collector_csv(X, folder):
+    """เขียนแถว CSV แบบเดียวกับ csi_collector.collect_data (latency = ต่อเฟรม)"""
+    path = os.path.join(folder, 'bench.csv')
+
+    def workload():
+        latencies = []
+        with open(path, 'w') as f:
+            for row in X:
+                t0 = time.perf_counter()
+                f.write(",".join(f"{v:.2f}" for v in row) + ",0.0,0.0\n")
+                latencies.append(time.perf_counter() - t0)
+        return len(X), latencies
+    return workload
+
+
+def bench_collector_capture(X, folder, amp_dtype):
+    """เขียนลง capture (.csicap) ด้วย CaptureWriter.append ทีละเฟรม"""
+    path = os.path.join(folder, f'bench_{amp_dtype}.csicap')
+
+    def workload():
+        shutil.rmtree(path, ignore_errors=True)
+        latencies = []
+        with CaptureWriter(path, X.shape[1], amp_dtype) as writer:
+            for row in X:
+                t0 = time.perf_counter()
+                writer.append(row, 0.0, 0.0, 0.0)
+                latencies.append(time.perf_counter() - t0)
+        return len(X), latencies
+    return workload
+
+
+def bench_visualizer(stream):
+    """
+    ต่อ 1 tick: เฟรมที่มาถึงใน READ_CHUNK_SIZE ไบต์ถูกเขียนลง ring buffer (งานของ thread อ่าน)
+    แล้วเรียก update_graph ของ csi_visualizer + วาดเฉพาะ artist ที่คืนมา (เหมือน FuncAnimation แบบ blit)
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import csi_visualizer
+
+    def workload():
+        framer = CsiFramer(csi_visualizer.SERIAL_FORMAT)
+        csi_visualizer.csi_ring.clear()
+        csi_visualizer.smoothed_ring.clear()
+        csi_visualizer.csi_filter.reset()
+        csi_visualizer.fig.canvas.draw()
+        latencies = []
+        for tick in range(VISUALIZER_TICKS):
+            chunk = stream[tick * READ_CHUNK_SIZE:(tick + 1) * READ_CHUNK_SIZE]
+            t0 = time.perf_counter()
+            for frame in framer.feed(chunk):
+                csi_visualizer.ingest_frame(frame.amplitudes)
+            for artist in csi_visualizer.update_graph(tick):
+                artist.axes.draw_artist(artist)
+            latencies.append(time.perf_counter() - t0)
+        return framer.frames, latencies
+    return workload
+
+
+def bench_shared_memory(X, n_readers=FANOUT_READERS):
+    """writer 1 ตัวเขียนลง shared memory (csi_shm) แล้ว reader n_readers ตัวอ่าน (latency = ต่อ chunk)"""
+    from csi_protocol import CsiFrame
+    from csi_shm import SharedFrameReader, SharedFrameWriter
+
+    frames = [CsiFrame(i, 0, 0, row) for i, row in enumerate(X)]
+
+    def workload():
+        writer = SharedFrameWriter(f"csi_bench_{os.getpid()}")
+        readers = [SharedFrameReader(writer.name, timeout=0) for _ in range(n_readers)]
+        latencies = []
+        try:
+            for start in range(0, len(frames), FANOUT_CHUNK_FRAMES):
+                t0 = time.perf_counter()
+                for frame in frames[start:start + FANOUT_CHUNK_FRAMES]:
+                    writer.write(frame, 0.0)
+                for reader in readers:
+                    reader.read_frames()
+                latencies.append(time.perf_counter() - t0)
+        finally:
+            for reader in readers:
+                reader.close()
+            writer.close()
+        return len(frames), latencies
+    return workload
+
+
+def bench_multilateration(n_ranges=BENCH_FRAMES * 4):
+    """ระยะจำลองจาก MULTILAT_ANCHORS (10% outlier) ผ่าน RangeLocalizer ("frames" = ระยะ, latency = ต่อช่วงเวลา)"""
+    from csi_multilat import WINDOW_SEC, RangeLocalizer
+
+    anchors = np.array(MULTILAT_ANCHORS)
+    rng = np.random.default_rng(0)
+    n_per_anchor = n_ranges // len(anchors)
+    times = np.arange(n_per_anchor) / MULTILAT_RATE_HZ
+    path = np.column_stack([2 + np.cos(times), 2 + np.sin(times)])
+    ranges = np.linalg.norm(path[:, None, :] - anchors[None], axis=2)
+    ranges += rng.normal(0, 0.05, ranges.shape)
+    ranges[rng.random(ranges.shape) < 0.1] += 3.0
+    per_window = max(int(WINDOW_SEC * MULTILAT_RATE_HZ), 1)
+
+    def workload():
+        localizer = RangeLocalizer(anchors)
+        latencies = []
+        for start in range(0, n_per_anchor, per_window):
+            t0 = time.perf_counter()
+            for anchor_id in range(len(anchors)):
+                localizer.add(anchor_id, times[start], ranges[start:start + per_window, anchor_id])
+            localizer.solve_due(times[start] + WINDOW_SEC)
+            latencies.append(time.perf_counter() - t0)
+        return n_per_anchor * len(anchors), latencies
+    return workload
+
+
+def bench_phase(iq, block_rows=PHASE_BLOCK_ROWS):
+    """I/Q ดิบ -> feature amp+phase (unwrap + ลบ offset เชิงเส้น) ทีละบล็อก (latency = ต่อบล็อก)"""
+    def workload():
+        latencies = []
+        for start in range(0, len(iq), block_rows):
+            t0 = time.perf_counter()
+            iq_features(iq[start:start + block_rows], 'amp+phase')
+            latencies.append(time.perf_counter() - t0)
+        return len(iq), latencies
+    return workload
+
+
+def bench_motion(X):
+    """MotionDetector ทีละเฟรม (sliding variance + correlation + baseline)"""
+    def workload():
+        detector = MotionDetector(X.shape[1])
+        latencies = []
+        for i, x in enumerate(X):
+            t0 = time.perf_counter()
+            detector.update(x, i / detector.rate_hz)
+            latencies.append(time.perf_counter() - t0)
+        return len(X), latencies
+    return workload
+
+
+def load_model(X, y):
+    """ใช้โมเดลที่ฝึกไว้ถ้ามี (จำนวน feature ต้องตรง) ไม่เช่นนั้นฝึก k-NN จากข้อมูลที่ใช้วัด"""
+    import joblib
+    if os.path.exists(MODEL_FILENAME):
+        model = joblib.load(MODEL_FILENAME)
+        if model.n_features_in_ <= X.shape[1]:
+            return model, X[:, :model.n_features_in_]
+    from sklearn.neighbors import KNeighborsRegressor
+    return KNeighborsRegressor(n_neighbors=5).fit(X, y), X
+
+
+def run_all(data_path):
+    """รันทุก benchmark คืนค่า list ของผลลัพธ์"""
+    X, y = load_bench_data(data_path)
+    if X is None:
+        print(f"Error: No data found in '{data_path}'.")
+        return []
+
+    text_frames = encode_text_frames(X)
+    binary_frames = encode_binary_frames(X)
+    results = []
+    for fmt, frames in (('text', text_frames), ('binary', binary_frames)):
+        for mode in ('clean', 'merged', 'corrupt'):
+            stream, _ = build_stream(frames, mode)
+            results.append(run_bench(f"parse/{fmt}/{mode}", bench_parse(stream)))
+    stream, _ = build_stream(text_frames)
+    for with_metrics in (False, True):
+        name = "ingest/read_frames" + ("+metrics" if with_metrics else "")
+        results.append(run_bench(name, bench_read_frames(stream, with_metrics)))
+    # I/Q ของ LLTF 64 subcarrier (ข้อมูลที่มีไม่ครบ 64 เติม 0)
+    X_ltf = np.zeros((len(X), LTF_SUBCARRIERS), dtype=np.float32)
+    X_ltf[:, :min(X.shape[1], LTF_SUBCARRIERS)] = X[:, :LTF_SUBCARRIERS]
+    iq = synthesize_iq(X_ltf)
+    stream, _ = build_stream(encode_iq_frames(iq))
+    results.append(run_bench("parse/binary-iq/clean", bench_parse(stream)))
+    results.append(run_bench(f"phase/sanitize-block{PHASE_BLOCK_ROWS}", bench_phase(iq)))
+
+    model, X_model = load_model(X, y)
+    for batch_size in PREDICT_BATCH_SIZES:
+        results.append(run_bench(f"predict/batch{batch_size}", bench_predict(model, X_model, batch_size)))
+
+    folder = tempfile.mkdtemp(prefix='csi_bench_')
+    try:
+        results.append(run_bench("collector/csv", bench_collector_csv(X, folder)))
+        for amp_dtype in ('float32', 'int16'):
+            results.append(run_bench(f"collector/capture-{amp_dtype}", bench_collector_capture(X, folder, amp_dtype)))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    results.append(run_bench(f"fanout/shm-{FANOUT_READERS}readers", bench_shared_memory(X)))
+    results.append(run_bench("multilat/ranges", bench_multilateration()))
+    results.append(run_bench("motion/detector", bench_motion(X)))
+
+    stream, _ = build_stream(text_frames)
+    results.append(run_bench("visualizer/update+blit", bench_visualizer(stream)))
+    return results
+
+
+def format_results(results, previous=None):
+    """ตารางผลลัพธ์ ถ้ามีผลครั้งก่อนจะแสดงการเปลี่ยนแปลงของ frames/s และเตือน regression"""
+    previous = {r['name']: r for r in (previous or [])}
+    lines = [f"{'benchmark':<28} {'frames/s':>11} {'p50 ms':>9} {'p99 ms':>9} {'peak KB':>9} {'vs last':>8}"]
+    for r in results:
+        change = ''
+        if r['name'] in previous and previous[r['name']]['frames_per_sec'] > 0:
+            ratio = r['frames_per_sec'] / previous[r['name']]['frames_per_sec'] - 1
+            change = f"{ratio:+.0%}" + (' REGRESSION' if ratio < -REGRESSION_THRESHOLD else '')
+        lines.append(f"{r['name']:<28} {r['frames_per_sec']:>11.0f} {r['p50_ms']:>9.3f} "
+                     f"{r['p99_ms']:>9.3f} {r['peak_kb']:>9.1f} {change:>8}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import sys
+    # โมเดลที่ฝึกจาก DataFrame เตือนเรื่องชื่อคอลัมน์ทุกครั้งที่ทำนาย (ไม่มีผลต่อผลลัพธ์)
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    data_path = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    previous = None
+    if os.path.exists(BENCH_RESULTS_FILE):
+        with open(BENCH_RESULTS_FILE) as f:
+            previous = json.load(f)
+
+    results = run_all(data_path)
+    if results:
+        print(format_results(results, previous))
+        with open(BENCH_RESULTS_FILE, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to '{BENCH_RESULTS_FILE}'")
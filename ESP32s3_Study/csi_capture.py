@@ -0,0 +1,391 @@
+import glob
+import itertools
+import os
+import struct
+
+import numpy as np
+
+from csi_phase import feature_count, iq_features
+
+# --- รูปแบบไฟล์ Capture แบบ columnar (memory-mapped) ---
+# 1 capture = 1 โฟลเดอร์ <name>.csicap ที่มีไฟล์แยกต่อคอลัมน์ <column>.col
+# ทุกไฟล์คอลัมน์ขึ้นต้นด้วย header 32 ไบต์:
+#   magic(6) version(2) dtype(8) n_cols(4) scale(4) reserved(8)
+# ตามด้วยข้อมูลแบบ fixed-width (row-major) ที่เขียนต่อท้ายได้เรื่อยๆ (append-only)
+# ฝั่งอ่านใช้ np.memmap เปิดได้ทันทีโดยไม่ต้อง parse ข้อความ
+
+CAPTURE_SUFFIX = '.csicap'
+COLUMN_SUFFIX = '.col'
+COLUMN_MAGIC = b'CSICOL'
+COLUMN_VERSION = 1
+COLUMN_HEADER = struct.Struct('<6sH8sIf8x')
+
+# คอลัมน์มาตรฐานของ capture
+AMPLITUDES = 'amplitudes'   # (N, n_subcarriers) float32 หรือ int16
+LABELS = 'labels'           # (N, 2) float32 -> pos_x, pos_y
+TIMESTAMPS = 'timestamps'   # (N,) float64 วินาที (NaN ถ้าไม่ทราบ เช่นไฟล์ที่แปลงจาก CSV)
+# คอลัมน์เสริม (เพิ่มด้วย CaptureWriter.add_column)
+RSSI = 'rssi'               # (N,) float32 dBm (NaN ถ้าไม่ทราบ)
+DEVICE = 'device'           # (N,) uint16 ลำดับตัวรับเมื่อเก็บหลายพอร์ตพร้อมกัน
+IQ = 'iq'                   # (N, 2 x n_subcarriers) int8 I/Q ดิบจากเฟรม FLAG_IQ (0 ทั้งแถว = ไม่มี I/Q)
+
+WRITE_BLOCK_ROWS = 1024     # จำนวนแถวที่พักไว้ในหน่วยความจำก่อนเขียนลงดิสก์
+STREAM_BLOCK_ROWS = 8192    # จำนวนแถวต่อบล็อกเมื่ออ่านข้อมูลแบบ streaming
+AMP_INT16_SCALE = 100.0     # int16 = amplitude x scale (เหมือนเฟรมไบนารีจาก ESP32)
+
+
+def _write_column_header(f, dtype, n_cols, scale):
+    f.write(COLUMN_HEADER.pack(COLUMN_MAGIC, COLUMN_VERSION, np.dtype(dtype).str.encode('ascii'), n_cols, scale))
+
+
+def read_column_header(path):
+    """อ่าน header ของไฟล์คอลัมน์ คืนค่า (dtype, n_cols, scale)"""
+    with open(path, 'rb') as f:
+        raw = f.read(COLUMN_HEADER.size)
+    if len(raw) < COLUMN_HEADER.size:
+        raise ValueError(f"{path}: file too short for column header")
+    magic, version, dtype, n_cols, scale = COLUMN_HEADER.unpack(raw)
+    if magic != COLUMN_MAGIC or version != COLUMN_VERSION:
+        raise ValueError(f"{path}: not a CSI column file (magic={magic!r}, version={version})")
+    return np.dtype(dtype.rstrip(b'\x00').decode('ascii')), n_cols, scale
+
+
+class ColumnWriter:
+    """เขียนคอลัมน์เดียวแบบ append-only โดยพักข้อมูลเป็นบล็อกก่อนเขียน"""
+
+    def __init__(self, path, dtype, n_cols, scale=1.0, block_rows=WRITE_BLOCK_ROWS):
+        self.dtype = np.dtype(dtype)
+        self.n_cols = n_cols
+        self.scale = scale
+        self.existing_rows = 0
+        if os.path.exists(path) and os.path.getsize(path) >= COLUMN_HEADER.size:
+            # เขียนต่อจากไฟล์เดิม: header ต้องตรงกัน
+            old_dtype, old_cols, old_scale = read_column_header(path)
+            if (old_dtype, old_cols, old_scale) != (self.dtype, n_cols, np.float32(scale)):
+                raise ValueError(f"{path}: existing column has dtype={old_dtype} n_cols={old_cols} scale={old_scale}")
+            # ตัดแถวที่เขียนค้างครึ่งทาง (เช่นโปรแกรมถูกปิดกลางคัน) ก่อนเขียนต่อ
+            row_bytes = self.dtype.itemsize * n_cols
+            n_rows = (os.path.getsize(path) - COLUMN_HEADER.size) // row_bytes
+            self._file = open(path, 'r+b')
+            self._file.truncate(COLUMN_HEADER.size + n_rows * row_bytes)
+            self._file.seek(0, os.SEEK_END)
+            self.existing_rows = n_rows
+        else:
+            self._file = open(path, 'wb')
+            _write_column_header(self._file, self.dtype, n_cols, scale)
+        self._block = np.empty((block_rows, n_cols), dtype=self.dtype)
+        self._count = 0
+
+    def truncate_rows(self, n_rows):
+        """ตัดข้อมูลเดิมให้เหลือ n_rows แถว (ใช้จัดคอลัมน์ให้ยาวเท่ากันก่อนเขียนต่อ)"""
+        self._file.truncate(COLUMN_HEADER.size + n_rows * self.dtype.itemsize * self.n_cols)
+        self._file.seek(0, os.SEEK_END)
+        self.existing_rows = n_rows
+
+    def append(self, row):
+        """เพิ่ม 1 แถว"""
+        self._block[self._count] = row
+        self._count += 1
+        if self._count == len(self._block):
+            self.flush()
+
+    def append_block(self, rows):
+        """เพิ่มหลายแถวพร้อมกัน (เขียนตรงลงไฟล์)"""
+        self.flush()
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape(-1, self.n_cols)
+        self._file.write(rows.tobytes())
+
+    def flush(self):
+        if self._count:
+            self._file.write(self._block[:self._count].tobytes())
+            self._count = 0
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class CaptureWriter:
+    """
+    เขียน capture แบบ columnar: amplitudes, labels (pos_x, pos_y), timestamps
+    ใช้ amp_dtype='int16' เพื่อลดขนาดไฟล์ลงครึ่งหนึ่ง (ความละเอียด 0.01)
+    """
+
+    def __init__(self, path, n_subcarriers, amp_dtype='float32'):
+        self.path = path
+        self.n_subcarriers = n_subcarriers
+        os.makedirs(path, exist_ok=True)
+
+        amp_dtype = np.dtype(amp_dtype)
+        self._amp_scale = AMP_INT16_SCALE if amp_dtype.kind == 'i' else 1.0
+        self.columns = {
+            AMPLITUDES: ColumnWriter(_column_path(path, AMPLITUDES), amp_dtype, n_subcarriers, self._amp_scale),
+            LABELS: ColumnWriter(_column_path(path, LABELS), np.float32, 2),
+            TIMESTAMPS: ColumnWriter(_column_path(path, TIMESTAMPS), np.float64, 1),
+        }
+        # เขียนต่อจาก capture เดิม: ทุกคอลัมน์ต้องมีจำนวนแถวเท่ากัน
+        existing = min(c.existing_rows for c in self.columns.values())
+        for column in self.columns.values():
+            if column.existing_rows != existing:
+                column.truncate_rows(existing)
+        self.rows = 0
+
+    def add_column(self, name, dtype, n_cols=1):
+        """เพิ่มคอลัมน์เสริม (เช่น rssi, device) ก่อนเริ่มเขียนข้อมูล"""
+        if self.rows:
+            raise ValueError("extra columns must be added before the first row is written")
+        column = ColumnWriter(_column_path(self.path, name), dtype, n_cols)
+        existing = self.columns[AMPLITUDES].existing_rows
+        if column.existing_rows != existing:
+            # คอลัมน์ใหม่ใน capture เดิม: เติมแถวว่างให้ตรงกับคอลัมน์อื่น
+            if column.existing_rows > existing:
+                column.truncate_rows(existing)
+            else:
+                column.append_block(np.zeros((existing - column.existing_rows, n_cols), dtype=column.dtype))
+        self.columns[name] = column
+        return column
+
+    def _scale_amplitudes(self, amplitudes):
+        amplitudes = np.asarray(amplitudes, dtype=np.float32)
+        if self._amp_scale != 1.0:
+            amplitudes = np.rint(amplitudes * self._amp_scale)
+        return amplitudes
+
+    def append(self, amplitudes, pos_x, pos_y, timestamp=np.nan, **extra):
+        """เพิ่ม 1 เฟรม (amplitudes ต้องมีความยาว n_subcarriers)"""
+        self.columns[AMPLITUDES].append(self._scale_amplitudes(amplitudes))
+        self.columns[LABELS].append((pos_x, pos_y))
+        self.columns[TIMESTAMPS].append(timestamp)
+        for name, value in extra.items():
+            self.columns[name].append(value)
+        self.rows += 1
+
+    def append_block(self, amplitudes, labels, timestamps=None, **extra):
+        """เพิ่มหลายเฟรมพร้อมกัน (amplitudes: N x n_subcarriers, labels: N x 2)"""
+        amplitudes = self._scale_amplitudes(amplitudes).reshape(-1, self.n_subcarriers)
+        n = len(amplitudes)
+        if timestamps is None:
+            timestamps = np.full(n, np.nan)
+        self.columns[AMPLITUDES].append_block(amplitudes)
+        self.columns[LABELS].append_block(labels)
+        self.columns[TIMESTAMPS].append_block(timestamps)
+        for name, values in extra.items():
+            self.columns[name].append_block(values)
+        self.rows += n
+
+    def flush(self):
+        for column in self.columns.values():
+            column.flush()
+
+    def close(self):
+        for column in self.columns.values():
+            column.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _column_path(capture_path, name):
+    return os.path.join(capture_path, name + COLUMN_SUFFIX)
+
+
+def open_column(path):
+    """เปิดไฟล์คอลัมน์เป็น np.memmap (อ่านอย่างเดียว) คืนค่า (memmap, scale)"""
+    dtype, n_cols, scale = read_column_header(path)
+    row_bytes = dtype.itemsize * n_cols
+    n_rows = (os.path.getsize(path) - COLUMN_HEADER.size) // row_bytes
+    if n_rows == 0:
+        return np.empty((0, n_cols), dtype=dtype), scale
+    data = np.memmap(path, dtype=dtype, mode='r', offset=COLUMN_HEADER.size, shape=(n_rows, n_cols))
+    return data, scale
+
+
+def open_capture(path):
+    """
+    เปิด capture ทุกคอลัมน์เป็น memmap โดยไม่ parse ข้อมูล
+    คืนค่า dict {ชื่อคอลัมน์: array} ที่ตัดให้มีจำนวนแถวเท่ากัน (กันกรณีเขียนค้างครึ่งทาง)
+    คีย์ 'amplitude_scale' เก็บตัวคูณของ amplitudes (1.0 สำหรับ float32)
+    """
+    columns = {}
+    scales = {}
+    for col_path in sorted(glob.glob(os.path.join(path, '*' + COLUMN_SUFFIX))):
+        name = os.path.basename(col_path)[:-len(COLUMN_SUFFIX)]
+        columns[name], scales[name] = open_column(col_path)
+    if AMPLITUDES not in columns or LABELS not in columns:
+        raise ValueError(f"{path}: capture is missing '{AMPLITUDES}' or '{LABELS}' column")
+
+    n_rows = min(len(c) for c in columns.values())
+    capture = {name: data[:n_rows] for name, data in columns.items()}
+    capture[TIMESTAMPS] = capture[TIMESTAMPS].reshape(-1) if TIMESTAMPS in capture else np.full(n_rows, np.nan)
+    capture['amplitude_scale'] = float(scales[AMPLITUDES])
+    return capture
+
+
+def _iq_column(capture, feature_mode):
+    if IQ not in capture:
+        raise ValueError(f"feature mode '{feature_mode}' needs an '{IQ}' column "
+                         f"(collect with CSI_IQ_OUTPUT firmware and CAPTURE_IQ = True)")
+    return capture[IQ]
+
+
+def capture_features(capture, feature_mode='amplitude'):
+    """
+    คืน feature float32 ของทั้ง capture
+    'amplitude' = คอลัมน์ amplitudes (memmap เดิมถ้าไม่ต้องแปลง)
+    โหมดอื่น (ดู csi_phase.FEATURE_MODES) คำนวณจากคอลัมน์ iq ทีละ STREAM_BLOCK_ROWS แถว
+    """
+    if feature_mode != 'amplitude':
+        iq = _iq_column(capture, feature_mode)
+        features = np.empty((len(iq), feature_count(feature_mode)), dtype=np.float32)
+        for start in range(0, len(iq), STREAM_BLOCK_ROWS):
+            features[start:start + STREAM_BLOCK_ROWS] = iq_features(iq[start:start + STREAM_BLOCK_ROWS], feature_mode)
+        return features
+    amplitudes = capture[AMPLITUDES]
+    scale = capture['amplitude_scale']
+    if amplitudes.dtype == np.float32 and scale == 1.0:
+        return amplitudes
+    return amplitudes.astype(np.float32) / np.float32(scale)
+
+
+def find_captures(folder_path):
+    """หา capture ทั้งหมดในโฟลเดอร์"""
+    return sorted(glob.glob(os.path.join(folder_path, '*' + CAPTURE_SUFFIX)))
+
+
+def load_capture_dataset(folder_path, feature_mode='amplitude'):
+    """
+    รวม capture ทั้งหมดในโฟลเดอร์เป็น (X, y)
+    ถ้ามี capture เดียว (และ feature_mode = 'amplitude') จะคืน memmap ตรงๆ โดยไม่คัดลอกข้อมูล
+    """
+    paths = find_captures(folder_path)
+    if not paths:
+        return None
+    captures = [open_capture(p) for p in paths]
+    n_sc = {c[AMPLITUDES].shape[1] for c in captures}
+    if len(n_sc) > 1:
+        raise ValueError(f"captures have different subcarrier counts: {sorted(n_sc)}")
+
+    if len(captures) == 1:
+        X, y = capture_features(captures[0], feature_mode), captures[0][LABELS]
+    else:
+        X = np.concatenate([capture_features(c, feature_mode) for c in captures])
+        y = np.concatenate([c[LABELS] for c in captures])
+    if feature_mode != 'amplitude':
+        # แถวที่ไม่มี I/Q ได้ feature เป็น NaN
+        X, y, _ = _finite_rows(X, np.asarray(y))
+    return X, y
+
+
+def parse_csv_lines(lines, n_cols):
+    """
+    แปลงบรรทัดข้อมูล CSV เป็น array float32 (N, n_cols) ในครั้งเดียว
+    แถวที่จำนวนคอลัมน์ไม่ครบหรือมีค่าที่ไม่ใช่ตัวเลข (เฟรมที่ต่อกัน) จะถูกทิ้ง
+    """
+    good = [line for line in lines if line.count(',') == n_cols - 1 and 'CSI' not in line]
+    try:
+        return np.array(','.join(good).split(','), dtype=np.float32).reshape(-1, n_cols) if good else np.empty((0, n_cols), np.float32)
+    except ValueError:
+        # มีแถวเสียปนอยู่ แปลงทีละแถวเพื่อคัดแถวนั้นออก
+        rows = []
+        for line in good:
+            try:
+                rows.append(np.array(line.split(','), dtype=np.float32))
+            except ValueError:
+                pass
+        return np.array(rows, dtype=np.float32).reshape(-1, n_cols)
+
+
+def _finite_rows(amplitudes, labels):
+    """ตัดแถวที่มี NaN/inf ออก คืนค่า (amplitudes, labels, จำนวนแถวที่ทิ้ง)"""
+    valid = np.isfinite(amplitudes).all(axis=1) & np.isfinite(labels).all(axis=1)
+    if valid.all():
+        return amplitudes, labels, 0
+    return amplitudes[valid], labels[valid], int(len(valid) - valid.sum())
+
+
+def iter_capture_blocks(capture_path, block_rows=STREAM_BLOCK_ROWS, feature_mode='amplitude'):
+    """
+    อ่าน capture ทีละ block_rows แถว คืนค่า (features float32, labels, จำนวนแถวที่ทิ้ง) ทีละบล็อก
+    หน่วยความจำที่ใช้ขึ้นกับขนาดบล็อก ไม่ใช่ขนาดไฟล์ (feature_mode ดู capture_features)
+    """
+    capture = open_capture(capture_path)
+    amplitudes, labels = capture[AMPLITUDES], capture[LABELS]
+    iq = _iq_column(capture, feature_mode) if feature_mode != 'amplitude' else None
+    scale = np.float32(capture['amplitude_scale'])
+    for start in range(0, len(amplitudes), block_rows):
+        if iq is not None:
+            block = iq_features(iq[start:start + block_rows], feature_mode)
+        else:
+            block = amplitudes[start:start + block_rows].astype(np.float32)
+            if scale != 1.0:
+                block /= scale
+        yield _finite_rows(block, np.asarray(labels[start:start + block_rows], dtype=np.float32))
+
+
+def iter_csv_blocks(csv_path, block_rows=STREAM_BLOCK_ROWS):
+    """อ่านไฟล์ CSV เดิมทีละ block_rows บรรทัด คืนค่าแบบเดียวกับ iter_capture_blocks"""
+    with open(csv_path, 'r') as f:
+        header = f.readline().strip().split(',')
+        n_cols = len(header)
+        if header[-2:] != ['pos_x', 'pos_y']:
+            raise ValueError(f"{csv_path}: expected 'pos_x,pos_y' as the last header columns")
+        while True:
+            lines = [line.rstrip('\r\n') for line in itertools.islice(f, block_rows)]
+            if not lines:
+                break
+            data = parse_csv_lines(lines, n_cols)
+            amplitudes, labels, dropped = _finite_rows(data[:, :-2], data[:, -2:])
+            yield amplitudes, labels, dropped + len(lines) - len(data)
+
+
+def convert_csv_capture(csv_path, capture_path=None, amp_dtype='float32'):
+    """
+    แปลงไฟล์ csi_data_x*_y*.csv เดิมเป็น capture แบบ columnar
+    แถวที่จำนวนคอลัมน์ไม่ครบหรือมีค่าที่ไม่ใช่ตัวเลข (เฟรมที่ต่อกัน) จะถูกทิ้ง
+    คืนค่า (จำนวนแถวที่แปลง, จำนวนแถวที่ทิ้ง)
+    """
+    if capture_path is None:
+        capture_path = os.path.splitext(csv_path)[0] + CAPTURE_SUFFIX
+
+    with open(csv_path, 'r') as f:
+        header = f.readline().strip().split(',')
+        lines = f.read().splitlines()
+    n_cols = len(header)
+    if header[-2:] != ['pos_x', 'pos_y']:
+        raise ValueError(f"{csv_path}: expected 'pos_x,pos_y' as the last header columns")
+
+    data = parse_csv_lines(lines, n_cols)
+
+    with CaptureWriter(capture_path, n_cols - 2, amp_dtype) as writer:
+        writer.append_block(data[:, :-2], data[:, -2:])
+    return len(data), len(lines) - len(data)
+
+
+def convert_csv_folder(folder_path, amp_dtype='float32'):
+    """แปลงทุกไฟล์ csi_data_x*.csv ในโฟลเดอร์ (ข้ามไฟล์ที่แปลงแล้ว)"""
+    csv_files = sorted(glob.glob(os.path.join(folder_path, 'csi_data_x*.csv')))
+    if not csv_files:
+        print(f"Error: No data files found in '{folder_path}'.")
+        return
+    for csv_path in csv_files:
+        capture_path = os.path.splitext(csv_path)[0] + CAPTURE_SUFFIX
+        if os.path.exists(capture_path):
+            print(f"Skip {csv_path}: {capture_path} already exists.")
+            continue
+        try:
+            converted, dropped = convert_csv_capture(csv_path, capture_path, amp_dtype)
+            print(f"{csv_path} -> {capture_path}: {converted} rows ({dropped} malformed rows dropped)")
+        except (OSError, ValueError) as e:
+            print(f"Could not convert {csv_path} due to error: {e}")
+
+
+if __name__ == "__main__":
+    import sys
+    # ใช้งาน: python csi_capture.py [โฟลเดอร์] [float32|int16]
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    dtype = sys.argv[2] if len(sys.argv) > 2 else 'float32'
+    convert_csv_folder(folder, dtype)
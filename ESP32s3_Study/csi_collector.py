@@ -1,17 +1,122 @@
 import serial
+import sys
 import time
+import numpy as np
+
+from csi_capture import CAPTURE_SUFFIX, DEVICE, IQ, RSSI, CaptureWriter
+from csi_framer import CsiFramer, attach_rssi, read_frames
+from csi_hub import open_serial
+from csi_metrics import IngestMetrics, create_metrics
+from csi_multiport import PortCollector
+from csi_session import SESSION_SUFFIX, SessionRecorder
+from csi_survey import ConvergenceMonitor, format_survey_results, load_plan
 
 # ---!!! ตั้งค่าที่สำคัญ !!!---
-SERIAL_PORT = 'COM10'  # <--- แก้ไข Port ของคุณตรงนี้
+SERIAL_PORT = 'COM10'  # <--- แก้ไข Port ของคุณตรงนี้ ('hub://127.0.0.1:5760' หรือ 'shm://csi_frames' = อ่านผ่าน csi_hub.py)
+# ถ้ามีตัวรับหลายตัว ใส่ทุกพอร์ตที่นี่เพื่อเก็บข้อมูลพร้อมกัน เช่น ['COM10', 'COM11', 'COM12']
+SERIAL_PORTS = [SERIAL_PORT]
 BAUD_RATE = 115200
 COLLECTION_DURATION_SEC = 60 # ระยะเวลาในการเก็บข้อมูลต่อ 1 จุด (วินาที)
 NUM_SUBcarriers = 64 # จำนวน subcarrier สูงสุดที่จะสร้าง header
+SERIAL_FORMAT = 'text' # 'text' = CSI_DATA,... (เดิม), 'binary' = เฟรมไบนารี (CSI_BINARY_OUTPUT ในเฟิร์มแวร์), 'auto' = รับทั้งสองแบบ
+OUTPUT_FORMAT = 'csv' # 'csv' = ไฟล์ CSV (เดิม), 'capture' = โฟลเดอร์ .csicap แบบ memory-mapped (ดู csi_capture.py)
+                      # 'session' = CSV แบ่งหลายไฟล์ + บีบอัด + fsync เป็นระยะ ในโฟลเดอร์ .session (ดู csi_session.py)
+CAPTURE_AMP_DTYPE = 'float32' # 'float32' หรือ 'int16' (ไฟล์เล็กลงครึ่งหนึ่ง ความละเอียด 0.01)
+# True = เก็บ I/Q ดิบ (int8) ในคอลัมน์ iq ของ capture สำหรับ feature amplitude + phase (ดู csi_phase.py)
+# ต้องตั้ง CSI_BINARY_OUTPUT 1 และ CSI_IQ_OUTPUT 1 ในเฟิร์มแวร์ และ SERIAL_FORMAT = 'binary' หรือ 'auto'
+CAPTURE_IQ = False
+SESSION_COMPRESSION = 'gzip' # None, 'gzip' หรือ 'zstd' (ต้องติดตั้ง zstandard)
+SESSION_COMPRESSION_LEVEL = None # None = ค่าเริ่มต้น (gzip 6, zstd 3) มาก = ไฟล์เล็กลงแต่ใช้ CPU มากขึ้น
+SESSION_ROTATE_SEC = 600 # เปิดไฟล์ใหม่ทุกกี่วินาที (None = ไม่แบ่งตามเวลา)
+SESSION_ROTATE_MB = 64 # ขนาดข้อมูล (ก่อนบีบอัด) สูงสุดต่อไฟล์
+SESSION_CHECKPOINT_SEC = 5.0 # fsync ทุกกี่วินาที (ข้อมูลที่อาจหายเมื่อโปรแกรมหยุดกะทันหันไม่เกินช่วงนี้)
+# ไฟล์แผน survey (ดู csi_survey.py) None = ถามพิกัดทีละจุด หรือส่งเป็น argument: python csi_collector.py survey.json
+SURVEY_PLAN = None
+# Metrics (csi_metrics.py): None = ปิด, 'log', 'http' (http://127.0.0.1:9108/metrics) หรือ 'log+http'
+METRICS_EXPORT = None
+
+ingest_metrics = None # IngestMetrics ของทุก framer เมื่อเปิด METRICS_EXPORT
+
+def collect_frames(ser, framer, duration_sec, handle_frame, stop=None):
+    """อ่านเฟรมจาก Serial ตามระยะเวลาที่กำหนด แล้วส่งแต่ละเฟรมให้ handle_frame (stop(frame) = True หยุดก่อนเวลา)"""
+    sample_count = 0
+    last_rssi = None
+    start_time = time.time()
+    while time.time() - start_time < duration_sec:
+        frames = read_frames(ser, framer, ingest_metrics)
+        # เฟรมแบบข้อความได้ rssi จากบรรทัด RSSI,<n> ล่าสุด (ใช้ calibrate ระยะด้วย csi_pathloss.py)
+        frames, last_rssi = attach_rssi(framer.take_ordered(frames), last_rssi)
+        for frame in frames:
+            handle_frame(frame)
+            sample_count += 1
+            if stop is not None and stop(frame):
+                return sample_count
+    return sample_count
+
+def open_session(path, header, metadata):
+    """สร้าง SessionRecorder ตามค่า SESSION_*"""
+    return SessionRecorder(path, header, SESSION_COMPRESSION, SESSION_COMPRESSION_LEVEL,
+                           rotate_sec=SESSION_ROTATE_SEC, rotate_bytes=SESSION_ROTATE_MB << 20,
+                           checkpoint_sec=SESSION_CHECKPOINT_SEC, metadata=metadata)
+
+def data_filename(pos_x, pos_y):
+    """สร้างชื่อไฟล์อัตโนมัติจากพิกัด"""
+    extension = {'capture': CAPTURE_SUFFIX, 'session': SESSION_SUFFIX}.get(OUTPUT_FORMAT, '.csv')
+    return f"csi_data_x{pos_x}_y{pos_y}{extension}"
+
+def record_position(ser, pos_x, pos_y, duration_sec, stop=None):
+    """เก็บข้อมูล 1 ตำแหน่งจาก Serial ที่เปิดอยู่แล้ว คืนค่า (จำนวนเฟรม, framer)"""
+    filename = data_filename(pos_x, pos_y)
+    ser.flushInput()
+    
+    # รับเฉพาะเฟรมที่มีจำนวน subcarrier ครบ เฟรมที่ขาดหรือต่อกันจะถูกทิ้ง
+    framer = CsiFramer(SERIAL_FORMAT, expected_len=NUM_SUBcarriers, text_records=True)
+    if ingest_metrics is not None:
+        ingest_metrics.track(framer)
+    
+    if OUTPUT_FORMAT == 'capture':
+        with CaptureWriter(filename, NUM_SUBcarriers, CAPTURE_AMP_DTYPE) as writer:
+            writer.add_column(RSSI, np.float32)
+            extra_columns = {}
+            if CAPTURE_IQ:
+                writer.add_column(IQ, np.int8, 2 * NUM_SUBcarriers)
+                # เฟรมที่ไม่มี I/Q (เช่นเฟรมข้อความ) เก็บเป็น 0 ทั้งแถว ตอนฝึกจะถูกทิ้ง
+                no_iq = np.zeros(2 * NUM_SUBcarriers, dtype=np.int8)
+            
+            def write_capture_row(frame):
+                if CAPTURE_IQ:
+                    extra_columns[IQ] = frame.iq if frame.iq is not None else no_iq
+                writer.append(frame.amplitudes, pos_x, pos_y, time.time(),
+                              rssi=np.nan if frame.rssi is None else frame.rssi, **extra_columns)
+            
+            sample_count = collect_frames(ser, framer, duration_sec, write_capture_row, stop)
+    elif OUTPUT_FORMAT == 'session':
+        header = ",".join([f"sc_{i}" for i in range(NUM_SUBcarriers)]) + ",pos_x,pos_y"
+        metadata = {'pos_x': pos_x, 'pos_y': pos_y, 'port': SERIAL_PORT}
+        with open_session(filename, header, metadata) as recorder:
+            sample_count = collect_frames(
+                ser, framer, duration_sec,
+                lambda frame: recorder.write(",".join(f"{v:.2f}" for v in frame.amplitudes) + f",{pos_x},{pos_y}"),
+                stop)
+    else:
+        # สร้าง Header สำหรับไฟล์ CSV
+        header = ",".join([f"sc_{i}" for i in range(NUM_SUBcarriers)]) + ",pos_x,pos_y\n"
+        
+        with open(filename, 'w') as f:
+            f.write(header) # เขียน Header ลงไฟล์
+            
+            def write_csv_row(frame):
+                # เพิ่มพิกัด (Label) ต่อท้ายข้อมูล CSI
+                csi_values = ",".join(f"{v:.2f}" for v in frame.amplitudes)
+                f.write(csi_values + f",{pos_x},{pos_y}\n")
+            
+            sample_count = collect_frames(ser, framer, duration_sec, write_csv_row, stop)
+    return sample_count, framer
 
 def collect_data(pos_x, pos_y):
     """ฟังก์ชันสำหรับเก็บข้อมูล ณ พิกัดที่กำหนด"""
     
-    # สร้างชื่อไฟล์อัตโนมัติจากพิกัด
-    filename = f"csi_data_x{pos_x}_y{pos_y}.csv"
+    filename = data_filename(pos_x, pos_y)
     print(f"\nPreparing to collect data for position ({pos_x}, {pos_y})")
     print(f"Data will be saved to: {filename}")
     
@@ -19,56 +124,220 @@ def collect_data(pos_x, pos_y):
     input("Place the device at the correct position and press Enter to start...")
     
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-        ser.flushInput()
+        ser = open_serial(SERIAL_PORT, BAUD_RATE, timeout=1)
         
         print(f"--- Starting data collection for {COLLECTION_DURATION_SEC} seconds ---")
-        
-        sample_count = 0
-        start_time = time.time()
-        
-        # สร้าง Header สำหรับไฟล์ CSV
-        header = ",".join([f"sc_{i}" for i in range(NUM_SUBcarriers)]) + ",pos_x,pos_y\n"
-        
-        with open(filename, 'w') as f:
-            f.write(header) # เขียน Header ลงไฟล์
-            
-            while time.time() - start_time < COLLECTION_DURATION_SEC:
-                line = ser.readline().decode('utf-8').strip()
-                
-                if line.startswith('CSI_DATA,'):
-                    # เพิ่มพิกัด (Label) ต่อท้ายข้อมูล CSI
-                    data_row = line.split(',', 1)[1] + f",{pos_x},{pos_y}\n"
-                    f.write(data_row)
-                    sample_count += 1
+        sample_count, framer = record_position(ser, pos_x, pos_y, COLLECTION_DURATION_SEC)
             
         print(f"--- Collection complete! ---")
         print(f"Saved {sample_count} samples to {filename}")
+        print(f"Stream quality: {framer.stats_line()}")
 
     except serial.SerialException as e:
         print(f"Error: Could not open serial port {SERIAL_PORT}. {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
     finally:
         if 'ser' in locals() and ser.is_open:
             ser.close()
 
-if __name__ == "__main__":
-    while True:
-        print("\n--- New Data Collection Cycle ---")
+def record_position_multi(collector, pos_x, pos_y, duration_sec, stop=None):
+    """
+    เก็บข้อมูล 1 ตำแหน่งจากทุกพอร์ตของ PortCollector ที่เปิดอยู่แล้ว คืนค่า (รายชื่อไฟล์, จำนวนเฟรม)
+    stop(amplitudes, device_ids) = True หยุดก่อนครบ duration_sec
+    """
+    base_name = f"csi_data_x{pos_x}_y{pos_y}"
+    labels = np.array([pos_x, pos_y], dtype=np.float32)
+    # แปลงเวลา monotonic ของ host เป็นเวลาจริงสำหรับคอลัมน์ timestamps
+    wall_clock_offset = time.time() - time.monotonic()
+    # เฟรมที่มาก่อนเริ่ม (เช่นระหว่างย้ายตำแหน่ง) ไม่ใช่ของตำแหน่งนี้
+    collector.discard_pending()
+    
+    if OUTPUT_FORMAT == 'capture':
+        # capture เดียว มีคอลัมน์ device และ host_monotonic บอกว่าเฟรมมาจากตัวรับไหนเมื่อไร
+        filenames = [base_name + CAPTURE_SUFFIX]
+        with CaptureWriter(filenames[0], NUM_SUBcarriers, CAPTURE_AMP_DTYPE) as writer:
+            writer.add_column(DEVICE, np.uint16)
+            writer.add_column('host_monotonic', np.float64)
+            writer.add_column(RSSI, np.float32)
+            
+            def write_block(amplitudes, device_ids, host_times, rssi):
+                writer.append_block(amplitudes, np.tile(labels, (len(amplitudes), 1)),
+                                    host_times + wall_clock_offset,
+                                    device=device_ids, host_monotonic=host_times, rssi=rssi)
+            
+            sample_count = collector.collect(duration_sec, write_block, stop=stop)
+    elif OUTPUT_FORMAT == 'session':
+        # session แยกต่อตัวรับ (เหมือน CSV) เวลาในแต่ละ segment เป็นเวลาที่เฟรมมาถึง host
+        filenames = [f"{base_name}_dev{i}{SESSION_SUFFIX}" for i in range(len(SERIAL_PORTS))]
+        header = ",".join([f"sc_{i}" for i in range(NUM_SUBcarriers)]) + ",pos_x,pos_y"
+        recorders = []
         try:
-            # รับค่าพิกัดจากผู้ใช้
-            px_str = input("Enter X coordinate (or 'q' to quit): ")
-            if px_str.lower() == 'q':
-                break
+            for i, name in enumerate(filenames):
+                recorders.append(open_session(name, header, {'pos_x': pos_x, 'pos_y': pos_y, 'port': SERIAL_PORTS[i]}))
+            
+            def write_block(amplitudes, device_ids, host_times, rssi):
+                for device_id, recorder in enumerate(recorders):
+                    rows = amplitudes[device_ids == device_id]
+                    if len(rows):
+                        data = np.hstack([rows, np.tile(labels, (len(rows), 1))])
+                        recorder.write_rows(data, host_times[device_ids == device_id][-1] + wall_clock_offset)
+            
+            sample_count = collector.collect(duration_sec, write_block, stop=stop)
+        finally:
+            for recorder in recorders:
+                recorder.close()
+    else:
+        # CSV แยกไฟล์ต่อตัวรับ (รูปแบบคอลัมน์เหมือนเดิม ใช้กับ train_model.py ได้ทันที)
+        filenames = [f"{base_name}_dev{i}.csv" for i in range(len(SERIAL_PORTS))]
+        header = ",".join([f"sc_{i}" for i in range(NUM_SUBcarriers)]) + ",pos_x,pos_y"
+        files = [open(name, 'w') for name in filenames]
+        try:
+            def write_block(amplitudes, device_ids, host_times, rssi):
+                for device_id, f in enumerate(files):
+                    rows = amplitudes[device_ids == device_id]
+                    if len(rows):
+                        data = np.hstack([rows, np.tile(labels, (len(rows), 1))])
+                        np.savetxt(f, data, fmt='%.2f', delimiter=',')
+            
+            for f in files:
+                f.write(header + "\n")
+            sample_count = collector.collect(duration_sec, write_block, stop=stop)
+        finally:
+            for f in files:
+                f.close()
+    return filenames, sample_count
+
+def print_reader_stats(readers):
+    for reader in readers:
+        if reader.error is not None:
+            print(f"[{reader.port}] Error: {reader.error}")
+        else:
+            print(f"[{reader.port}] device {reader.device_id}: {reader.framer.stats_line()}")
+
+def collect_data_multi(pos_x, pos_y):
+    """เก็บข้อมูลจากตัวรับทุกตัวใน SERIAL_PORTS พร้อมกัน ณ พิกัดเดียว (ใช้เวลาเท่ากับเก็บตัวเดียว)"""
+    
+    print(f"\nPreparing to collect data for position ({pos_x}, {pos_y}) from {len(SERIAL_PORTS)} ports")
+    input("Place the devices at the correct position and press Enter to start...")
+    print(f"--- Starting data collection for {COLLECTION_DURATION_SEC} seconds ---")
+    
+    with PortCollector(SERIAL_PORTS, NUM_SUBcarriers, BAUD_RATE, SERIAL_FORMAT, ingest_metrics) as collector:
+        try:
+            filenames, _ = record_position_multi(collector, pos_x, pos_y, COLLECTION_DURATION_SEC)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+    
+    print(f"--- Collection complete! ---")
+    print_reader_stats(collector.readers)
+    print(f"Saved to: {', '.join(filenames)}")
+
+def run_survey(plan_path):
+    """
+    เก็บข้อมูลทุกตำแหน่งตามไฟล์แผน (ดู csi_survey.py) โดยไม่ต้องพิมพ์พิกัด
+    เปิด Serial (หรือทุกพอร์ตใน SERIAL_PORTS) ครั้งเดียวตลอดการ survey
+    แต่ละจุดหยุดเมื่อครบ dwell_sec หรือเร็วกว่านั้นเมื่อถึง target_samples / max_stderr ของแผน
+    """
+    try:
+        plan = load_plan(plan_path)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Error: Could not load survey plan '{plan_path}'. {e}")
+        return
+    
+    multi = len(SERIAL_PORTS) > 1
+    early_stop = plan.target_samples is not None or plan.max_stderr is not None
+    print(f"Survey plan '{plan_path}': {len(plan.points)} positions, "
+          f"at most {sum(p.dwell_sec for p in plan.points) / 60:.1f} min of collection")
+    
+    results = []
+    link = None
+    try:
+        link = PortCollector(SERIAL_PORTS, NUM_SUBcarriers, BAUD_RATE, SERIAL_FORMAT, ingest_metrics) if multi else \
+            open_serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+        for i, point in enumerate(plan.points, 1):
+            print(f"\n[{i}/{len(plan.points)}] Next position: ({point.x}, {point.y})")
+            if plan.confirm:
+                input("Place the device at the correct position and press Enter to start...")
+            elif plan.settle_sec > 0:
+                print(f"Move the device now, collection starts in {plan.settle_sec:g} seconds...")
+                time.sleep(plan.settle_sec)
             
-            py_str = input("Enter Y coordinate: ")
+            # 1 monitor ต่อตัวรับ ทุกตัวต้องผ่านเกณฑ์ก่อนหยุด
+            monitors = [ConvergenceMonitor(plan.target_samples, plan.max_stderr, plan.min_samples)
+                        for _ in (SERIAL_PORTS if multi else [SERIAL_PORT])]
+            if multi:
+                def stop(amplitudes, device_ids):
+                    for device_id, monitor in enumerate(monitors):
+                        monitor.update(amplitudes[device_ids == device_id])
+                    return all(monitor.done() for monitor in monitors)
+            else:
+                def stop(frame):
+                    monitors[0].update(frame.amplitudes)
+                    return monitors[0].done() is not None
             
-            pos_x = float(px_str)
-            pos_y = float(py_str)
+            print(f"--- Collecting for up to {point.dwell_sec:g} seconds ---")
+            start_time = time.monotonic()
+            if multi:
+                _, sample_count = record_position_multi(link, point.x, point.y, point.dwell_sec,
+                                                        stop if early_stop else None)
+            else:
+                sample_count, framer = record_position(link, point.x, point.y, point.dwell_sec,
+                                                       stop if early_stop else None)
+            elapsed = time.monotonic() - start_time
+            reasons = [monitor.done() for monitor in monitors]
+            reason = reasons[0] if early_stop and all(reasons) else 'dwell'
+            results.append((point, sample_count, elapsed, reason))
+            print(f"Saved {sample_count} samples in {elapsed:.1f} s (stop: {reason})")
+            if not multi:
+                print(f"Stream quality: {framer.stats_line()}")
+    except serial.SerialException as e:
+        print(f"Error: Serial port failed during survey. {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except KeyboardInterrupt:
+        print("\nSurvey interrupted.")
+    finally:
+        if multi and link is not None:
+            link.close()
+            print_reader_stats(link.readers)
+        elif link is not None and link.is_open:
+            link.close()
+    
+    print(f"\n--- Survey finished: {len(results)}/{len(plan.points)} positions ---")
+    if results:
+        print(format_survey_results(results))
+
+if __name__ == "__main__":
+    metrics, exporter = create_metrics(METRICS_EXPORT)
+    if metrics is not None:
+        ingest_metrics = IngestMetrics(metrics)
+    plan_path = sys.argv[1] if len(sys.argv) > 1 else SURVEY_PLAN
+    if plan_path:
+        run_survey(plan_path)
+    else:
+        while True:
+            print("\n--- New Data Collection Cycle ---")
+            try:
+                # รับค่าพิกัดจากผู้ใช้
+                px_str = input("Enter X coordinate (or 'q' to quit): ")
+                if px_str.lower() == 'q':
+                    break
             
-            collect_data(pos_x, pos_y)
+                py_str = input("Enter Y coordinate: ")
             
-        except ValueError:
-            print("Invalid input. Please enter numbers for coordinates.")
-        except KeyboardInterrupt:
-            print("\nExiting program.")
-            break
\ No newline at end of file
+                pos_x = float(px_str)
+                pos_y = float(py_str)
+            
+                if len(SERIAL_PORTS) > 1:
+                    collect_data_multi(pos_x, pos_y)
+                else:
+                    collect_data(pos_x, pos_y)
+            
+            except ValueError:
+                print("Invalid input. Please enter numbers for coordinates.")
+            except KeyboardInterrupt:
+                print("\nExiting program.")
+                break
+    if exporter is not None:
+        exporter.close()
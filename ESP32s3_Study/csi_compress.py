@@ -0,0 +1,175 @@
+import numpy as np
+
+from csi_index import kmeans, make_index, measure_latency, squared_distances
+
+# --- การบีบอัด fingerprint ก่อนสร้าง index ---
+# 1) ตัด subcarrier ที่แทบไม่เปลี่ยนค่า (เช่น subcarrier ที่ไม่ใช้ หรือส่วนที่เติม 0)
+# 2) ลดมิติด้วย PCA (คำนวณด้วย SVD ของ numpy)
+# 3) ย่อเฟรมของแต่ละตำแหน่งให้เหลือ prototype ไม่เกิน max_prototypes ตัว (k-means ต่อตำแหน่ง)
+# ผลลัพธ์: ขนาดโมเดลและเวลาค้นหาขึ้นกับจำนวนตำแหน่ง ไม่ใช่จำนวนเฟรมดิบ
+
+MIN_FEATURE_STD = 1e-3      # subcarrier ที่ค่าเบี่ยงเบนต่ำกว่านี้ถือว่าคงที่
+PCA_FIT_SAMPLES = 20000     # จำนวนแถวสูงสุดที่ใช้หา PCA
+
+
+class PCAReducer:
+    """ลดมิติของ fingerprint: เลือกเฉพาะ subcarrier ที่มีข้อมูล แล้ว project ด้วย PCA"""
+
+    def __init__(self, n_components=16, seed=0):
+        self.n_components = n_components
+        self.seed = seed
+
+    def fit(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        self.n_features_in_ = X.shape[1]
+        if len(X) > PCA_FIT_SAMPLES:
+            rng = np.random.default_rng(self.seed)
+            X = X[rng.choice(len(X), PCA_FIT_SAMPLES, replace=False)]
+
+        self.keep_ = np.flatnonzero(X.std(axis=0) > MIN_FEATURE_STD)
+        Xk = X[:, self.keep_]
+        self.mean_ = Xk.mean(axis=0)
+        _, singular, vt = np.linalg.svd(Xk - self.mean_, full_matrices=False)
+        n = min(self.n_components, len(vt))
+        self.components_ = np.ascontiguousarray(vt[:n].T, dtype=np.float32)
+        variance = singular ** 2
+        self.explained_variance_ratio_ = variance[:n] / variance.sum() if variance.sum() > 0 else np.zeros(n)
+        return self
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        return (X[:, self.keep_] - self.mean_) @ self.components_
+
+    def nbytes(self):
+        return self.keep_.nbytes + self.mean_.nbytes + self.components_.nbytes
+
+
+def condense_prototypes(X, y, max_prototypes, seed=0):
+    """
+    ย่อข้อมูลของแต่ละตำแหน่ง (label เดียวกัน) ให้เหลือ prototype ไม่เกิน max_prototypes ตัว
+    คืนค่า (prototypes, labels, counts) โดย counts คือจำนวนเฟรมที่แต่ละ prototype แทน
+    """
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float32)
+    positions, inverse = np.unique(y, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    prototypes, labels, counts = [], [], []
+    for p, position in enumerate(positions):
+        members = X[inverse == p]
+        if len(members) <= max_prototypes:
+            centers = members
+            sizes = np.ones(len(members), dtype=np.int64)
+        else:
+            centers = kmeans(members, max_prototypes, seed=seed)
+            assign = np.argmin(squared_distances(members, centers), axis=1)
+            sizes = np.bincount(assign, minlength=len(centers))
+            centers, sizes = centers[sizes > 0], sizes[sizes > 0]
+        prototypes.append(centers)
+        labels.append(np.repeat(position[None, :], len(centers), axis=0))
+        counts.append(sizes)
+    return np.concatenate(prototypes), np.concatenate(labels), np.concatenate(counts)
+
+
+class CompressedFingerprintModel:
+    """
+    PCA + prototype ต่อตำแหน่ง + fingerprint index ในโมเดลเดียว (บันทึกด้วย joblib ไฟล์เดียว)
+    ใช้แทน KNeighborsRegressor ได้ (fit / predict / n_features_in_)
+    ฝึกแบบ streaming ได้ด้วย train(ตัวอย่าง) แล้ว partial_fit ทีละบล็อก
+    (prototype ถูกย่อภายในแต่ละบล็อก ตำแหน่งที่กระจายหลายบล็อกจึงมี prototype ได้มากกว่า max_prototypes)
+    """
+
+    requires_training = True
+
+    def __init__(self, n_components=16, max_prototypes=32, backend='brute', n_neighbors=5,
+                 weights='uniform', index_options=None, seed=0):
+        self.n_components = n_components
+        self.max_prototypes = max_prototypes
+        self.backend = backend
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+        self.index_options = index_options or {}
+        self.seed = seed
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float32)
+        self.n_features_in_ = X.shape[1]
+        if self.n_components:
+            self.reducer_ = PCAReducer(self.n_components, self.seed).fit(X)
+            Z = self.reducer_.transform(X)
+        else:
+            self.reducer_ = None
+            Z = X
+        if self.max_prototypes:
+            Z, y, self.prototype_counts_ = condense_prototypes(Z, y, self.max_prototypes, self.seed)
+        self.index_ = make_index(self.backend, self.n_neighbors, self.weights, **self.index_options)
+        self.index_.fit(Z, y)
+        return self
+
+    def train(self, X):
+        """หา PCA (และ centroid ของ index ถ้าเป็น 'ivf') จากตัวอย่าง โดยยังไม่เพิ่ม fingerprint"""
+        X = np.asarray(X, dtype=np.float32)
+        self.n_features_in_ = X.shape[1]
+        self.reducer_ = PCAReducer(self.n_components, self.seed).fit(X) if self.n_components else None
+        self.prototype_counts_ = np.empty(0, dtype=np.int64)
+        self.index_ = make_index(self.backend, self.n_neighbors, self.weights, **self.index_options)
+        self.index_.train(self.transform(X))
+        return self
+
+    def partial_fit(self, X, y):
+        """เพิ่ม fingerprint 1 บล็อก (ถ้ายังไม่ได้ train จะ train จากบล็อกนี้)"""
+        if not hasattr(self, 'index_'):
+            self.train(X)
+        Z = self.transform(X)
+        if self.max_prototypes:
+            Z, y, counts = condense_prototypes(Z, y, self.max_prototypes, self.seed)
+            self.prototype_counts_ = np.concatenate([self.prototype_counts_, counts])
+        self.index_.partial_fit(Z, y)
+        return self
+
+    def transform(self, X):
+        return self.reducer_.transform(X) if self.reducer_ is not None else np.asarray(X, dtype=np.float32)
+
+    def predict(self, X):
+        return self.index_.predict(self.transform(X))
+
+    def nbytes(self):
+        total = self.index_.nbytes()
+        if self.reducer_ is not None:
+            total += self.reducer_.nbytes()
+        return total
+
+
+def evaluate_operating_points(X_train, y_train, X_test, y_test, components_list, prototypes_list,
+                              backend='brute', n_neighbors=5):
+    """
+    ลองทุกคู่ (n_components, max_prototypes) แล้วคืนรายการผลลัพธ์
+    [{n_components, max_prototypes, size_kb, mean_error, p90_error, latency_ms}, ...]
+    ใช้ 0 หรือ None เพื่อปิดขั้นตอนนั้น (เช่น n_components=0 = ไม่ทำ PCA)
+    """
+    X_test = np.asarray(X_test, dtype=np.float32)
+    y_test = np.asarray(y_test, dtype=np.float32)
+    results = []
+    for n_components in components_list:
+        for max_prototypes in prototypes_list:
+            model = CompressedFingerprintModel(n_components, max_prototypes, backend, n_neighbors)
+            model.fit(X_train, y_train)
+            errors = np.linalg.norm(model.predict(X_test) - y_test, axis=1)
+            results.append({
+                'n_components': n_components,
+                'max_prototypes': max_prototypes,
+                'size_kb': model.nbytes() / 1024,
+                'mean_error': float(errors.mean()),
+                'p90_error': float(np.percentile(errors, 90)),
+                'latency_ms': measure_latency(model, X_test),
+            })
+    return results
+
+
+def format_operating_points(results):
+    """จัดผลลัพธ์จาก evaluate_operating_points เป็นตาราง"""
+    lines = [f"{'PCA':>5} {'proto/pos':>9} {'size(KB)':>9} {'mean err':>9} {'p90 err':>8} {'ms/frame':>9}"]
+    for r in results:
+        lines.append(f"{r['n_components'] or '-':>5} {r['max_prototypes'] or '-':>9} {r['size_kb']:>9.1f} "
+                     f"{r['mean_error']:>9.3f} {r['p90_error']:>8.3f} {r['latency_ms']:>9.4f}")
+    return "\n".join(lines)
@@ -0,0 +1,276 @@
+import numpy as np
+
+# --- ตัวกรองแบบ streaming สำหรับ smoothing ข้อมูลทีละเฟรม ---
+# ทุกตัวกรองมี update(values, t=None) -> ค่าที่กรองแล้ว และ reset()
+# state อยู่ใน array ที่จองไว้ตั้งแต่สร้าง ไม่แปลง deque เป็น array ใหม่ทุกเฟรม
+#   'none'           = ไม่กรอง
+#   'moving-average' = ค่าเฉลี่ยเคลื่อนที่ด้วย running sum: O(n) ต่อเฟรม ไม่ขึ้นกับขนาด window
+#   'ema'            = exponential smoothing: O(n) ต่อเฟรม
+#   'median'         = median ของ window ล่าสุด (ทนต่อค่ากระโดด) O(window x n) แต่ window เล็ก
+#   'hampel'         = แทนค่าที่ห่างจาก median เกิน threshold x MAD ด้วย median (ค่าปกติผ่านไปตรงๆ)
+#   'kalman'         = Kalman filter 2 มิติ (ตำแหน่ง + ความเร็วคงที่) สำหรับพิกัด x, y เท่านั้น
+#   'kalman-range'   = 'kalman' ที่รับระยะ (FTM) หรือ RSSI จาก anchor เพิ่มได้ด้วย update_ranges() / update_rssi()
+# ค่าที่คืนเป็น array ภายในของตัวกรอง (ถูกเขียนทับในเฟรมถัดไป) ให้คัดลอกถ้าต้องเก็บไว้
+
+FILTER_NAMES = ('none', 'moving-average', 'ema', 'median', 'hampel', 'kalman', 'kalman-range')
+RESUM_INTERVAL = 10000      # คำนวณ running sum ใหม่ทั้งหมดทุกกี่เฟรม (กันความคลาดเคลื่อนสะสมของ float)
+MAD_TO_STD = 1.4826         # แปลง MAD เป็นค่าเบี่ยงเบนมาตรฐาน (สำหรับข้อมูลแบบ normal)
+KALMAN_MIN_DT = 1e-3        # เฟรมที่มาถึงพร้อมกัน (เวลาเท่ากัน) ใช้ dt นี้แทน 0
+RANGE_MIN_DISTANCE = 0.05   # กันการหารด้วย 0 เมื่อตำแหน่งที่ทำนายอยู่ตรง anchor
+RSSI_MIN_DISTANCE = 0.5     # ใกล้กว่านี้ log-distance model ใช้ไม่ได้และ linearize แล้วไม่เสถียร
+ANCHOR_GATE_SIGMA = 3.0     # การวัดจาก anchor ที่ต่างจากที่ทำนายเกินกี่ sigma ถือเป็น outlier (ไม่ใช้)
+
+
+class PassThrough:
+    """ไม่กรอง (คืนค่าเดิม)"""
+
+    def __init__(self, n_values):
+        self.out = np.zeros(n_values)
+
+    def update(self, values, t=None):
+        self.out[:] = values
+        return self.out
+
+    def reset(self):
+        self.out[:] = 0
+
+
+class MovingAverage:
+    """ค่าเฉลี่ยของ window เฟรมล่าสุดด้วย running sum (ลบค่าที่ออกจาก window บวกค่าที่เข้ามา)"""
+
+    def __init__(self, n_values, window=5):
+        self.window = window
+        self.buf = np.zeros((window, n_values))
+        self.sum = np.zeros(n_values)
+        self.out = np.zeros(n_values)
+        self.reset()
+
+    def reset(self):
+        self.buf[:] = 0
+        self.sum[:] = 0
+        self.count = 0
+
+    def update(self, values, t=None):
+        slot = self.buf[self.count % self.window]
+        self.sum -= slot
+        slot[:] = values
+        self.sum += slot
+        self.count += 1
+        if self.count % RESUM_INTERVAL == 0:
+            self.buf.sum(axis=0, out=self.sum)
+        np.divide(self.sum, min(self.count, self.window), out=self.out)
+        return self.out
+
+
+class ExponentialSmoothing:
+    """out = alpha * ค่าใหม่ + (1 - alpha) * out เดิม (alpha มาก = ตอบสนองเร็ว)"""
+
+    def __init__(self, n_values, alpha=0.3):
+        self.alpha = alpha
+        self.out = np.zeros(n_values)
+        self.reset()
+
+    def reset(self):
+        self.out[:] = 0
+        self.started = False
+
+    def update(self, values, t=None):
+        if not self.started:
+            self.out[:] = values
+            self.started = True
+        else:
+            self.out *= 1.0 - self.alpha
+            self.out += self.alpha * np.asarray(values)
+        return self.out
+
+
+class MedianFilter:
+    """median ของ window เฟรมล่าสุด แยกแต่ละค่า (ตัดค่ากระโดดชั่วขณะ)"""
+
+    def __init__(self, n_values, window=5):
+        self.window = window
+        self.buf = np.zeros((window, n_values))
+        self.out = np.zeros(n_values)
+        self.reset()
+
+    def reset(self):
+        self.buf[:] = 0
+        self.count = 0
+
+    def _push(self, values):
+        self.buf[self.count % self.window] = values
+        self.count += 1
+        return self.buf[:min(self.count, self.window)]
+
+    def update(self, values, t=None):
+        np.median(self._push(values), axis=0, out=self.out)
+        return self.out
+
+
+class HampelFilter(MedianFilter):
+    """
+    Hampel filter: ค่าใหม่ที่ห่างจาก median ของ window เกิน threshold x (1.4826 x MAD)
+    ถือเป็น outlier และถูกแทนด้วย median ค่าอื่นผ่านไปตามเดิม
+    """
+
+    def __init__(self, n_values, window=5, threshold=3.0):
+        super().__init__(n_values, window)
+        self.threshold = threshold
+        self.median = np.zeros(n_values)
+        self.deviation = np.zeros(n_values)
+        self.outliers = 0   # จำนวนค่าที่ถูกแทนทั้งหมด
+
+    def update(self, values, t=None):
+        window = self._push(values)
+        np.median(window, axis=0, out=self.median)
+        np.median(np.abs(window - self.median), axis=0, out=self.deviation)
+        self.out[:] = values
+        outlier = np.abs(self.out - self.median) > self.threshold * MAD_TO_STD * self.deviation
+        outlier &= self.deviation > 0
+        self.out[outlier] = self.median[outlier]
+        self.outliers += int(outlier.sum())
+        return self.out
+
+
+class Kalman2D:
+    """
+    Kalman filter สำหรับพิกัด (x, y) แบบความเร็วคงที่: state = [x, y, vx, vy]
+    process_noise = ความแปรปรวนของความเร่ง (m^2/s^4) มาก = ตามการเคลื่อนที่เร็วขึ้น
+    measurement_noise = ความแปรปรวนของพิกัดที่ทำนายได้ (m^2) มาก = เชื่อผลทำนายน้อยลง (นิ่งขึ้น)
+    t = เวลาของเฟรม (วินาที) ถ้าไม่ระบุจะใช้ default_dt ต่อเฟรม
+    """
+
+    def __init__(self, n_values=2, process_noise=0.5, measurement_noise=0.25, default_dt=0.1):
+        if n_values != 2:
+            raise ValueError(f"kalman filter works on (x, y) positions only, got {n_values} values")
+        self.process_noise = process_noise
+        self.default_dt = default_dt
+        self.F = np.eye(4)
+        self.Q = np.zeros((4, 4))
+        self.H = np.eye(2, 4)
+        self.R = np.eye(2) * measurement_noise
+        self.state = np.zeros(4)
+        self.P = np.eye(4)
+        self.out = self.state[:2]
+        self.reset()
+
+    def reset(self):
+        self.state[:] = 0
+        self.P[:] = np.eye(4)
+        self.last_t = None
+        self.started = False
+
+    def _set_dt(self, dt):
+        q = self.process_noise
+        self.F[0, 2] = self.F[1, 3] = dt
+        self.Q[0, 0] = self.Q[1, 1] = q * dt ** 3 / 3
+        self.Q[0, 2] = self.Q[2, 0] = self.Q[1, 3] = self.Q[3, 1] = q * dt ** 2 / 2
+        self.Q[2, 2] = self.Q[3, 3] = q * dt
+
+    def update(self, values, t=None):
+        z = np.asarray(values, dtype=float)
+        if not self.started:
+            # เฟรมแรก: เริ่มที่ตำแหน่งที่วัดได้ ความเร็ว 0 (ความไม่แน่นอนของความเร็วสูง)
+            self.state[:2] = z
+            self.state[2:] = 0
+            self.P[:] = np.diag([self.R[0, 0], self.R[1, 1], 1.0, 1.0])
+            self.started = True
+            self.last_t = t
+            return self.out
+
+        self._predict(t)
+        self._correct(z - self.H @ self.state, self.H, self.R)
+        return self.out
+
+    def _predict(self, t):
+        dt = self.default_dt if t is None or self.last_t is None else max(t - self.last_t, KALMAN_MIN_DT)
+        self.last_t = t
+        self._set_dt(dt)
+        self.state[:] = self.F @ self.state
+        self.P[:] = self.F @ self.P @ self.F.T + self.Q
+
+    def _correct(self, innovation, H, R):
+        S = H @ self.P @ H.T + R
+        K = np.linalg.solve(S, H @ self.P).T
+        self.state += K @ innovation
+        # Joseph form: P คงความสมมาตรและเป็นบวกแม้การวัดแม่นมาก (เช่นจาก anchor ใกล้ๆ)
+        I_KH = np.eye(len(self.state)) - K @ H
+        self.P[:] = I_KH @ self.P @ I_KH.T + K @ R @ K.T
+
+
+class RangeKalman2D(Kalman2D):
+    """
+    Kalman2D ที่รวมการวัดเทียบกับ anchor ที่รู้ตำแหน่งเข้ากับพิกัดจาก CSI
+    update()        = พิกัดจาก fingerprint (เหมือน Kalman2D)
+    update_ranges() = ระยะจาก anchor หลายตัวพร้อมกัน (เช่น FTM)
+    update_rssi()   = RSSI จาก anchor ผ่าน log-distance model (วัดเป็น dB โดยตรง ไม่แปลงเป็นระยะก่อน
+                      เพราะความคลาดเคลื่อนของ RSSI เป็น Gaussian ใน dB แต่ไม่ใช่ในหน่วยเมตร)
+    การวัดเป็นฟังก์ชันไม่เชิงเส้นของตำแหน่ง จึง linearize รอบตำแหน่งที่ทำนาย (Extended Kalman filter)
+    ก่อนมีพิกัดจาก CSI ครั้งแรกจะยังไม่ปรับ (การวัดเทียบ anchor อย่างเดียวอาจไม่พอกำหนดตำแหน่งเริ่มต้น)
+    """
+
+    def __init__(self, n_values=2, process_noise=0.5, measurement_noise=0.25, default_dt=0.1):
+        super().__init__(n_values, process_noise, measurement_noise, default_dt)
+        self.rejected = 0   # จำนวนการวัดจาก anchor ที่ถูกตัดทิ้งเพราะเกิน gate
+
+    def _anchor_offsets(self, anchors, t, min_distance=RANGE_MIN_DISTANCE):
+        """predict ไปที่เวลา t แล้วคืน (ตำแหน่งที่ทำนาย - anchor, ระยะที่ทำนาย)"""
+        anchors = np.asarray(anchors, dtype=float).reshape(-1, 2)
+        self._predict(t)
+        offset = self.state[:2] - anchors
+        return offset, np.maximum(np.linalg.norm(offset, axis=1), min_distance)
+
+    def _correct_gated(self, innovation, H, variances):
+        """ปรับด้วยการวัดที่ innovation อยู่ในช่วง ANCHOR_GATE_SIGMA เท่านั้น"""
+        spread = np.einsum('ij,jk,ik->i', H, self.P, H) + variances
+        keep = innovation ** 2 <= ANCHOR_GATE_SIGMA ** 2 * spread
+        self.rejected += int(len(keep) - keep.sum())
+        if keep.any():
+            self._correct(innovation[keep], H[keep], np.diag(variances[keep]))
+
+    def update_ranges(self, anchors, ranges, variances, t=None):
+        """anchors: (N, 2) ตำแหน่ง anchor, ranges: (N,) ระยะที่วัดได้ (เมตร), variances: (N,) m^2"""
+        if not self.started:
+            return self.out
+        offset, predicted = self._anchor_offsets(anchors, t)
+        H = np.zeros((len(offset), 4))
+        H[:, :2] = offset / predicted[:, None]
+        variances = np.broadcast_to(np.asarray(variances, dtype=float), predicted.shape)
+        self._correct_gated(np.asarray(ranges, dtype=float) - predicted, H, variances)
+        return self.out
+
+    def update_rssi(self, anchors, rssi, rssi_at_1m, path_loss_n, sigma_db, t=None):
+        """
+        rssi: (N,) dBm จาก anchor แต่ละตัว, rssi_at_1m / path_loss_n / sigma_db: ค่าของแต่ละ anchor
+        (scalar หรือ (N,)) ตาม RSSI = rssi_at_1m - 10 n log10(ระยะ)
+        """
+        if not self.started:
+            return self.out
+        offset, predicted = self._anchor_offsets(anchors, t, RSSI_MIN_DISTANCE)
+        path_loss_n = np.broadcast_to(np.asarray(path_loss_n, dtype=float), predicted.shape)
+        expected = rssi_at_1m - 10.0 * path_loss_n * np.log10(predicted)
+        H = np.zeros((len(offset), 4))
+        H[:, :2] = -(10.0 * path_loss_n / np.log(10.0))[:, None] * offset / (predicted ** 2)[:, None]
+        variances = np.broadcast_to(np.asarray(sigma_db, dtype=float) ** 2, predicted.shape)
+        self._correct_gated(np.asarray(rssi, dtype=float) - expected, H, variances)
+        return self.out
+
+
+def make_filter(name, n_values, window=5, alpha=0.3, threshold=3.0,
+                process_noise=0.5, measurement_noise=0.25):
+    """สร้างตัวกรองตามชื่อ (ดู FILTER_NAMES) สำหรับข้อมูล n_values ค่าต่อเฟรม"""
+    if name == 'none':
+        return PassThrough(n_values)
+    if name == 'moving-average':
+        return MovingAverage(n_values, window)
+    if name == 'ema':
+        return ExponentialSmoothing(n_values, alpha)
+    if name == 'median':
+        return MedianFilter(n_values, window)
+    if name == 'hampel':
+        return HampelFilter(n_values, window, threshold)
+    if name == 'kalman':
+        return Kalman2D(n_values, process_noise, measurement_noise)
+    if name == 'kalman-range':
+        return RangeKalman2D(n_values, process_noise, measurement_noise)
+    raise ValueError(f"unknown filter '{name}' (expected one of {FILTER_NAMES})")
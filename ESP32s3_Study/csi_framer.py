@@ -0,0 +1,223 @@
+import time
+
+from csi_protocol import (
+    BINARY_SYNC, TEXT_PREFIX, CsiFrame, CsiFrameError,
+    RECORD_RSSI, decode_binary_frame, parse_text_payload, parse_text_record,
+)
+
+# --- ค่าตั้งต้นของ Framer ---
+MAX_TEXT_FRAME_LEN = 4096   # บรรทัด CSI_DATA ที่ยาวกว่านี้ถือว่าเสีย
+READ_CHUNK_SIZE = 4096      # จำนวนไบต์สูงสุดที่อ่านจาก Serial ต่อครั้ง
+
+
+class CsiFramer:
+    """
+    ตัวแยกเฟรม CSI แบบ incremental สำหรับสตรีมจาก Serial
+    - แยกบรรทัดที่ CSI_DATA หลายเฟรมต่อกัน (merged) และเฟรมที่ขาดหาย
+    - รองรับทั้งแบบข้อความ ('text'), ไบนารี ('binary') หรือปนกัน ('auto')
+    - สแกน buffer รอบเดียวต่อการ feed แล้วค่อยตัดส่วนที่ใช้แล้วทิ้งครั้งเดียว
+    - text_records=True: เก็บบรรทัดอื่น (RSSI, Distance, log) เป็น TextRecord ไว้ให้ take_records()
+      หรือ take_ordered() (รวมกับเฟรมตามลำดับที่มาในสตรีม)
+    """
+
+    def __init__(self, serial_format='auto', expected_len=None, min_len=1, text_records=False):
+        self.use_text = serial_format in ('text', 'auto')
+        self.use_binary = serial_format in ('binary', 'auto')
+        self.expected_len = expected_len
+        self.min_len = min_len
+        self.text_records = text_records
+        self._buf = bytearray()
+        self._records = []
+        self._record_frames = []    # จำนวนเฟรมที่รับไปแล้วตอนพบแต่ละ record (บอกตำแหน่งเทียบกับเฟรม)
+
+        # สถิติสำหรับตรวจสอบคุณภาพสตรีม
+        self.frames = 0          # เฟรมที่สมบูรณ์
+        self.dropped = 0         # เฟรมที่ถูกทิ้ง (ขาด, ต่อกัน, CRC ผิด, จำนวนค่าไม่ตรง)
+        self.resyncs = 0         # ครั้งที่ต้องหา marker ใหม่กลางเฟรมที่เสีย
+        self.skipped_bytes = 0   # ไบต์ที่ไม่ใช่เฟรม CSI (log, RSSI, ขยะ)
+        self.malformed = 0       # เฟรมที่มาครบแต่ใช้ไม่ได้ (CRC ผิด, ค่าแปลงไม่ได้, จำนวน subcarrier ไม่ตรง)
+        self.bytes_in = 0
+
+    def feed(self, data):
+        """เพิ่มข้อมูลใหม่เข้า buffer แล้วคืนรายการ CsiFrame ที่แยกได้"""
+        buf = self._buf
+        buf += data
+        self.bytes_in += len(data)
+        frames = []
+        pos = 0
+        n = len(buf)
+
+        while pos < n:
+            start, is_binary = self._next_marker(pos)
+            if start < 0:
+                # ไม่มี marker เหลือ เก็บไว้เฉพาะท้าย buffer ที่อาจเป็น marker ครึ่งๆ
+                if self.text_records:
+                    pos = self._collect_records(pos, n)
+                keep = max(pos, n - len(TEXT_PREFIX) + 1)
+                if self.text_records and n - pos <= MAX_TEXT_FRAME_LEN:
+                    # เก็บบรรทัดสุดท้ายที่ยังไม่จบไว้ทั้งบรรทัด (ถ้าไม่ยาวผิดปกติ)
+                    keep = pos
+                self.skipped_bytes += keep - pos
+                pos = keep
+                break
+            if self.text_records:
+                pos = self._collect_records(pos, start)
+            self.skipped_bytes += start - pos
+
+            if is_binary:
+                try:
+                    frame, end = decode_binary_frame(buf, start)
+                except CsiFrameError:
+                    self.dropped += 1
+                    self.malformed += 1
+                    self.resyncs += 1
+                    pos = start + 1
+                    continue
+                if frame is None:
+                    pos = start
+                    break
+                pos = end
+                self._accept(frame, frames)
+                continue
+
+            payload_start = start + len(TEXT_PREFIX)
+            newline = buf.find(b'\n', payload_start)
+            next_start, _ = self._next_marker(payload_start)
+
+            if next_start >= 0 and (newline < 0 or next_start < newline):
+                # เฟรมถูกตัดกลางทางแล้วมีเฟรมใหม่ต่อท้าย (บรรทัดที่รวมกัน)
+                self.dropped += 1
+                self.resyncs += 1
+                pos = next_start
+                continue
+            if newline < 0:
+                if n - start > MAX_TEXT_FRAME_LEN:
+                    self.dropped += 1
+                    self.resyncs += 1
+                    pos = payload_start
+                    continue
+                pos = start
+                break
+
+            pos = newline + 1
+            try:
+                amplitudes = parse_text_payload(bytes(buf[payload_start:newline]))
+            except ValueError:
+                self.dropped += 1
+                self.malformed += 1
+                continue
+            self._accept(CsiFrame(None, None, None, amplitudes), frames)
+
+        del buf[:pos]
+        return frames
+
+    def feed_frames(self, frames):
+        """รับเฟรมที่ถอดรหัสแล้ว (เช่นจาก shared memory) ผ่านการตรวจจำนวน subcarrier เดียวกับ feed"""
+        accepted = []
+        for frame in frames:
+            self._accept(frame, accepted)
+        return accepted
+
+    def _next_marker(self, pos):
+        """หา marker ถัดไป (ข้อความหรือไบนารี) คืนค่า (index, is_binary)"""
+        text_at = self._buf.find(TEXT_PREFIX, pos) if self.use_text else -1
+        binary_at = self._buf.find(BINARY_SYNC, pos) if self.use_binary else -1
+        if binary_at >= 0 and (text_at < 0 or binary_at < text_at):
+            return binary_at, True
+        return text_at, False
+
+    def _collect_records(self, pos, end):
+        """แปลงบรรทัดที่จบแล้วใน buffer[pos:end] เป็น TextRecord คืนตำแหน่งหลังบรรทัดสุดท้าย"""
+        buf = self._buf
+        while True:
+            newline = buf.find(b'\n', pos, end)
+            if newline < 0:
+                return pos
+            line = bytes(buf[pos:newline]).strip()
+            if line:
+                try:
+                    self._records.append(parse_text_record(line.decode('ascii')))
+                    self._record_frames.append(self.frames)
+                except UnicodeDecodeError:
+                    # ไบต์ขยะ (เช่นเศษของเฟรมไบนารีที่เสีย) ไม่ใช่บรรทัดข้อความ
+                    self.skipped_bytes += newline + 1 - pos
+            pos = newline + 1
+
+    def take_records(self):
+        """คืนรายการ TextRecord ที่แยกได้ตั้งแต่ครั้งก่อน (ใช้เมื่อ text_records=True)"""
+        records, self._records = self._records, []
+        self._record_frames = []
+        return records
+
+    def take_ordered(self, frames):
+        """
+        รวม frames (ผลของ feed / read_frames ครั้งล่าสุด) กับ TextRecord ที่ค้างอยู่ตามลำดับที่มาในสตรีม
+        คืน list ของ CsiFrame และ TextRecord ปนกัน (ใช้แทน take_records() เมื่อลำดับมีผล เช่น RSSI ก่อนเฟรม)
+        """
+        records, positions = self._records, self._record_frames
+        self._records, self._record_frames = [], []
+        first = self.frames - len(frames)   # ลำดับ (นับรวมทั้งสตรีม) ของเฟรมแรกใน frames
+        ordered = []
+        r = 0
+        for k, frame in enumerate(frames):
+            while r < len(records) and positions[r] <= first + k:
+                ordered.append(records[r])
+                r += 1
+            ordered.append(frame)
+        ordered.extend(records[r:])
+        return ordered
+
+    def _accept(self, frame, frames):
+        """ตรวจจำนวน subcarrier ก่อนรับเฟรม"""
+        count = len(frame.amplitudes)
+        if count < self.min_len or (self.expected_len is not None and count != self.expected_len):
+            self.dropped += 1
+            self.malformed += 1
+            return
+        self.frames += 1
+        frames.append(frame)
+
+    def stats_line(self):
+        """สรุปสถิติเป็นข้อความ 1 บรรทัด"""
+        return (f"frames={self.frames} dropped={self.dropped} "
+                f"resyncs={self.resyncs} skipped_bytes={self.skipped_bytes}")
+
+
+def read_frames(ser, framer, metrics=None):
+    """
+    อ่านข้อมูลที่ค้างอยู่ใน Serial ทั้งหมดในครั้งเดียวแล้วส่งเข้า framer
+    metrics = csi_metrics.IngestMetrics (บันทึกเวลา parse และข้อมูลที่ค้างอยู่ ครั้งละ 1 การอ่าน)
+    """
+    if hasattr(ser, 'read_frames'):
+        # แหล่งที่ให้เฟรมที่ถอดรหัสแล้ว (csi_shm.SharedFrameReader) ไม่ต้องแยกไบต์ซ้ำ
+        if metrics is None:
+            return ser.read_frames(framer)
+        start = time.perf_counter()
+        frames = ser.read_frames(framer)
+        if frames:
+            metrics.observe_read(None, time.perf_counter() - start)
+        return frames
+    backlog = ser.in_waiting
+    data = ser.read(min(max(backlog, 1), READ_CHUNK_SIZE))
+    if not data:
+        return []
+    if metrics is None:
+        return framer.feed(data)
+    start = time.perf_counter()
+    frames = framer.feed(data)
+    metrics.observe_read(backlog, time.perf_counter() - start)
+    return frames
+
+
+def attach_rssi(ordered, last_rssi=None):
+    """
+    เติม rssi ให้เฟรมแบบข้อความ (ที่ไม่มี rssi ในตัว) จากบรรทัด RSSI,<n> ล่าสุดก่อนหน้าเฟรมนั้นในสตรีม
+    ordered = ผลของ framer.take_ordered(frames) คืนค่า (เฉพาะเฟรม, last_rssi ที่อัปเดตแล้ว)
+    """
+    frames = []
+    for item in ordered:
+        if isinstance(item, CsiFrame):
+            frames.append(item if item.rssi is not None or last_rssi is None else item._replace(rssi=last_rssi))
+        elif item.kind == RECORD_RSSI:
+            last_rssi = item.value
+    return frames, last_rssi
@@ -0,0 +1,431 @@
+import os
+import select
+import socket
+import threading
+import time
+from collections import Counter, namedtuple
+from urllib.parse import parse_qs, urlsplit
+
+import serial
+
+from csi_framer import CsiFramer, read_frames
+from csi_metrics import IngestMetrics, create_metrics
+from csi_protocol import (
+    RECORD_CSI, RECORD_HOST_TIME, RECORD_KINDS, RECORD_RSSI, CsiFrame, TextRecord,
+    encode_binary_frame, encode_text_frame, encode_text_record,
+)
+from csi_shm import SHM_NAME, SHM_URL_PREFIX, SharedFrameReader, SharedFrameWriter
+
+# --- Hub: เปิด Serial Port ครั้งเดียว แล้วกระจายข้อมูลให้หลายโปรแกรมพร้อมกัน ---
+# แยกทุกบรรทัดที่เฟิร์มแวร์ส่ง (CSI_DATA, RSSI, DISTANCE_RSSI, Distance:, ---, log) เป็น record
+# แล้วส่งต่อให้ subscriber ทุกตัวผ่าน TCP localhost (ใช้ได้ทั้ง Windows/Linux/macOS)
+#
+# ใช้งาน:  python csi_hub.py [port หรือไฟล์ที่บันทึกไว้] [text|binary|auto]
+# แล้วตั้ง SERIAL_PORT ของสคริปต์อื่น (csi_visualizer, csi_predictor, csi_collector, plot.py ...)
+# เป็น 'hub://127.0.0.1:5760' สคริปต์เหล่านั้นจะได้สตรีมแบบเดียวกับที่อ่านจาก Serial ตรงๆ
+#
+# ข้อตกลงของ subscriber: หลังเชื่อมต่อส่ง 1 บรรทัด "SUB <text|binary> <kind,kind,...>\n"
+# (ไม่ส่งภายใน HANDSHAKE_TIMEOUT_SEC = text ทุกชนิด) จากนั้น hub ส่ง
+#   csi   -> บรรทัด CSI_DATA,... (text) หรือเฟรมไบนารี (binary, มี seq/timestamp/rssi)
+#   อื่นๆ -> บรรทัดข้อความมาตรฐาน (RSSI,<n> / DISTANCE_RSSI,<m> / Distance:<m> / --- / log)
+#   ถ้าขอ kind host_time ด้วย: บรรทัด HOST_TIME,<time.time()> นำหน้าข้อมูลของการอ่าน Serial แต่ละครั้ง
+#   (เวลาที่ hub ได้รับข้อมูล ต่างจาก timestamp_us ในเฟรมไบนารีที่เป็นเวลาของบอร์ด)
+# subscriber ที่อ่านไม่ทันจะถูกทิ้งข้อมูลส่วนเกิน (ไม่ทำให้ hub หรือ subscriber อื่นช้าลง)
+# เฟรม CSI ยังถูกเขียนลง shared memory (csi_shm.py) ด้วย: โปรแกรมบนเครื่องเดียวกันที่ใช้แค่ CSI
+# ตั้ง SERIAL_PORT = 'shm://csi_frames' เพื่ออ่านโดยไม่ผ่าน socket และไม่ต้องแยกไบต์ซ้ำ
+
+SERIAL_PORT = 'COM10'  # <--- แก้ไข Port ของคุณตรงนี้
+BAUD_RATE = 115200
+SERIAL_FORMAT = 'auto'
+HUB_HOST = '127.0.0.1'
+HUB_PORT = 5760
+HUB_URL_PREFIX = 'hub://'
+SHARED_MEMORY_NAME = SHM_NAME       # None = ไม่เขียนลง shared memory
+SERIAL_TIMEOUT_SEC = 0.05           # timeout ของการอ่าน Serial (= เวลาสูงสุดที่ข้อมูลค้างใน hub)
+HANDSHAKE_TIMEOUT_SEC = 0.5
+MAX_CLIENT_BACKLOG_BYTES = 4 << 20  # ข้อมูลที่ค้างส่งต่อ subscriber เกินนี้จะถูกทิ้ง
+STATS_INTERVAL_SEC = 10
+RECV_CHUNK_SIZE = 65536
+# Metrics (csi_metrics.py): None = ปิด, 'log', 'http' (http://127.0.0.1:9108/metrics) หรือ 'log+http'
+METRICS_EXPORT = None
+
+# record ที่มีเวลาของ host กำกับ (วินาที, time.time() ตอนที่ hub อ่านจาก Serial)
+HubRecord = namedtuple('HubRecord', ['kind', 'host_time', 'value'])
+
+
+def parse_subscription(line):
+    """แปลงบรรทัด SUB <format> <kinds> คืนค่า (serial_format, kinds)"""
+    parts = line.split()
+    if not parts or parts[0] != 'SUB':
+        raise ValueError(f"bad subscription line: {line!r}")
+    serial_format = parts[1] if len(parts) > 1 else 'text'
+    if serial_format not in ('text', 'binary'):
+        raise ValueError(f"unknown format '{serial_format}' (expected 'text' or 'binary')")
+    kinds = set(parts[2].split(',')) if len(parts) > 2 else set(RECORD_KINDS)
+    unknown = kinds - set(RECORD_KINDS) - {RECORD_HOST_TIME}
+    if unknown:
+        raise ValueError(f"unknown record kinds {sorted(unknown)} "
+                         f"(expected some of {RECORD_KINDS + (RECORD_HOST_TIME,)})")
+    return serial_format, kinds
+
+
+def encode_record(record, serial_format):
+    """เข้ารหัส HubRecord สำหรับส่งให้ subscriber ตามรูปแบบที่ขอ"""
+    if record.kind == RECORD_CSI:
+        frame = record.value
+        if serial_format == 'binary':
+            rssi = frame.rssi if frame.rssi is not None else 0
+            return encode_binary_frame(frame.seq, frame.timestamp_us, rssi, frame.amplitudes, frame.iq)
+        return encode_text_frame(frame.amplitudes)
+    return encode_text_record(record)
+
+
+class Subscriber:
+    """ปลายทาง 1 ตัวของ hub มี outbox ของตัวเอง ส่งแบบ non-blocking"""
+
+    def __init__(self, sock, address, serial_format, kinds):
+        sock.setblocking(False)
+        self.sock = sock
+        self.address = address
+        self.serial_format = serial_format
+        self.kinds = kinds
+        self.outbox = bytearray()
+        self.dropped = 0        # จำนวน record ที่ถูกทิ้งเพราะ subscriber อ่านไม่ทัน
+
+    def send(self, data, n_records):
+        if len(self.outbox) + len(data) > MAX_CLIENT_BACKLOG_BYTES:
+            self.dropped += n_records
+        else:
+            self.outbox += data
+        self.flush()
+
+    def flush(self):
+        """ส่งเท่าที่ socket รับได้ตอนนี้ (โยน OSError ถ้าการเชื่อมต่อหลุด)"""
+        if not self.outbox:
+            return
+        try:
+            sent = self.sock.send(self.outbox)
+        except BlockingIOError:
+            return
+        del self.outbox[:sent]
+
+    def close(self):
+        self.sock.close()
+
+
+class CsiHub:
+    """อ่าน Serial Port เดียว แยก record ทุกชนิด แล้วกระจายให้ subscriber ทุกตัว"""
+
+    def __init__(self, ser, serial_format=SERIAL_FORMAT, host=HUB_HOST, port=HUB_PORT, shm_name=None):
+        self.ser = ser
+        self.framer = CsiFramer(serial_format, text_records=True)
+        self.server = socket.create_server((host, port))
+        self.shared = SharedFrameWriter(shm_name) if shm_name else None
+        self.address = self.server.getsockname()
+        self.subscribers = []
+        self.stop_event = threading.Event()
+        self.counts = Counter()     # จำนวน record ต่อชนิด
+        self.seq = 0
+        self.last_rssi = None
+        self.ingest = None
+        self.publish_time = None
+        self._lock = threading.Lock()
+
+    def attach_metrics(self, registry):
+        """วัดการอ่าน / แยกเฟรม, เวลาส่งต่อ และ subscriber ลง MetricsRegistry (csi_metrics.py)"""
+        self.ingest = IngestMetrics(registry)
+        self.ingest.track(self.framer)
+        self.publish_time = registry.histogram('csi_publish_seconds', 'Time to fan out one serial read to subscribers')
+        subscribers = registry.gauge('csi_hub_subscribers', 'Connected hub subscribers')
+        dropped = registry.counter('csi_hub_dropped_total', 'Records dropped for slow subscribers (connected subscribers)')
+
+        def collect():
+            with self._lock:
+                connected = list(self.subscribers)
+            subscribers.value = len(connected)
+            dropped.value = sum(sub.dropped for sub in connected)
+        registry.add_collector(collect)
+
+    def read_records(self):
+        """อ่านข้อมูลที่ค้างอยู่ใน Serial 1 ครั้ง คืนรายการ HubRecord"""
+        frames = read_frames(self.ser, self.framer, self.ingest)
+        ordered = self.framer.take_ordered(frames)
+        if not ordered:
+            return []
+        now = time.time()
+        records = []
+        # ส่งต่อตามลำดับที่มาใน Serial (RSSI / Distance / CSI ปนกันได้ภายในการอ่านครั้งเดียว)
+        for item in ordered:
+            if not isinstance(item, CsiFrame):
+                if item.kind == RECORD_RSSI:
+                    self.last_rssi = max(-128, min(127, item.value))
+                records.append(HubRecord(item.kind, now, item.value))
+                continue
+            frame = item
+            # เฟรมแบบข้อความไม่มี seq/timestamp/rssi: ใช้ลำดับของ hub, เวลาของ host (ของการอ่านครั้งนี้)
+            # และ RSSI ล่าสุดก่อนหน้าเฟรมนี้ในสตรีม
+            if frame.seq is None:
+                frame = CsiFrame(self.seq, int(now * 1e6), self.last_rssi, frame.amplitudes, frame.iq)
+            self.seq += 1
+            if self.shared is not None:
+                self.shared.write(frame, now)
+            records.append(HubRecord(RECORD_CSI, now, frame))
+        self.counts.update(record.kind for record in records)
+        return records
+
+    def publish(self, records):
+        """ส่ง records ให้ subscriber ทุกตัว (เข้ารหัสครั้งเดียวต่อรูปแบบ) และส่งข้อมูลที่ค้างอยู่"""
+        with self._lock:
+            subscribers = list(self.subscribers)
+        encoded = {}
+        host_time = encode_text_record(TextRecord(RECORD_HOST_TIME, records[0].host_time)) if records else b""
+        for sub in subscribers:
+            try:
+                if records:
+                    if sub.serial_format not in encoded:
+                        encoded[sub.serial_format] = [encode_record(r, sub.serial_format) for r in records]
+                    chunks = [data for r, data in zip(records, encoded[sub.serial_format]) if r.kind in sub.kinds]
+                    if chunks and RECORD_HOST_TIME in sub.kinds:
+                        sub.send(host_time + b"".join(chunks), len(chunks))
+                    else:
+                        sub.send(b"".join(chunks), len(chunks))
+                else:
+                    sub.flush()
+            except OSError:
+                self._remove(sub)
+
+    def _remove(self, sub):
+        with self._lock:
+            if sub in self.subscribers:
+                self.subscribers.remove(sub)
+        sub.close()
+        print(f"Subscriber {sub.address} disconnected (dropped {sub.dropped} records).")
+
+    def _accept_loop(self):
+        """รับการเชื่อมต่อใหม่และอ่านบรรทัด SUB (thread แยก ไม่หน่วงการอ่าน Serial)"""
+        self.server.settimeout(0.2)
+        while not self.stop_event.is_set():
+            try:
+                sock, address = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                serial_format, kinds = parse_subscription(self._read_handshake(sock))
+            except ValueError as e:
+                print(f"Rejected subscriber {address}: {e}")
+                sock.close()
+                continue
+            with self._lock:
+                self.subscribers.append(Subscriber(sock, address, serial_format, kinds))
+            print(f"Subscriber {address} connected ({serial_format}: {','.join(sorted(kinds))}).")
+
+    def _read_handshake(self, sock):
+        sock.settimeout(HANDSHAKE_TIMEOUT_SEC)
+        line = b""
+        try:
+            while not line.endswith(b"\n"):
+                data = sock.recv(256)
+                if not data:
+                    break
+                line += data
+        except socket.timeout:
+            pass
+        return line.decode('ascii', 'replace').strip() or 'SUB text'
+
+    def stats_line(self):
+        with self._lock:
+            subscribers = list(self.subscribers)
+        counts = " ".join(f"{kind}={self.counts[kind]}" for kind in RECORD_KINDS if self.counts[kind])
+        dropped = sum(sub.dropped for sub in subscribers)
+        return (f"records: {counts or 'none'} | subscribers={len(subscribers)} dropped={dropped} | "
+                f"stream: {self.framer.stats_line()}")
+
+    def serve_forever(self):
+        """วนอ่าน Serial และกระจายข้อมูลจนกว่าจะเรียก stop() หรือ Serial หลุด"""
+        acceptor = threading.Thread(target=self._accept_loop, name="csi-hub-accept", daemon=True)
+        acceptor.start()
+        next_stats = time.monotonic() + STATS_INTERVAL_SEC
+        try:
+            while not self.stop_event.is_set():
+                records = self.read_records()
+                if self.publish_time is None:
+                    self.publish(records)
+                else:
+                    start = time.perf_counter()
+                    self.publish(records)
+                    if records:
+                        self.publish_time.observe(time.perf_counter() - start)
+                if time.monotonic() >= next_stats:
+                    print(self.stats_line())
+                    next_stats += STATS_INTERVAL_SEC
+        finally:
+            self.stop_event.set()
+            acceptor.join()
+            self.server.close()
+            if self.shared is not None:
+                self.shared.close()
+            with self._lock:
+                subscribers, self.subscribers = self.subscribers, []
+            for sub in subscribers:
+                sub.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class HubClient:
+    """
+    ฝั่ง subscriber: ใช้แทน serial.Serial ได้ (read / readline / in_waiting / flushInput / close)
+    หรือเรียก read_records() เพื่อรับ HubRecord ที่แยกชนิดแล้ว
+    host_time=True: ขอบรรทัด HOST_TIME จาก hub เพื่อให้ read_records() ใช้เวลาที่ hub ได้รับข้อมูล
+    (open_serial ปิดไว้ เพื่อให้สตรีมเหมือน Serial จริง ขอเองได้ด้วย kinds=...,host_time ใน URL)
+    """
+
+    def __init__(self, host=HUB_HOST, port=HUB_PORT, serial_format='text', kinds=None, timeout=1, host_time=True):
+        kinds = set(kinds) if kinds else set(RECORD_KINDS)
+        if host_time:
+            kinds.add(RECORD_HOST_TIME)
+        kinds = sorted(kinds)
+        self.timeout = timeout
+        self.port = f"{HUB_URL_PREFIX}{host}:{port}"
+        self.sock = socket.create_connection((host, port), timeout=HANDSHAKE_TIMEOUT_SEC * 4)
+        self.sock.sendall(f"SUB {serial_format} {','.join(kinds)}\n".encode())
+        self.sock.setblocking(False)
+        self.is_open = True
+        self._buf = bytearray()
+        self._framer = None
+        self._host_time = None     # เวลาจากบรรทัด HOST_TIME ล่าสุด
+
+    @classmethod
+    def from_url(cls, url, timeout=1):
+        """hub://host:port?format=binary&kinds=csi,rssi"""
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        kinds = query['kinds'][0].split(',') if 'kinds' in query else None
+        return cls(parts.hostname or HUB_HOST, parts.port or HUB_PORT,
+                   query.get('format', ['text'])[0], kinds, timeout, host_time=False)
+
+    def _fill(self, wait):
+        """รับข้อมูลจาก hub เข้า buffer (รอไม่เกิน wait วินาที)"""
+        readable, _, _ = select.select([self.sock], [], [], max(wait, 0))
+        if not readable:
+            return False
+        try:
+            data = self.sock.recv(RECV_CHUNK_SIZE)
+        except BlockingIOError:
+            return False
+        if not data:
+            raise serial.SerialException("hub closed the connection")
+        self._buf += data
+        return True
+
+    @property
+    def in_waiting(self):
+        self._fill(0)
+        return len(self._buf)
+
+    def _read_until(self, done):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not done():
+            wait = 1.0 if deadline is None else deadline - time.monotonic()
+            if wait <= 0:
+                break
+            self._fill(wait)
+
+    def read(self, size=1):
+        self._read_until(lambda: len(self._buf) >= size)
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        return data
+
+    def readline(self):
+        self._read_until(lambda: b"\n" in self._buf)
+        end = self._buf.find(b"\n") + 1 or len(self._buf)
+        data = bytes(self._buf[:end])
+        del self._buf[:end]
+        return data
+
+    def read_records(self):
+        """
+        อ่านข้อมูลที่มาถึงแล้วคืนรายการ HubRecord
+        host_time = เวลาที่ hub ได้รับข้อมูล (จากบรรทัด HOST_TIME) หรือเวลาที่มาถึงฝั่งนี้ถ้าไม่ได้ขอ host_time
+        เวลาของบอร์ด (timestamp_us) อยู่ใน CsiFrame เท่านั้น
+        """
+        if self._framer is None:
+            self._framer = CsiFramer('auto', text_records=True)
+        frames = read_frames(self, self._framer)
+        now = time.time()
+        records = []
+        for item in self._framer.take_ordered(frames):
+            if isinstance(item, CsiFrame):
+                records.append(HubRecord(RECORD_CSI, self._host_time or now, item))
+            elif item.kind == RECORD_HOST_TIME:
+                self._host_time = item.value
+            else:
+                records.append(HubRecord(item.kind, self._host_time or now, item.value))
+        return records
+
+    def reset_input_buffer(self):
+        while self._fill(0):
+            pass
+        self._buf.clear()
+
+    flushInput = reset_input_buffer
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        if self.is_open:
+            self.sock.close()
+            self.is_open = False
+
+
+def open_serial(port, baud_rate, timeout=1):
+    """เปิด Serial Port ตามปกติ หรือเชื่อมต่อ hub ถ้า port ขึ้นต้นด้วย hub:// (TCP) หรือ shm:// (shared memory)"""
+    try:
+        if port.startswith(HUB_URL_PREFIX):
+            return HubClient.from_url(port, timeout)
+        if port.startswith(SHM_URL_PREFIX):
+            return SharedFrameReader.from_url(port, timeout)
+    except (OSError, ValueError) as e:
+        raise serial.SerialException(f"could not connect to {port}: {e}")
+    return serial.Serial(port, baud_rate, timeout=timeout)
+
+
+if __name__ == "__main__":
+    import sys
+    port = sys.argv[1] if len(sys.argv) > 1 else SERIAL_PORT
+    serial_format = sys.argv[2] if len(sys.argv) > 2 else SERIAL_FORMAT
+    try:
+        if os.path.exists(port) and not port.startswith('/dev/'):
+            # ไฟล์ที่บันทึกไว้: เล่นซ้ำแทนบอร์ดจริง (ทดสอบหลายโปรแกรมพร้อมกันได้โดยไม่ต้องมีบอร์ด)
+            from csi_replay import ReplaySerial
+            ser = ReplaySerial.from_file(port, 'binary' if serial_format == 'binary' else 'text',
+                                         timeout=SERIAL_TIMEOUT_SEC, loop=True)
+        else:
+            ser = serial.Serial(port, BAUD_RATE, timeout=SERIAL_TIMEOUT_SEC)
+            ser.reset_input_buffer()
+        hub = CsiHub(ser, serial_format, shm_name=SHARED_MEMORY_NAME)
+        metrics, exporter = create_metrics(METRICS_EXPORT)
+        if metrics is not None:
+            hub.attach_metrics(metrics)
+    except (serial.SerialException, OSError) as e:
+        print(f"Error: Could not start hub on {port}. {e}")
+        sys.exit(1)
+
+    print(f"Reading {port}, serving on {HUB_URL_PREFIX}{hub.address[0]}:{hub.address[1]}"
+          + (f" and {SHM_URL_PREFIX}{SHARED_MEMORY_NAME}" if SHARED_MEMORY_NAME else "") + " (Ctrl+C to stop)")
+    try:
+        hub.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping hub...")
+    except serial.SerialException as e:
+        print(f"Serial error: {e}")
+    finally:
+        ser.close()
+        print(hub.stats_line())
+        if exporter is not None:
+            exporter.close()
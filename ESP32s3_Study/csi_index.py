@@ -0,0 +1,317 @@
+import time
+
+import numpy as np
+
+# --- Fingerprint index สำหรับ radio map ขนาดใหญ่ ---
+# ใช้แทน KNeighborsRegressor ได้โดยตรง (มี fit / predict / kneighbors / n_features_in_)
+# - BruteForceIndex: ค้นหาแบบตรง (exact) ด้วย float32 ทีละ chunk
+# - IVFIndex: แบ่ง fingerprint เป็นกลุ่มด้วย k-means แล้วค้นเฉพาะ n_probe กลุ่มที่ใกล้ที่สุด
+#   เลือกเก็บค่าแบบ int8 (scalar quantization) เพื่อลดขนาดไฟล์โมเดลลง ~4-8 เท่า
+#   n_probe คือปุ่มปรับ recall/latency: มากขึ้น = แม่นขึ้นแต่ช้าลง
+# ทั้งสองแบบรองรับ partial_fit: เพิ่ม fingerprint ทีละบล็อก (ฝึกแบบ streaming / เพิ่มไฟล์ใหม่เข้าโมเดลเดิม)
+# บล็อกที่เพิ่มจะพักไว้แล้วรวมเข้า index ครั้งเดียวตอนค้นหาหรือบันทึกครั้งถัดไป
+
+QUERY_CHUNK_SIZE = 1024     # จำนวน query ต่อรอบในการคำนวณระยะ (คุมขนาดหน่วยความจำชั่วคราว)
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLES_PER_LIST = 256
+
+
+def squared_distances(queries, refs, refs_sq=None):
+    """ระยะทางยกกำลังสองระหว่างทุกคู่ (queries x refs) ด้วย matrix multiplication"""
+    if refs_sq is None:
+        refs_sq = np.einsum('ij,ij->i', refs, refs)
+    q_sq = np.einsum('ij,ij->i', queries, queries)
+    d = q_sq[:, None] - 2.0 * (queries @ refs.T) + refs_sq[None, :]
+    np.maximum(d, 0, out=d)
+    return d
+
+
+def _merge_topk(best_d, best_i, new_d, new_i, k):
+    """รวมผลลัพธ์ k อันดับแรกเดิมกับผู้สมัครใหม่ (ทำทีละหลาย query พร้อมกัน)"""
+    d = np.concatenate([best_d, new_d], axis=1)
+    i = np.concatenate([best_i, new_i], axis=1)
+    if d.shape[1] > k:
+        part = np.argpartition(d, k - 1, axis=1)[:, :k]
+        d = np.take_along_axis(d, part, axis=1)
+        i = np.take_along_axis(i, part, axis=1)
+    return d, i
+
+
+def _weighted_labels(labels, distances, indices, weights):
+    """เฉลี่ยพิกัดของเพื่อนบ้าน (uniform หรือถ่วงน้ำหนักด้วย 1/ระยะทาง เหมือน sklearn)"""
+    neighbor_labels = labels[indices]
+    # ระยะ inf = ช่องที่ไม่มีผู้สมัคร (IVF probe น้อยกว่า k) ไม่นำมาคิด
+    valid = np.isfinite(distances)
+    if weights == 'distance':
+        dist = np.sqrt(np.where(valid, distances, np.inf))
+        with np.errstate(divide='ignore'):
+            w = 1.0 / dist
+        # ถ้าระยะเป็น 0 ให้ใช้เฉพาะเพื่อนบ้านที่ซ้ำพอดี
+        exact = dist == 0
+        has_exact = exact.any(axis=1)
+        w[has_exact] = exact[has_exact]
+    else:
+        w = valid.astype(np.float32)
+    return np.einsum('qk,qkd->qd', w, neighbor_labels) / np.maximum(w.sum(axis=1, keepdims=True), 1e-12)
+
+
+class _PendingBlocks:
+    """บล็อกที่ partial_fit เพิ่มไว้แต่ยังไม่รวมเข้า index (รวมครั้งเดียวเมื่อจำเป็น)"""
+
+    def _add_pending(self, *arrays):
+        if not hasattr(self, '_pending'):
+            self._pending = []
+        self._pending.append(arrays)
+
+    def _take_pending(self):
+        pending = getattr(self, '_pending', None)
+        self._pending = []
+        return pending
+
+    def __getstate__(self):
+        # รวมบล็อกที่ค้างก่อนบันทึกด้วย joblib
+        self._merge_pending()
+        return self.__dict__
+
+
+class BruteForceIndex(_PendingBlocks):
+    """ค้นหาเพื่อนบ้านใกล้สุดแบบตรง (exact) เก็บ fingerprint เป็น float32"""
+
+    requires_training = False
+
+    def __init__(self, n_neighbors=5, weights='uniform'):
+        self.n_neighbors = n_neighbors
+        self.weights = weights
+
+    def fit(self, X, y):
+        self.refs_ = np.ascontiguousarray(X, dtype=np.float32)
+        self.labels_ = np.ascontiguousarray(y, dtype=np.float32)
+        self.refs_sq_ = np.einsum('ij,ij->i', self.refs_, self.refs_)
+        self.n_features_in_ = self.refs_.shape[1]
+        self._pending = []
+        return self
+
+    def train(self, X):
+        """ไม่มีอะไรต้องฝึก (มีไว้ให้ใช้แทน IVFIndex ได้)"""
+        return self
+
+    def partial_fit(self, X, y):
+        """เพิ่ม fingerprint 1 บล็อก"""
+        if not hasattr(self, 'refs_'):
+            return self.fit(X, y)
+        self._add_pending(np.asarray(X, dtype=np.float32), np.asarray(y, dtype=np.float32))
+        return self
+
+    def _merge_pending(self):
+        pending = self._take_pending()
+        if pending:
+            new_refs = np.concatenate([x for x, _ in pending])
+            self.refs_ = np.concatenate([self.refs_, new_refs])
+            self.labels_ = np.concatenate([self.labels_] + [y for _, y in pending])
+            self.refs_sq_ = np.concatenate([self.refs_sq_, np.einsum('ij,ij->i', new_refs, new_refs)])
+
+    def kneighbors(self, X, n_neighbors=None):
+        """คืนค่า (ระยะทางยกกำลังสอง, index ของ fingerprint) ขนาด (N, k)"""
+        self._merge_pending()
+        k = min(n_neighbors or self.n_neighbors, len(self.refs_))
+        X = np.asarray(X, dtype=np.float32)
+        out_d = np.empty((len(X), k), dtype=np.float32)
+        out_i = np.empty((len(X), k), dtype=np.int64)
+        for start in range(0, len(X), QUERY_CHUNK_SIZE):
+            chunk = X[start:start + QUERY_CHUNK_SIZE]
+            d = squared_distances(chunk, self.refs_, self.refs_sq_)
+            idx = np.argpartition(d, k - 1, axis=1)[:, :k]
+            out_d[start:start + len(chunk)] = np.take_along_axis(d, idx, axis=1)
+            out_i[start:start + len(chunk)] = idx
+        return out_d, out_i
+
+    def predict(self, X):
+        distances, indices = self.kneighbors(X)
+        return _weighted_labels(self.labels_, distances, indices, self.weights)
+
+    def nbytes(self):
+        self._merge_pending()
+        return self.refs_.nbytes + self.labels_.nbytes + self.refs_sq_.nbytes
+
+
+def kmeans(X, n_clusters, n_iter=KMEANS_ITERATIONS, seed=0):
+    """k-means แบบเบาๆ ด้วย numpy (ฝึกจากตัวอย่างสุ่ม ไม่เกิน KMEANS_SAMPLES_PER_LIST ต่อกลุ่ม)"""
+    rng = np.random.default_rng(seed)
+    X = np.asarray(X, dtype=np.float32)
+    n_clusters = min(n_clusters, len(X))
+    max_samples = n_clusters * KMEANS_SAMPLES_PER_LIST
+    sample = X[rng.choice(len(X), max_samples, replace=False)] if len(X) > max_samples else X
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = np.argmin(squared_distances(sample, centroids), axis=1)
+        counts = np.bincount(assign, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # กลุ่มที่ว่างให้สุ่มจุดใหม่
+        if empty.any():
+            centroids[empty] = sample[rng.choice(len(sample), empty.sum(), replace=False)]
+    return centroids
+
+
+class IVFIndex(_PendingBlocks):
+    """
+    Inverted-file index: fingerprint ถูกจัดกลุ่มตาม centroid ที่ใกล้ที่สุด
+    ตอนค้นหาจะเทียบเฉพาะกลุ่มที่ใกล้ query ที่สุด n_probe กลุ่ม
+    quantize='int8' เก็บค่าแต่ละมิติเป็น uint8 (min/scale ต่อมิติ)
+    ฝึกแบบ streaming: train(ตัวอย่าง) เพื่อหา centroid และช่วง int8 แล้ว partial_fit ทีละบล็อก
+    (ค่าที่อยู่นอกช่วงของตัวอย่างจะถูกตัดที่ 0/255)
+    """
+
+    requires_training = True
+
+    def __init__(self, n_neighbors=5, n_lists=64, n_probe=8, quantize='int8', weights='uniform', seed=0):
+        self.n_neighbors = n_neighbors
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.quantize = quantize
+        self.weights = weights
+        self.seed = seed
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float32)
+        self.train(X)
+        self._build_lists(X, y)
+        return self
+
+    def train(self, X):
+        """หา centroid และช่วงของ int8 จากตัวอย่าง (ยังไม่เพิ่ม fingerprint)"""
+        X = np.asarray(X, dtype=np.float32)
+        self.n_features_in_ = X.shape[1]
+        self.centroids_ = kmeans(X, self.n_lists, seed=self.seed)
+        self.centroids_sq_ = np.einsum('ij,ij->i', self.centroids_, self.centroids_)
+
+        if self.quantize == 'int8':
+            self.vmin_ = X.min(axis=0)
+            span = X.max(axis=0) - self.vmin_
+            self.scale_ = np.where(span > 0, span / 255.0, 1.0).astype(np.float32)
+        self._build_lists(X[:0], np.empty((0, 2), dtype=np.float32))
+        return self
+
+    def partial_fit(self, X, y):
+        """เพิ่ม fingerprint 1 บล็อก (ถ้ายังไม่ได้ train จะ train จากบล็อกนี้)"""
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float32)
+        if not hasattr(self, 'centroids_'):
+            self.train(X)
+        n_added = len(self.ids_) + sum(len(p[0]) for p in getattr(self, '_pending', []))
+        ids = np.arange(n_added, n_added + len(X), dtype=np.int32)
+        self._add_pending(self._encode(X), y, self._assign(X), ids)
+        return self
+
+    def _merge_pending(self):
+        pending = self._take_pending()
+        if not pending:
+            return
+        n_lists = len(self.centroids_)
+        old_assign = np.repeat(np.arange(n_lists), np.diff(self.offsets_))
+        assign = np.concatenate([old_assign] + [p[2] for p in pending])
+        order = np.argsort(assign, kind='stable')
+        new_codes = [p[0] for p in pending]
+        decoded = [self._decode(c) for c in new_codes]
+        self.codes_ = np.concatenate([self.codes_] + new_codes)[order]
+        self.labels_ = np.concatenate([self.labels_] + [p[1] for p in pending])[order]
+        self.ids_ = np.concatenate([self.ids_] + [p[3] for p in pending])[order]
+        self.codes_sq_ = np.concatenate([self.codes_sq_] + [np.einsum('ij,ij->i', d, d) for d in decoded])[order]
+        self.offsets_ = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+
+    def _assign(self, X):
+        assign = np.empty(len(X), dtype=np.int64)
+        for start in range(0, len(X), QUERY_CHUNK_SIZE):
+            chunk = X[start:start + QUERY_CHUNK_SIZE]
+            assign[start:start + len(chunk)] = np.argmin(
+                squared_distances(chunk, self.centroids_, self.centroids_sq_), axis=1)
+        return assign
+
+    def _encode(self, X):
+        if self.quantize == 'int8':
+            return np.clip(np.rint((X - self.vmin_) / self.scale_), 0, 255).astype(np.uint8)
+        return X.astype(np.float32)
+
+    def _decode(self, codes):
+        if self.quantize == 'int8':
+            return codes.astype(np.float32) * self.scale_ + self.vmin_
+        return codes
+
+    def _build_lists(self, X, y):
+        """เรียง fingerprint ตามกลุ่ม (CSR): list l อยู่ที่ codes_[offsets_[l]:offsets_[l+1]]"""
+        assign = self._assign(X)
+        order = np.argsort(assign, kind='stable')
+        self.codes_ = self._encode(X[order])
+        self.labels_ = y[order]
+        self.ids_ = order.astype(np.int32)   # แถวเดิมในข้อมูลฝึก (ใช้วัด recall)
+        decoded = self._decode(self.codes_)
+        self.codes_sq_ = np.einsum('ij,ij->i', decoded, decoded)
+        self.offsets_ = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(self.centroids_)))])
+        self._pending = []
+
+    def kneighbors(self, X, n_neighbors=None):
+        """คืนค่า (ระยะทางยกกำลังสอง, index ใน codes_) ขนาด (N, k) จากเฉพาะกลุ่มที่ probe"""
+        self._merge_pending()
+        k = n_neighbors or self.n_neighbors
+        X = np.asarray(X, dtype=np.float32)
+        n_probe = min(self.n_probe, len(self.centroids_))
+
+        coarse = squared_distances(X, self.centroids_, self.centroids_sq_)
+        probes = np.argpartition(coarse, n_probe - 1, axis=1)[:, :n_probe]
+
+        best_d = np.full((len(X), k), np.inf, dtype=np.float32)
+        best_i = np.zeros((len(X), k), dtype=np.int64)
+        # วนตามกลุ่ม (ไม่ใช่ตาม query): แต่ละกลุ่มคำนวณกับทุก query ที่ probe กลุ่มนั้นพร้อมกัน
+        for lst in np.unique(probes):
+            start, end = self.offsets_[lst], self.offsets_[lst + 1]
+            if start == end:
+                continue
+            rows = np.flatnonzero((probes == lst).any(axis=1))
+            d = squared_distances(X[rows], self._decode(self.codes_[start:end]), self.codes_sq_[start:end])
+            idx = np.broadcast_to(np.arange(start, end), d.shape)
+            best_d[rows], best_i[rows] = _merge_topk(best_d[rows], best_i[rows], d, idx, k)
+        return best_d, best_i
+
+    def predict(self, X):
+        distances, indices = self.kneighbors(X)
+        return _weighted_labels(self.labels_, distances, indices, self.weights)
+
+    def nbytes(self):
+        self._merge_pending()
+        total = self.codes_.nbytes + self.labels_.nbytes + self.codes_sq_.nbytes + self.ids_.nbytes
+        total += self.centroids_.nbytes + self.offsets_.nbytes
+        if self.quantize == 'int8':
+            total += self.vmin_.nbytes + self.scale_.nbytes
+        return total
+
+
+def make_index(backend, n_neighbors=5, weights='uniform', n_lists=64, n_probe=8, quantize='int8'):
+    """สร้าง index ตามชื่อ backend: 'brute' หรือ 'ivf'"""
+    if backend == 'brute':
+        return BruteForceIndex(n_neighbors, weights)
+    if backend == 'ivf':
+        return IVFIndex(n_neighbors, n_lists, n_probe, quantize, weights)
+    raise ValueError(f"unknown index backend '{backend}' (expected 'brute' or 'ivf')")
+
+
+def recall_at_k(index, exact_index, X):
+    """สัดส่วนของเพื่อนบ้านจริง (จาก BruteForceIndex) ที่ index หาเจอ ใช้เลือกค่า n_probe"""
+    distances, approx = index.kneighbors(X)
+    _, exact = exact_index.kneighbors(X, n_neighbors=approx.shape[1])
+    approx = np.where(np.isfinite(distances), getattr(index, 'ids_', np.arange(len(index.labels_)))[approx], -1)
+    hits = (approx[:, :, None] == exact[:, None, :]).any(axis=1)
+    return hits.mean()
+
+
+def measure_latency(model, X, repeats=3):
+    """เวลาเฉลี่ยต่อ query (มิลลิวินาที) เมื่อทำนายทั้งชุดในครั้งเดียว"""
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(X)
+        best = min(best, time.perf_counter() - start)
+    return best / max(len(X), 1) * 1000
@@ -0,0 +1,98 @@
+import threading
+
+import numpy as np
+
+# --- Backend สำหรับกราฟเส้นตามเวลาแบบ real-time (ใช้ร่วมกันใน plot.py และ plotter.py ทุกตัว) ---
+# - ข้อมูลเก็บใน numpy ring buffer ขนาดคงที่ (ไม่ใช่ deque) ไม่มีการแปลงเป็น list ทุกครั้งที่วาด
+# - ตอนวาดใช้เฉพาะช่วงเวลาที่มองเห็น แล้วย่อ (min/max decimation) ให้เหลือไม่เกิน 2 จุดต่อ pixel
+#   เวลาที่ใช้วาดจึงคงที่ ไม่ขึ้นกับความยาวของประวัติ (แกน Y ใช้ min/max ของช่วงที่มองเห็นเท่านั้น)
+#
+# esp32_Receiver/plotter.py และ esp32_Transmitter/plotter.py import โมดูลนี้จากโฟลเดอร์ ESP32s3_Study
+# ให้ Python หาโฟลเดอร์นี้เจอก่อนรัน เช่น (จากโฟลเดอร์ของ plotter.py)
+#   Linux/macOS:  PYTHONPATH=../ESP32s3_Study python plotter.py
+#   Windows:      set PYTHONPATH=..\ESP32s3_Study  แล้ว  python plotter.py
+
+
+class TimeSeriesBuffer:
+    """ring buffer ของ (เวลา, ค่า) ที่เวลาเพิ่มขึ้นเรื่อยๆ เขียนจาก thread อ่าน Serial อ่านจากการวาดกราฟ"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.zeros(capacity)
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def append(self, t, value):
+        with self._lock:
+            i = self.total % self.capacity
+            self.times[i] = t
+            self.values[i] = value
+            self.total += 1
+
+    def last_time(self):
+        with self._lock:
+            return self.times[(self.total - 1) % self.capacity] if self.total else None
+
+    def window(self, t_start):
+        """คัดลอกเฉพาะข้อมูลที่เวลา >= t_start เรียงตามเวลา (ค้นหาด้วย binary search)"""
+        with self._lock:
+            if self.total <= self.capacity:
+                segments = [(0, self.total)]
+            else:
+                split = self.total % self.capacity
+                segments = [(split, self.capacity), (0, split)]
+            times, values = [], []
+            for start, end in segments:
+                first = start + int(np.searchsorted(self.times[start:end], t_start))
+                times.append(self.times[first:end])
+                values.append(self.values[first:end])
+            return np.concatenate(times), np.concatenate(values)
+
+    def clear(self):
+        with self._lock:
+            self.total = 0
+
+
+def decimate_minmax(times, values, n_bins):
+    """
+    ย่อข้อมูลให้เหลือ 2 จุดต่อช่อง (ค่าต่ำสุดและสูงสุดของช่อง เรียงตามเวลา)
+    เส้นที่วาดจึงยังเห็นยอด/ร่องทุกอัน ถ้าข้อมูลน้อยกว่า 2 x n_bins จะคืนค่าเดิม
+    """
+    n = len(values)
+    if n <= 2 * n_bins:
+        return times, values
+    per_bin = n // n_bins
+    skip = n - per_bin * n_bins     # เศษที่เหลือตัดจากฝั่งเก่าสุด (น้อยกว่า 1 ช่อง)
+    t = times[skip:].reshape(n_bins, per_bin)
+    v = values[skip:].reshape(n_bins, per_bin)
+    i_min, i_max = v.argmin(axis=1), v.argmax(axis=1)
+    first, second = np.minimum(i_min, i_max), np.maximum(i_min, i_max)
+    rows = np.arange(n_bins)
+    out_t = np.empty(2 * n_bins)
+    out_v = np.empty(2 * n_bins)
+    out_t[0::2], out_t[1::2] = t[rows, first], t[rows, second]
+    out_v[0::2], out_v[1::2] = v[rows, first], v[rows, second]
+    return out_t, out_v
+
+
+def update_time_series(ax, line, series, window_sec=20.0, y_margin=1.0):
+    """
+    วาด window_sec วินาทีล่าสุดของ series ลงใน line (ใช้ใน FuncAnimation)
+    แกน X เลื่อนตามเวลา แกน Y ปรับตาม min/max ของช่วงที่มองเห็น
+    """
+    last_time = series.last_time()
+    if last_time is None:
+        return line,
+    times, values = series.window(last_time - window_sec)
+    n_bins = max(int(ax.get_window_extent().width), 1)
+    times, values = decimate_minmax(times, values, n_bins)
+    line.set_data(times, values)
+
+    time_window = max(window_sec, last_time)
+    ax.set_xlim(max(0, time_window - window_sec), time_window + 2)
+    ax.set_ylim(values.min() - y_margin, values.max() + y_margin)
+    return line,
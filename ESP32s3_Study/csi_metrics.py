@@ -0,0 +1,312 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# --- Metrics กลางของทุกเครื่องมือ (predictor, visualizer, collector, hub) ---
+# counter   = ค่าสะสม (เฟรมที่รับ / แยกได้ / ทิ้ง / เสีย ...)
+# gauge     = ค่าปัจจุบัน (ข้อมูลค้างใน Serial, จำนวน client ...)
+# histogram = การกระจายของเวลา (parse, predict, smoothing, render) ใน bucket คงที่ (ไม่เก็บทุกค่า)
+# ค่าที่มีอยู่แล้วในออบเจกต์อื่น (สถิติของ CsiFramer, hub, service) อ่านผ่าน collector ตอน export เท่านั้น
+# ลูปหลักจึงเพิ่มงานแค่จับเวลาครั้งละ 1 การอ่าน / 1 batch (ไม่ใช่ต่อเฟรม)
+# ไม่ใช้ lock: thread ที่เขียน metric เดียวกันพร้อมกันอาจทำให้ค่าคลาดเล็กน้อย (ยอมรับได้สำหรับการดูแนวโน้ม)
+# export (ตั้ง METRICS_EXPORT ของแต่ละสคริปต์):
+#   'log'      = พิมพ์ 1 บรรทัดทุก METRICS_LOG_INTERVAL_SEC (อัตราต่อวินาที + p50/p99 ของช่วงนั้น)
+#   'http'     = Prometheus text format ที่ http://METRICS_HOST:METRICS_PORT/metrics
+#   'log+http' = ทั้งสองแบบ
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+METRICS_LOG_INTERVAL_SEC = 10.0
+EXPORT_MODES = ('log', 'http', 'log+http')
+# ขอบบนของ bucket เวลา (วินาที) 25 us .. 1 s
+LATENCY_BUCKETS_SEC = (25e-6, 50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3,
+                       100e-3, 250e-3, 1.0)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """นับค่าลง bucket (counts[i] = จำนวนค่าที่ <= bounds[i], ช่องสุดท้าย = มากกว่าทุก bound)"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS_SEC):
+        self.name = name
+        self.help = help_text
+        self.bounds = list(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_many(self, values):
+        """เพิ่มหลายค่าพร้อมกัน (เช่น latency ของทุกเฟรมใน batch)"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+        binned = np.bincount(np.searchsorted(self.bounds, values), minlength=len(self.counts))
+        for i in np.flatnonzero(binned):
+            self.counts[i] += int(binned[i])
+        self.sum += float(values.sum())
+        self.count += len(values)
+
+    def quantile(self, q, counts=None):
+        """ประมาณ quantile จาก bucket (ประมาณเชิงเส้นภายใน bucket) counts = จำนวนต่อ bucket ของช่วงที่สนใจ"""
+        counts = self.counts if counts is None else counts
+        total = sum(counts)
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                if i == len(self.bounds):
+                    return lower        # เกิน bucket สุดท้าย: รู้แค่ว่ามากกว่า bound สุดท้าย
+                return lower + (self.bounds[i] - lower) * (rank - seen) / c
+            seen += c
+        return self.bounds[-1]
+
+
+class MetricsRegistry:
+    """ที่เก็บ metric ตามชื่อ (ขอชื่อเดิมซ้ำได้ metric ตัวเดิม) และ collector ที่อ่านค่าตอน export"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def _get(self, cls, name, help_text, *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help_text, *args)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"metric '{name}' is already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS_SEC):
+        return self._get(Histogram, name, help_text, buckets)
+
+    def add_collector(self, collect):
+        """collect() ถูกเรียกก่อน export ทุกครั้ง ใช้คัดลอกค่าจากสถิติที่มีอยู่แล้วเข้า counter / gauge"""
+        self.collectors.append(collect)
+
+    def collect(self):
+        for collect in self.collectors:
+            collect()
+        return list(self.metrics.values())
+
+    def prometheus_text(self):
+        """ค่าทั้งหมดใน Prometheus text exposition format"""
+        lines = []
+        for metric in self.collect():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if metric.kind != 'histogram':
+                lines.append(f"{metric.name} {metric.value}")
+                continue
+            cumulative = 0
+            for bound, c in zip(metric.bounds + ['+Inf'], metric.counts):
+                cumulative += c
+                le = bound if bound == '+Inf' else f"{bound:g}"
+                lines.append(f'{metric.name}_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{metric.name}_sum {metric.sum}")
+            lines.append(f"{metric.name}_count {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _short_name(name):
+    for suffix in ('_total', '_seconds'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name[4:] if name.startswith('csi_') else name
+
+
+class MetricsLogger:
+    """สรุป 1 บรรทัดของช่วงล่าสุด: counter เป็นอัตราต่อวินาที, histogram เป็น p50/p99 (ms), gauge เป็นค่าล่าสุด"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.last_time = time.monotonic()
+        self.last = {}
+
+    def line(self):
+        now = time.monotonic()
+        elapsed = max(now - self.last_time, 1e-9)
+        parts = []
+        for metric in self.registry.collect():
+            name = _short_name(metric.name)
+            if metric.kind == 'counter':
+                previous = self.last.get(metric.name, 0)
+                self.last[metric.name] = metric.value
+                parts.append(f"{name} {(metric.value - previous) / elapsed:.1f}/s")
+            elif metric.kind == 'gauge':
+                parts.append(f"{name} {metric.value:g}")
+            else:
+                previous = self.last.get(metric.name, [0] * len(metric.counts))
+                self.last[metric.name] = list(metric.counts)
+                interval = [c - p for c, p in zip(metric.counts, previous)]
+                if sum(interval):
+                    parts.append(f"{name} p50 {metric.quantile(0.5, interval) * 1000:.2f} ms "
+                                 f"p99 {metric.quantile(0.99, interval) * 1000:.2f} ms")
+        self.last_time = now
+        return "[metrics] " + ", ".join(parts)
+
+
+def _metrics_handler(registry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404, "use /metrics")
+                return
+            body = registry.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass    # ไม่พิมพ์ทุกครั้งที่ Prometheus มาอ่าน
+
+    return MetricsHandler
+
+
+class MetricsExporter:
+    """export ตาม mode ใน thread แยก (ไม่หน่วงลูปหลัก) เรียก close() ตอนจบ (พิมพ์สรุปสุดท้ายถ้าเป็น 'log')"""
+
+    def __init__(self, registry, mode, host=METRICS_HOST, port=METRICS_PORT, interval_sec=METRICS_LOG_INTERVAL_SEC):
+        if mode not in EXPORT_MODES:
+            raise ValueError(f"unknown metrics export '{mode}' (expected one of {EXPORT_MODES} or None)")
+        self.registry = registry
+        self.interval_sec = interval_sec
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.http = None
+        self.logger = None
+        if 'http' in mode:
+            self.http = ThreadingHTTPServer((host, port), _metrics_handler(registry))
+            self.http.daemon_threads = True
+            self.address = self.http.server_address
+            self.threads.append(threading.Thread(target=self.http.serve_forever, name="csi-metrics-http",
+                                                 daemon=True))
+            print(f"Metrics: http://{self.address[0]}:{self.address[1]}/metrics")
+        if 'log' in mode:
+            self.logger = MetricsLogger(registry)
+            self.threads.append(threading.Thread(target=self._log_loop, name="csi-metrics-log", daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def _log_loop(self):
+        while not self.stop_event.wait(self.interval_sec):
+            print(f"\n{self.logger.line()}")
+
+    def close(self):
+        self.stop_event.set()
+        if self.http is not None:
+            self.http.shutdown()
+            self.http.server_close()
+        for thread in self.threads:
+            thread.join()
+        if self.logger is not None:
+            print(self.logger.line())
+
+
+def create_metrics(mode, host=METRICS_HOST, port=METRICS_PORT, interval_sec=METRICS_LOG_INTERVAL_SEC):
+    """คืนค่า (registry, exporter) หรือ (None, None) เมื่อ mode = None (ไม่วัดอะไรเลย)"""
+    if mode is None:
+        return None, None
+    registry = MetricsRegistry()
+    return registry, MetricsExporter(registry, mode, host, port, interval_sec)
+
+
+class IngestMetrics:
+    """
+    metrics ของการอ่าน Serial + แยกเฟรม ใช้กับ read_frames(ser, framer, ingest)
+    เวลา parse และข้อมูลค้างวัดต่อการอ่าน 1 ครั้ง ส่วนจำนวนเฟรมอ่านจากสถิติของ framer ที่ track() ไว้ตอน export
+    """
+
+    def __init__(self, registry):
+        self.framers = []
+        self.parse = registry.histogram('csi_parse_seconds', 'Time to split one serial read into frames')
+        self.backlog = registry.gauge('csi_serial_backlog_bytes', 'Bytes waiting in the serial input buffer at the last read')
+        self.reads = registry.counter('csi_serial_reads_total', 'Serial reads that returned data')
+        self.counters = [
+            (registry.counter('csi_bytes_received_total', 'Bytes read from the serial link'), ('bytes_in',)),
+            (registry.counter('csi_frames_received_total', 'CSI frames seen (parsed + dropped)'), ('frames', 'dropped')),
+            (registry.counter('csi_frames_parsed_total', 'CSI frames parsed successfully'), ('frames',)),
+            (registry.counter('csi_frames_dropped_total', 'CSI frames dropped (truncated, merged or malformed)'),
+             ('dropped',)),
+            (registry.counter('csi_frames_malformed_total', 'Complete CSI frames that failed CRC, parsing or length checks'),
+             ('malformed',)),
+            (registry.counter('csi_framer_resyncs_total', 'Times the framer searched for a new frame marker'),
+             ('resyncs',)),
+            (registry.counter('csi_skipped_bytes_total', 'Bytes that were not part of a CSI frame'), ('skipped_bytes',)),
+        ]
+        registry.add_collector(self._collect)
+
+    def track(self, framer):
+        """นับสถิติของ framer นี้ด้วย (เช่น framer ใหม่ของแต่ละตำแหน่งใน collector) คืนค่า framer"""
+        self.framers.append(framer)
+        return framer
+
+    def observe_read(self, backlog, seconds):
+        self.reads.value += 1
+        if backlog is not None:
+            self.backlog.value = backlog
+        self.parse.observe(seconds)
+
+    def _collect(self):
+        for counter, fields in self.counters:
+            counter.value = sum(getattr(framer, field) for framer in self.framers for field in fields)
+
+
+class RenderMetrics:
+    """
+    เวลาเตรียมภาพต่อครั้ง (update ของ animation) และช่วงห่างจริงระหว่างแต่ละครั้ง
+    ช่วงห่างที่มากกว่า interval ที่ตั้งไว้ = การวาด (blit / redraw ของ matplotlib) ทำไม่ทัน
+    """
+
+    def __init__(self, registry):
+        self.render = registry.histogram('csi_render_seconds', 'Time to update plot artists for one animation frame')
+        self.interval = registry.histogram('csi_render_interval_seconds', 'Time between animation frames')
+        self.last_start = None
+
+    def observe(self, start, done):
+        self.render.observe(done - start)
+        if self.last_start is not None:
+            self.interval.observe(start - self.last_start)
+        self.last_start = start
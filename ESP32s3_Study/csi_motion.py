@@ -0,0 +1,230 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+import serial
+
+from csi_framer import CsiFramer, read_frames
+from csi_hub import open_serial
+
+# --- ตรวจจับการเคลื่อนไหว / การมีคนอยู่ในห้องจาก CSI แบบ incremental (O(จำนวน subcarrier) ต่อเฟรม) ---
+# ต่อเฟรมคำนวณ 2 ค่า:
+#   score       = ความแปรปรวนช่วงสั้น (sliding window SHORT_WINDOW_SEC, Welford แบบเพิ่ม/ลบเฟรม)
+#                 เฉลี่ยทุก subcarrier / ความแปรปรวน baseline ระยะยาว (exponential, ไม่อัปเดตขณะมีการเคลื่อนไหว)
+#                 ห้องว่าง ~1, มีคนเดิน = หลายเท่า
+#   correlation = สหสัมพันธ์ของ subcarrier ที่อยู่ติดกันใน window เดียวกัน: การเคลื่อนไหวเปลี่ยนช่องสัญญาณ
+#                 ทั้งแถบไปพร้อมกัน (ใกล้ 1) ส่วน noise ของแต่ละ subcarrier ไม่สัมพันธ์กัน (ใกล้ 0)
+# baseline หยุดอัปเดตขณะมีการเคลื่อนไหวหรือกำลังจะประกาศ (ไม่ให้ baseline ซึมซับการเคลื่อนไหวเข้าไป)
+# เหตุการณ์ (มี hysteresis):
+#   motion_start   เมื่อ score >= MOTION_ON_RATIO และ correlation >= MIN_CORRELATION ต่อเนื่อง MOTION_ON_SEC
+#   motion_stop    เมื่อ score <= MOTION_OFF_RATIO ต่อเนื่อง MOTION_OFF_SEC
+#   presence_start พร้อม motion_start ครั้งแรก, presence_stop เมื่อไม่มีการเคลื่อนไหวนาน PRESENCE_HOLD_SEC
+# ใช้งาน: python csi_motion.py หรือ MOTION_DETECTION = True ใน csi_predictor.py (ทำงานคู่กับการทำนายตำแหน่ง)
+
+# ---!!! ตั้งค่าที่สำคัญ !!!---
+SERIAL_PORT = 'COM10'  # ('hub://127.0.0.1:5760' หรือ 'shm://csi_frames' = ใช้พร้อมกับโปรแกรมอื่นผ่าน csi_hub.py)
+BAUD_RATE = 115200
+SERIAL_FORMAT = 'text' # 'text', 'binary' หรือ 'auto'
+NUM_SUBcarriers = 64
+
+FRAME_RATE_HZ = 100                 # อัตรา CSI โดยประมาณ ใช้แปลงวินาทีเป็นจำนวนเฟรมของ window
+SHORT_WINDOW_SEC = 1.0              # window ของความแปรปรวนช่วงสั้นและ correlation
+BASELINE_TIME_CONSTANT_SEC = 60.0   # ความเร็วที่ baseline ปรับตามสภาพห้อง (มาก = ช้า)
+WARMUP_SEC = 5.0                    # เวลาเรียนรู้ baseline ก่อนเริ่มประกาศเหตุการณ์ (ห้องควรว่าง)
+MOTION_ON_RATIO = 4.0
+MOTION_OFF_RATIO = 2.0
+MIN_CORRELATION = 0.3
+MOTION_ON_SEC = 0.3
+MOTION_OFF_SEC = 2.0
+PRESENCE_HOLD_SEC = 30.0
+VARIANCE_FLOOR = 1e-3               # กันหารด้วยศูนย์เมื่อห้องนิ่งมาก
+
+MOTION_START = 'motion_start'
+MOTION_STOP = 'motion_stop'
+PRESENCE_START = 'presence_start'
+PRESENCE_STOP = 'presence_stop'
+
+MotionEvent = namedtuple('MotionEvent', ['kind', 't', 'score', 'correlation'])
+
+
+class SlidingWelford:
+    """
+    mean / variance ต่อค่า (เช่นต่อ subcarrier) และ co-moment ของค่าที่อยู่ติดกัน (k, k+1) ของ window เฟรมล่าสุด
+    เฟรมใหม่เข้า เฟรมเก่าสุดออก อัปเดต mean, M2 และ co-moment ใน O(n_values)
+    ทุก window เฟรมคำนวณใหม่จาก ring buffer หนึ่งครั้ง กัน error สะสมของ float (เฉลี่ยยังเป็น O(n_values))
+    """
+
+    def __init__(self, n_values, window):
+        self.window = window
+        self.buf = np.zeros((window, n_values))
+        self.mean = np.zeros(n_values)
+        self.m2 = np.zeros(n_values)
+        self.c2 = np.zeros(n_values - 1)    # sum (x[k] - mean[k]) * (x[k+1] - mean[k+1])
+        self.pos = 0
+        self.count = 0
+
+    def update(self, x):
+        if self.count < self.window:
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+            self.c2 += delta[:-1] * (x[1:] - self.mean[1:])
+        else:
+            # แทนเฟรมเก่าด้วยเฟรมใหม่ (n คงที่): M' = M + new*new - old*old - n * (mean'*mean' - mean*mean)
+            old = self.buf[self.pos]
+            new_mean = self.mean + (x - old) / self.window
+            self.m2 += (x - old) * (x - new_mean + old - self.mean)
+            self.c2 += (x[:-1] * x[1:] - old[:-1] * old[1:]
+                        - self.window * (new_mean[:-1] * new_mean[1:] - self.mean[:-1] * self.mean[1:]))
+            self.mean = new_mean
+        self.buf[self.pos] = x
+        self.pos = (self.pos + 1) % self.window
+        if self.pos == 0:
+            self.mean = self.buf.mean(axis=0)
+            centered = self.buf - self.mean
+            self.m2 = (centered ** 2).sum(axis=0)
+            self.c2 = (centered[:, :-1] * centered[:, 1:]).sum(axis=0)
+
+    def variance(self):
+        if self.count < 2:
+            return np.zeros_like(self.m2)
+        return np.maximum(self.m2, 0.0) / (self.count - 1)
+
+    def adjacent_correlation(self):
+        """สหสัมพันธ์รวมของ subcarrier ที่อยู่ติดกันใน window (-1..1, 0 = ไม่สัมพันธ์)"""
+        m2 = np.maximum(self.m2, 0.0)
+        denom = np.sqrt(m2[:-1].sum() * m2[1:].sum())
+        return float(self.c2.sum() / denom) if denom > 0 else 0.0
+
+
+class MotionDetector:
+    """ตัวตรวจจับการเคลื่อนไหว/การมีคนอยู่ ป้อนทีละเฟรมด้วย update() ได้รายการ MotionEvent ที่เกิดขึ้น"""
+
+    def __init__(self, n_subcarriers, rate_hz=FRAME_RATE_HZ, short_window_sec=SHORT_WINDOW_SEC,
+                 baseline_time_constant_sec=BASELINE_TIME_CONSTANT_SEC, warmup_sec=WARMUP_SEC,
+                 on_ratio=MOTION_ON_RATIO, off_ratio=MOTION_OFF_RATIO, min_correlation=MIN_CORRELATION,
+                 on_sec=MOTION_ON_SEC, off_sec=MOTION_OFF_SEC, presence_hold_sec=PRESENCE_HOLD_SEC):
+        if off_ratio > on_ratio:
+            raise ValueError(f"off_ratio ({off_ratio}) must not exceed on_ratio ({on_ratio})")
+        self.n_subcarriers = n_subcarriers
+        self.rate_hz = rate_hz
+        window = max(int(round(short_window_sec * rate_hz)), 2)
+        self.short = SlidingWelford(n_subcarriers, window)
+        self.baseline_alpha = 1.0 / max(baseline_time_constant_sec * rate_hz, 1.0)
+        self.baseline_mean = np.zeros(n_subcarriers)
+        self.baseline_var = np.zeros(n_subcarriers)
+        self.warmup_frames = max(int(warmup_sec * rate_hz), window)
+        self.on_ratio = on_ratio
+        self.off_ratio = off_ratio
+        self.min_correlation = min_correlation
+        self.on_sec = on_sec
+        self.off_sec = off_sec
+        self.presence_hold_sec = presence_hold_sec
+        self.frames = 0
+        self.score = 0.0
+        self.correlation = 0.0
+        self.motion = False
+        self.present = False
+        self._above_since = None
+        self._below_since = None
+        self._last_motion_t = None
+
+    def _update_baseline(self, x):
+        # ช่วง warm-up เป็นค่าเฉลี่ยสะสม (Welford) แล้วค่อยเปลี่ยนเป็น exponential
+        alpha = max(1.0 / self.frames, self.baseline_alpha)
+        delta = x - self.baseline_mean
+        self.baseline_mean += alpha * delta
+        self.baseline_var = (1.0 - alpha) * (self.baseline_var + alpha * delta * delta)
+
+    def update(self, amplitudes, t=None):
+        """เพิ่ม 1 เฟรม (t = เวลาวินาที, None = นับจากอัตราเฟรม) คืน list ของ MotionEvent"""
+        x = np.asarray(amplitudes, dtype=np.float64)[:self.n_subcarriers]
+        if len(x) < self.n_subcarriers:
+            return []
+        self.frames += 1
+        if t is None:
+            t = self.frames / self.rate_hz
+
+        self.short.update(x)
+        self.correlation = self.short.adjacent_correlation()
+        if self.frames < self.warmup_frames or not (self.motion or self._candidate()):
+            self._update_baseline(x)
+        self.score = float(self.short.variance().mean() / max(self.baseline_var.mean(), VARIANCE_FLOOR))
+        if self.frames < self.warmup_frames:
+            return []
+        return self._events(t)
+
+    def _candidate(self):
+        return self.score >= self.on_ratio and self.correlation >= self.min_correlation
+
+    def _events(self, t):
+        events = []
+        if not self.motion:
+            if self._candidate():
+                if self._above_since is None:
+                    self._above_since = t
+                if t - self._above_since >= self.on_sec:
+                    self.motion = True
+                    self._below_since = None
+                    events.append(MotionEvent(MOTION_START, t, self.score, self.correlation))
+                    if not self.present:
+                        self.present = True
+                        events.append(MotionEvent(PRESENCE_START, t, self.score, self.correlation))
+            else:
+                self._above_since = None
+        else:
+            if self.score <= self.off_ratio:
+                if self._below_since is None:
+                    self._below_since = t
+                if t - self._below_since >= self.off_sec:
+                    self.motion = False
+                    self._above_since = None
+                    events.append(MotionEvent(MOTION_STOP, t, self.score, self.correlation))
+            else:
+                self._below_since = None
+        if self.motion:
+            self._last_motion_t = t
+        elif self.present and t - self._last_motion_t >= self.presence_hold_sec:
+            self.present = False
+            events.append(MotionEvent(PRESENCE_STOP, t, self.score, self.correlation))
+        return events
+
+
+def format_event(event):
+    return f"[{event.kind}] t={event.t:.2f} score={event.score:.2f} corr={event.correlation:.2f}"
+
+
+def run_detector():
+    """อ่าน CSI จาก SERIAL_PORT แล้วพิมพ์เหตุการณ์และสถานะปัจจุบัน"""
+    try:
+        ser = open_serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+        ser.flushInput()
+    except serial.SerialException as e:
+        print(f"Error: Could not open serial port {SERIAL_PORT}. {e}")
+        return
+    framer = CsiFramer(SERIAL_FORMAT, min_len=NUM_SUBcarriers)
+    detector = MotionDetector(NUM_SUBcarriers)
+    print(f"Connected to {SERIAL_PORT}. Learning the baseline for {WARMUP_SEC:g} s (keep the room still)...")
+    try:
+        while True:
+            frames = read_frames(ser, framer)
+            host_time = time.time()
+            for frame in frames:
+                t = frame.timestamp_us / 1e6 if frame.timestamp_us is not None else host_time
+                for event in detector.update(frame.amplitudes, t):
+                    print(f"\n{format_event(event)}")
+            if frames:
+                state = 'MOTION' if detector.motion else ('present' if detector.present else 'empty')
+                print(f"score {detector.score:6.2f}  corr {detector.correlation:5.2f}  {state:<8}", end='\r')
+    except KeyboardInterrupt:
+        print("\nStopping detector.")
+        print(f"Stream quality: {framer.stats_line()}")
+    except (serial.SerialException, OSError) as e:
+        print(f"\nError: {e}")
+    finally:
+        ser.close()
+
+
+if __name__ == "__main__":
+    run_detector()
@@ -0,0 +1,316 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import serial
+
+from csi_filters import make_filter
+from csi_framer import CsiFramer, read_frames
+from csi_hub import open_serial
+from csi_protocol import RECORD_DISTANCE, RECORD_DISTANCE_RSSI
+
+# --- หาตำแหน่งจากระยะของหลาย anchor (FTM / ESP-NOW "Distance:<m>" จาก ESP32c3) ---
+# แต่ละ anchor ต่อ Serial คนละพอร์ต (หรือ 'hub://...?kinds=distance') และอยู่ที่พิกัดที่รู้
+# ระยะที่มาถึงถูกแบ่งเป็นช่วงเวลา WINDOW_SEC ระยะของ anchor เดียวกันในช่วงเดียวกันรวมเป็น median
+# แล้วแก้ตำแหน่งของทุกช่วงพร้อมกัน (array (ช่วง, anchor)) ด้วย Gauss-Newton แบบ vectorized:
+#   - ค่าเริ่มต้นจาก linear least squares (ตัวแปร |x|^2 แยกออกมา ทำให้สมการเป็นเชิงเส้น)
+#   - น้ำหนัก Huber (IRLS): ระยะที่ residual เกิน HUBER_DELTA_M มีผลลดลงตามขนาด (ทนต่อ outlier)
+#   - ถ้ามี anchor เกิน (มิติ + 1) ตัวแต่ยังมีระยะที่ไม่เข้ากัน แก้ใหม่แบบตัดทีละ anchor แล้วเลือกชุดที่ดีที่สุด
+#   - anchor ที่ไม่มีระยะในช่วงนั้นไม่ถูกใช้, ช่วงที่มี anchor ไม่ถึง (มิติ + 1) ตัวได้ NaN
+# 2 หรือ 3 มิติตามจำนวนพิกัดใน ANCHORS (anchor ที่อยู่บนระนาบเดียวกันหมด ใช้หา z ไม่ได้ z จะเป็น 0)
+# ใช้งาน: ตั้ง ANCHORS แล้วรัน python csi_multilat.py
+
+ANCHORS = [                     # (พอร์ต, พิกัด) ลำดับในรายการ = anchor id
+    ('COM11', (0.0, 0.0)),
+    ('COM12', (4.0, 0.0)),
+    ('COM13', (0.0, 4.0)),
+]
+BAUD_RATE = 115200
+WINDOW_SEC = 0.2                # ความยาวช่วงเวลาที่รวมระยะเป็น 1 ตำแหน่ง
+HUBER_DELTA_M = 0.3             # residual (เมตร) ที่เกินกว่านี้ถือว่าอาจเป็น outlier (น้ำหนักลดลง)
+GN_ITERATIONS = 10              # จำนวนรอบสูงสุดของ Gauss-Newton
+GN_TOLERANCE_M = 1e-4           # หยุดเมื่อทุกช่วงขยับน้อยกว่านี้
+GN_DAMPING = 1e-6               # เพิ่มบนแนวทแยงกันเมทริกซ์ singular (anchor เรียงเป็นเส้นตรง/ระนาบ)
+MIN_RANGE_M = 1e-3              # กันการหารด้วย 0 เมื่อตำแหน่งตรงกับ anchor
+SMOOTHING_FILTER = 'none'       # กรองตำแหน่งต่อเนื่อง (ดู csi_filters.FILTER_NAMES, 'kalman' ใช้ได้เฉพาะ 2 มิติ)
+READ_TIMEOUT_SEC = 0.05
+QUEUE_POLL_SEC = 0.02
+RANGE_KINDS = (RECORD_DISTANCE, RECORD_DISTANCE_RSSI)
+
+# positions (W, D), residual_rms (W,) และ outliers (W, N) = ระยะที่ residual สุดท้ายเกิน HUBER_DELTA_M
+Solution = namedtuple('Solution', ['positions', 'residual_rms', 'outliers'])
+
+
+def window_ranges(times, anchor_ids, ranges, n_anchors, window_sec=WINDOW_SEC, t0=None):
+    """
+    รวมระยะ (เรียงเวลาหรือไม่ก็ได้) เป็นตาราง median ต่อ (ช่วงเวลา, anchor)
+    คืนค่า (เวลาท้ายช่วง (W,), ranges (W, N) ที่ช่องที่ไม่มีข้อมูลเป็น NaN) เฉพาะช่วงที่มีข้อมูล
+    """
+    times = np.asarray(times, dtype=np.float64)
+    anchor_ids = np.asarray(anchor_ids, dtype=np.int64)
+    ranges = np.asarray(ranges, dtype=np.float64)
+    valid = np.isfinite(ranges) & (ranges >= 0) & (anchor_ids >= 0) & (anchor_ids < n_anchors)
+    times, anchor_ids, ranges = times[valid], anchor_ids[valid], ranges[valid]
+    if not len(times):
+        return np.empty(0), np.empty((0, n_anchors))
+    t0 = times.min() if t0 is None else t0
+    windows = np.floor((times - t0) / window_sec).astype(np.int64)
+
+    # เรียงตาม (ช่วง, anchor, ระยะ) แล้ว median ของแต่ละกลุ่มคือค่ากลางของกลุ่ม (ไม่มี loop ใน Python)
+    order = np.lexsort((ranges, anchor_ids, windows))
+    windows, anchor_ids, ranges = windows[order], anchor_ids[order], ranges[order]
+    key = windows * n_anchors + anchor_ids
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    counts = np.diff(np.r_[starts, len(key)])
+    medians = 0.5 * (ranges[starts + (counts - 1) // 2] + ranges[starts + counts // 2])
+
+    unique_windows = np.unique(windows[starts])
+    table = np.full((len(unique_windows), n_anchors), np.nan)
+    table[np.searchsorted(unique_windows, windows[starts]), anchor_ids[starts]] = medians
+    return t0 + (unique_windows + 1) * window_sec, table
+
+
+def huber_weights(residual, delta=HUBER_DELTA_M):
+    """น้ำหนัก IRLS ของ Huber loss: 1 ในช่วง |r| <= delta, delta / |r| นอกช่วง"""
+    abs_residual = np.abs(residual)
+    return np.where(abs_residual <= delta, 1.0, delta / np.maximum(abs_residual, 1e-12))
+
+
+def _solve_batched(H, g, solvable):
+    """แก้ H x = g ทุกช่วงพร้อมกัน (ช่วงที่แก้ไม่ได้ใช้ I, 0 แทนเพื่อไม่ให้ทั้ง batch ล้ม)"""
+    eye = np.eye(H.shape[-1])
+    H = np.where(solvable[:, None, None], H, eye)
+    g = np.where(solvable[:, None], g, 0.0)
+    return np.linalg.solve(H, g[..., None])[..., 0]
+
+
+def initial_positions(anchors, ranges, mask):
+    """
+    ค่าเริ่มต้นจาก linear least squares: |x - a_i|^2 = r_i^2
+    -> -2 a_i . x + |x|^2 = r_i^2 - |a_i|^2 (ให้ |x|^2 เป็นตัวแปรเพิ่มอีกตัว) คืนค่า (W, D)
+    """
+    n_dims = anchors.shape[1]
+    A = np.column_stack([-2.0 * anchors, np.ones(len(anchors))])            # (N, D + 1)
+    b = np.where(mask, np.nan_to_num(ranges) ** 2, 0.0) - np.sum(anchors ** 2, axis=1)
+    weights = mask.astype(np.float64)
+    H = np.einsum('wn,ni,nj->wij', weights, A, A)
+    g = np.einsum('wn,ni,wn->wi', weights, A, b)
+    H += GN_DAMPING * np.eye(n_dims + 1)
+    solvable = mask.sum(axis=1) > n_dims
+    return _solve_batched(H, g, solvable)[:, :n_dims]
+
+
+def _gauss_newton(anchors, observed, mask, x, iterations, huber_delta):
+    """Gauss-Newton + น้ำหนัก Huber ทุกช่วงพร้อมกัน คืนค่า (ตำแหน่ง (W, D), residual (W, N) ที่ช่องไม่มีข้อมูลเป็น 0)"""
+    n_dims = anchors.shape[1]
+    solvable = mask.sum(axis=1) > n_dims
+    damping = GN_DAMPING * np.eye(n_dims)
+    for _ in range(iterations):
+        diff = x[:, None, :] - anchors[None, :, :]                          # (W, N, D)
+        distance = np.maximum(np.linalg.norm(diff, axis=2), MIN_RANGE_M)    # (W, N)
+        residual = distance - observed
+        weights = np.where(mask, huber_weights(residual, huber_delta), 0.0)
+        J = diff / distance[..., None]                                      # d(distance)/dx
+        JW = J * weights[..., None]
+        H = np.einsum('wni,wnj->wij', JW, J) + damping
+        g = np.einsum('wni,wn->wi', JW, residual)
+        step = _solve_batched(H, g, solvable)
+        x = x - step
+        if not len(x) or np.max(np.abs(step)) < GN_TOLERANCE_M:
+            break
+    distance = np.linalg.norm(x[:, None, :] - anchors[None, :, :], axis=2)
+    return x, np.where(mask, distance - observed, 0.0)
+
+
+def _residual_rms(residual, mask):
+    return np.sqrt(np.sum(residual ** 2, axis=1) / np.maximum(mask.sum(axis=1), 1))
+
+
+def solve_positions(anchors, ranges, iterations=GN_ITERATIONS, huber_delta=HUBER_DELTA_M, x0=None):
+    """
+    หาตำแหน่งของทุกช่วงเวลาพร้อมกัน
+    anchors (N, D) = พิกัด anchor, ranges (W, N) = ระยะ (NaN = ไม่มีข้อมูล), x0 (W, D) = ค่าเริ่มต้น (ถ้ามี)
+    คืนค่า Solution (ตำแหน่งของช่วงที่มี anchor ไม่ถึง D + 1 ตัวเป็น NaN)
+    """
+    anchors = np.asarray(anchors, dtype=np.float64)
+    ranges = np.atleast_2d(np.asarray(ranges, dtype=np.float64))
+    n_anchors, n_dims = anchors.shape
+    mask = np.isfinite(ranges)
+    solvable = mask.sum(axis=1) > n_dims
+    observed = np.where(mask, ranges, 0.0)
+    x = initial_positions(anchors, ranges, mask) if x0 is None else np.array(x0, dtype=np.float64)
+    x = np.where(np.isfinite(x), x, 0.0)
+    x, residual = _gauss_newton(anchors, observed, mask, x, iterations, huber_delta)
+    residual_rms = _residual_rms(residual, mask)
+
+    # anchor เหลือน้อย (เช่น 4 ตัวใน 2 มิติ) Huber อย่างเดียวกระจาย error ของ outlier ไปทุกระยะ
+    # ช่วงที่ยังมีระยะที่ residual เกิน huber_delta และมี anchor เกิน D + 1 ตัว: แก้ใหม่แบบตัดทีละ anchor
+    # (ทุกแบบใน batch เดียว) แล้วใช้แบบที่ residual ต่ำสุด (แยก outlier ได้ 1 ระยะต่อช่วง)
+    redundant = solvable & (mask.sum(axis=1) > n_dims + 1)
+    suspect = np.flatnonzero(redundant & np.any(np.abs(residual) > huber_delta, axis=1))
+    if len(suspect):
+        dropped = np.tile(np.arange(n_anchors), len(suspect))
+        sub_mask = np.repeat(mask[suspect], n_anchors, axis=0)
+        sub_mask[np.arange(len(dropped)), dropped] = False
+        sub_observed = np.repeat(observed[suspect], n_anchors, axis=0)
+        # เริ่มจาก linear least squares ของแต่ละชุดใหม่ (ตำแหน่งเดิมถูก outlier ดึงไปแล้ว)
+        sub_x = initial_positions(anchors, np.where(sub_mask, sub_observed, np.nan), sub_mask)
+        sub_x, sub_residual = _gauss_newton(anchors, sub_observed, sub_mask, sub_x, iterations, huber_delta)
+        sub_rms = _residual_rms(sub_residual, sub_mask).reshape(len(suspect), n_anchors)
+        sub_rms[~mask[suspect]] = np.inf                                    # ตัด anchor ที่ไม่มีข้อมูลอยู่แล้ว = ไม่ต่าง
+        best = np.argmin(sub_rms, axis=1)
+        better = sub_rms[np.arange(len(suspect)), best] < residual_rms[suspect]
+        rows, chosen = suspect[better], (np.arange(len(suspect)) * n_anchors + best)[better]
+        x[rows] = sub_x[chosen]
+        distance = np.linalg.norm(x[rows, None, :] - anchors[None, :, :], axis=2)
+        residual[rows] = np.where(mask[rows], distance - observed[rows], 0.0)
+        residual_rms[rows] = sub_rms[better, best[better]]
+
+    x[~solvable] = np.nan
+    residual_rms[~solvable] = np.nan
+    outliers = mask & solvable[:, None] & (np.abs(residual) > huber_delta)
+    return Solution(x, residual_rms, outliers)
+
+
+def localize_ranges(anchors, times, anchor_ids, ranges, window_sec=WINDOW_SEC, huber_delta=HUBER_DELTA_M):
+    """ระยะดิบทั้งหมด (เช่นจาก log) -> (เวลาท้ายช่วง, Solution) ในการเรียกครั้งเดียว"""
+    anchors = np.asarray(anchors, dtype=np.float64)
+    window_times, table = window_ranges(times, anchor_ids, ranges, len(anchors), window_sec)
+    return window_times, solve_positions(anchors, table, huber_delta=huber_delta)
+
+
+class RangeLocalizer:
+    """
+    สะสมระยะที่มาถึงแบบ real-time แล้วแก้ตำแหน่งเมื่อช่วงเวลาปิด
+    ถ้าประมวลผลช้ากว่าข้อมูล ช่วงที่ค้างหลายช่วงจะถูกแก้พร้อมกันใน batch เดียว
+    """
+
+    def __init__(self, anchors, window_sec=WINDOW_SEC, huber_delta=HUBER_DELTA_M):
+        self.anchors = np.asarray(anchors, dtype=np.float64)
+        self.window_sec = window_sec
+        self.huber_delta = huber_delta
+        self.t0 = None
+        self.solved_until = None
+        self.times, self.anchor_ids, self.ranges = [], [], []
+        self.n_ranges = 0
+
+    def add(self, anchor_id, t, ranges):
+        if self.t0 is None:
+            self.t0 = self.solved_until = t
+        for r in ranges:
+            self.times.append(t)
+            self.anchor_ids.append(anchor_id)
+            self.ranges.append(r)
+        self.n_ranges += len(ranges)
+
+    def solve_due(self, now):
+        """แก้ทุกช่วงที่ปิดแล้ว ณ เวลา now คืนค่า (เวลาท้ายช่วง, Solution) หรือ None ถ้ายังไม่มีช่วงที่ปิด"""
+        if self.t0 is None:
+            return None
+        cutoff = self.t0 + np.floor((now - self.t0) / self.window_sec) * self.window_sec
+        if cutoff <= self.solved_until:
+            return None
+        self.solved_until = cutoff
+        times = np.asarray(self.times)
+        done = times < cutoff
+        if not done.any():
+            return None
+        anchor_ids, ranges = np.asarray(self.anchor_ids), np.asarray(self.ranges)
+        keep = ~done
+        self.times, self.anchor_ids, self.ranges = list(times[keep]), list(anchor_ids[keep]), list(ranges[keep])
+        window_times, table = window_ranges(times[done], anchor_ids[done], ranges[done],
+                                            len(self.anchors), self.window_sec, self.t0)
+        return window_times, solve_positions(self.anchors, table, huber_delta=self.huber_delta)
+
+
+class RangeReader(threading.Thread):
+    """Thread อ่าน 1 พอร์ต (1 anchor) แล้วส่ง (anchor_id, เวลา monotonic, [ระยะ]) เข้า queue"""
+
+    def __init__(self, anchor_id, port, baud_rate, range_queue, stop_event):
+        super().__init__(name=f"range-reader-{port}", daemon=True)
+        self.anchor_id = anchor_id
+        self.port = port
+        self.baud_rate = baud_rate
+        self.range_queue = range_queue
+        self.stop_event = stop_event
+        self.framer = CsiFramer('text', text_records=True)
+        self.error = None
+
+    def run(self):
+        try:
+            ser = open_serial(self.port, self.baud_rate, timeout=READ_TIMEOUT_SEC)
+        except serial.SerialException as e:
+            self.error = e
+            return
+        try:
+            ser.reset_input_buffer()
+            while not self.stop_event.is_set():
+                read_frames(ser, self.framer)
+                ranges = [r.value for r in self.framer.take_records() if r.kind in RANGE_KINDS]
+                if ranges:
+                    self.range_queue.put((self.anchor_id, time.monotonic(), ranges))
+        except (serial.SerialException, OSError) as e:
+            self.error = e
+        finally:
+            ser.close()
+
+
+def run_multilateration(anchors=ANCHORS, baud_rate=BAUD_RATE, window_sec=WINDOW_SEC):
+    """เปิดทุกพอร์ตพร้อมกัน (1 thread ต่อ anchor) แล้วแสดงตำแหน่งทุกช่วงเวลาจนกด Ctrl+C"""
+    positions = np.array([position for _, position in anchors], dtype=np.float64)
+    n_dims = positions.shape[1]
+    if len(anchors) <= n_dims:
+        print(f"Error: {n_dims}-D multilateration needs at least {n_dims + 1} anchors, got {len(anchors)}.")
+        return
+    try:
+        smoother = make_filter(SMOOTHING_FILTER, n_dims)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    range_queue = queue.Queue()
+    stop_event = threading.Event()
+    readers = [RangeReader(anchor_id, port, baud_rate, range_queue, stop_event)
+               for anchor_id, (port, _) in enumerate(anchors)]
+    localizer = RangeLocalizer(positions, window_sec)
+    for reader in readers:
+        reader.start()
+    print(f"Reading ranges from {len(readers)} anchors ({n_dims}-D, window {window_sec:.2f} s). Ctrl+C to stop.")
+
+    try:
+        while any(reader.is_alive() for reader in readers):
+            try:
+                # รับทุกอย่างที่ค้างใน queue ก่อนแก้ (ช่วงที่ปิดพร้อมกันจึงแก้เป็น batch เดียว)
+                localizer.add(*range_queue.get(timeout=QUEUE_POLL_SEC))
+                while True:
+                    localizer.add(*range_queue.get_nowait())
+            except queue.Empty:
+                pass
+            solved = localizer.solve_due(time.monotonic())
+            if solved is None:
+                continue
+            window_times, solution = solved
+            for t, xyz, rms, outliers in zip(window_times, solution.positions, solution.residual_rms,
+                                             solution.outliers):
+                if not np.all(np.isfinite(xyz)):
+                    continue
+                smoothed = smoother.update(xyz, t)
+                coords = ", ".join(f"{v:.2f}" for v in smoothed)
+                flagged = f" outliers={list(np.flatnonzero(outliers))}" if outliers.any() else ""
+                print(f"Position -> ({coords}) rms={rms:.2f} m{flagged}          ", end='\r')
+    except KeyboardInterrupt:
+        print("\nStopping multilateration.")
+    finally:
+        stop_event.set()
+        for reader in readers:
+            reader.join()
+        for reader in readers:
+            if reader.error is not None:
+                print(f"Error on {reader.port}: {reader.error}")
+        print(f"Ranges received: {localizer.n_ranges}")
+
+
+if __name__ == "__main__":
+    run_multilateration()
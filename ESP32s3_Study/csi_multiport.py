@@ -0,0 +1,181 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import serial
+
+from csi_framer import CsiFramer, attach_rssi, read_frames
+from csi_hub import open_serial
+
+# --- ค่าตั้งต้นของการเก็บข้อมูลหลายพอร์ต ---
+READ_TIMEOUT_SEC = 0.1      # timeout ของ Serial ต่อการอ่าน (ให้ thread เช็คสัญญาณหยุดได้เร็ว)
+WRITE_BATCH_ROWS = 256      # จำนวนเฟรมที่รวมก่อนเขียนลงไฟล์ 1 ครั้ง
+QUEUE_POLL_SEC = 0.05
+
+
+class PortReader(threading.Thread):
+    """Thread อ่าน 1 Serial Port แล้วส่งเฟรมพร้อม device_id และเวลา monotonic ของ host เข้า queue"""
+
+    def __init__(self, device_id, port, baud_rate, framer, frame_queue, stop_event, metrics=None):
+        super().__init__(name=f"csi-reader-{port}", daemon=True)
+        self.metrics = metrics
+        self.device_id = device_id
+        self.port = port
+        self.baud_rate = baud_rate
+        self.framer = framer
+        self.frame_queue = frame_queue
+        self.stop_event = stop_event
+        self.error = None
+
+    def run(self):
+        try:
+            ser = open_serial(self.port, self.baud_rate, timeout=READ_TIMEOUT_SEC)
+        except serial.SerialException as e:
+            self.error = e
+            return
+        try:
+            ser.reset_input_buffer()
+            last_rssi = None
+            while not self.stop_event.is_set():
+                frames = read_frames(ser, self.framer, self.metrics)
+                frames, last_rssi = attach_rssi(self.framer.take_ordered(frames), last_rssi)
+                if frames:
+                    # เฟรมที่อ่านได้ในครั้งเดียวกันมาถึง host พร้อมกัน ใช้เวลาเดียวกัน
+                    self.frame_queue.put((self.device_id, time.monotonic(), frames))
+        except (serial.SerialException, OSError) as e:
+            self.error = e
+        finally:
+            ser.close()
+
+
+class BatchedFrameWriter:
+    """รวมเฟรมจากทุกพอร์ตเป็นบล็อก แล้วเรียก write_block ครั้งเดียวต่อบล็อก"""
+
+    def __init__(self, write_block, n_subcarriers, batch_rows=WRITE_BATCH_ROWS):
+        self.write_block = write_block
+        self.amplitudes = np.zeros((batch_rows, n_subcarriers), dtype=np.float32)
+        self.device_ids = np.zeros(batch_rows, dtype=np.uint16)
+        self.host_times = np.zeros(batch_rows, dtype=np.float64)
+        self.rssi = np.full(batch_rows, np.nan, dtype=np.float32)
+        self.count = 0
+        self.rows_written = 0
+
+    def add(self, device_id, host_time, frames, stop=None):
+        """
+        เพิ่มเฟรมลงบล็อก stop(amplitudes, device_ids) ถูกเรียกทีละแถวที่เพิ่ม (array 1 แถว)
+        คืนค่า True = stop ขอหยุด (เฟรมที่เหลือใน frames ไม่ถูกเพิ่ม)
+        """
+        for frame in frames:
+            amplitudes = frame.amplitudes[:self.amplitudes.shape[1]]
+            row = self.amplitudes[self.count]
+            row[:len(amplitudes)] = amplitudes
+            row[len(amplitudes):] = 0
+            self.device_ids[self.count] = device_id
+            self.host_times[self.count] = host_time
+            self.rssi[self.count] = np.nan if frame.rssi is None else frame.rssi
+            self.count += 1
+            stopped = stop is not None and stop(self.amplitudes[self.count - 1:self.count],
+                                                self.device_ids[self.count - 1:self.count])
+            if self.count == len(self.amplitudes):
+                self.flush()
+            if stopped:
+                return True
+        return False
+
+    def flush(self):
+        if self.count:
+            n = self.count
+            self.write_block(self.amplitudes[:n], self.device_ids[:n], self.host_times[:n], self.rssi[:n])
+            self.rows_written += n
+            self.count = 0
+
+
+class PortCollector:
+    """
+    เปิดทุก Serial Port ครั้งเดียว (1 thread ต่อพอร์ต) แล้วเก็บข้อมูลได้หลายช่วงด้วย collect()
+    ใช้กับการ survey หลายตำแหน่งโดยไม่ต้องปิด/เปิดพอร์ตใหม่ทุกจุด (เฟรมระหว่างช่วงถูกทิ้ง)
+    """
+
+    def __init__(self, ports, n_subcarriers, baud_rate=115200, serial_format='text', metrics=None):
+        """metrics = csi_metrics.IngestMetrics (รวมสถิติของทุกพอร์ต) หรือ None"""
+        self.n_subcarriers = n_subcarriers
+        self.frame_queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.readers = [
+            PortReader(device_id, port, baud_rate,
+                       CsiFramer(serial_format, expected_len=n_subcarriers, text_records=True),
+                       self.frame_queue, self.stop_event, metrics)
+            for device_id, port in enumerate(ports)
+        ]
+        if metrics is not None:
+            for reader in self.readers:
+                metrics.track(reader.framer)
+        for reader in self.readers:
+            reader.start()
+
+    def discard_pending(self):
+        """ทิ้งเฟรมที่ค้างใน queue (เช่นเฟรมที่มาระหว่างย้ายตำแหน่ง)"""
+        while True:
+            try:
+                self.frame_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def collect(self, duration_sec, write_block, batch_rows=WRITE_BATCH_ROWS, stop=None):
+        """
+        เก็บข้อมูลนาน duration_sec วินาที เขียนผ่าน write_block(amplitudes, device_ids, host_times, rssi)
+        stop(amplitudes, device_ids) ถูกเรียกทุกเฟรมที่รับ (ก่อนรอเขียนเป็นบล็อก) คืนค่า True = หยุดทันที
+        คืนค่าจำนวนเฟรมที่เขียน
+        """
+        writer = BatchedFrameWriter(write_block, self.n_subcarriers, batch_rows)
+        deadline = time.monotonic() + duration_sec
+        while time.monotonic() < deadline:
+            try:
+                device_id, host_time, frames = self.frame_queue.get(timeout=QUEUE_POLL_SEC)
+            except queue.Empty:
+                if not any(reader.is_alive() for reader in self.readers):
+                    break
+                continue
+            if writer.add(device_id, host_time, frames, stop):
+                break
+        writer.flush()
+        return writer.rows_written
+
+    def close(self):
+        """หยุดทุก thread แล้วปิดพอร์ต คืนค่าเฟรมที่ยังค้างใน queue"""
+        self.stop_event.set()
+        for reader in self.readers:
+            reader.join()
+        pending = []
+        while True:
+            try:
+                pending.append(self.frame_queue.get_nowait())
+            except queue.Empty:
+                return pending
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def collect_from_ports(ports, duration_sec, write_block, n_subcarriers, baud_rate=115200,
+                       serial_format='text', batch_rows=WRITE_BATCH_ROWS):
+    """
+    เปิดทุก Serial Port พร้อมกัน (1 thread ต่อพอร์ต) แล้วเก็บข้อมูลเป็นเวลา duration_sec
+    เฟรมจากทุกพอร์ตถูกรวมเขียนผ่าน write_block(amplitudes, device_ids, host_times, rssi) ที่เดียว
+    device_id คือลำดับของพอร์ตใน ports, host_times เป็นเวลา time.monotonic(), rssi เป็น NaN ถ้าไม่ทราบ
+    คืนค่า list ของ PortReader (ดูสถิติได้จาก reader.framer และ reader.error)
+    """
+    collector = PortCollector(ports, n_subcarriers, baud_rate, serial_format)
+    try:
+        collector.collect(duration_sec, write_block, batch_rows)
+    finally:
+        # เขียนเฟรมที่เหลือค้างใน queue ให้หมดก่อนปิดไฟล์
+        writer = BatchedFrameWriter(write_block, n_subcarriers, batch_rows)
+        for item in collector.close():
+            writer.add(*item)
+        writer.flush()
+    return collector.readers
@@ -0,0 +1,128 @@
+import json
+from collections import namedtuple
+
+import numpy as np
+
+from csi_capture import DEVICE, LABELS, RSSI, find_captures, open_capture
+
+# --- Log-distance path loss model ฝั่ง host (แทนค่าคงที่ CAL_RSSI_AT_1M / PATH_LOSS_N ในเฟิร์มแวร์) ---
+#   RSSI(d) = rssi_at_1m - 10 * n * log10(d)   ->   d = 10 ^ ((rssi_at_1m - RSSI) / (10 * n))
+# ค่าพารามิเตอร์ fit จากข้อมูล survey ที่รู้ตำแหน่ง (capture ที่มีคอลัมน์ rssi) แยกต่อ anchor (ตัวรับ/AP)
+# แล้วบันทึกเป็น JSON ปรับใหม่ได้โดยไม่ต้อง flash เฟิร์มแวร์
+# sigma_db = ส่วนเบี่ยงเบนของ RSSI รอบเส้นโมเดล (ความไม่แน่นอนของการวัดใน Kalman filter 'kalman-range')
+# ใช้งาน: python csi_pathloss.py [โฟลเดอร์ข้อมูล] (ตั้งตำแหน่ง anchor ใน ANCHOR_POSITIONS)
+
+PATH_LOSS_FILE = 'path_loss.json'
+DEFAULT_RSSI_AT_1M = -45.0      # ค่าเดิมในเฟิร์มแวร์ (ใช้เมื่อยังไม่ได้ calibrate)
+DEFAULT_PATH_LOSS_N = 2.5
+DEFAULT_SIGMA_DB = 4.0
+MIN_DISTANCE_M = 0.1            # ระยะที่ใกล้กว่านี้ไม่ใช้ fit (log10 ไม่เสถียร)
+
+# ตำแหน่ง (x, y) ของแต่ละ anchor ในพิกัดเดียวกับ pos_x, pos_y ของข้อมูล (key = device id / ลำดับพอร์ต)
+ANCHOR_POSITIONS = {0: (0.0, 0.0)}
+
+PathLossModel = namedtuple('PathLossModel', ['rssi_at_1m', 'path_loss_n', 'sigma_db'])
+DEFAULT_MODEL = PathLossModel(DEFAULT_RSSI_AT_1M, DEFAULT_PATH_LOSS_N, DEFAULT_SIGMA_DB)
+
+# 1 anchor: ตำแหน่ง, โมเดล และจำนวนตัวอย่างที่ใช้ fit
+Anchor = namedtuple('Anchor', ['anchor_id', 'position', 'model', 'n_samples'])
+
+
+def fit_path_loss(distances, rssi):
+    """fit rssi_at_1m และ n ด้วย least squares บน log10(ระยะ) คืนค่า PathLossModel"""
+    distances = np.asarray(distances, dtype=np.float64)
+    rssi = np.asarray(rssi, dtype=np.float64)
+    valid = np.isfinite(rssi) & (distances >= MIN_DISTANCE_M)
+    distances, rssi = distances[valid], rssi[valid]
+    if len(np.unique(np.round(distances, 2))) < 2:
+        raise ValueError("need RSSI samples from at least 2 different distances to fit the path loss model")
+    design = np.column_stack([np.ones(len(distances)), -10.0 * np.log10(distances)])
+    (rssi_at_1m, path_loss_n), *_ = np.linalg.lstsq(design, rssi, rcond=None)
+    residual = rssi - design @ (rssi_at_1m, path_loss_n)
+    return PathLossModel(float(rssi_at_1m), float(path_loss_n), float(np.sqrt(np.mean(residual ** 2))))
+
+
+def rssi_to_distance(model, rssi):
+    """แปลง RSSI (dBm, scalar หรือ array) เป็นระยะ (เมตร)"""
+    return 10.0 ** ((model.rssi_at_1m - np.asarray(rssi, dtype=np.float64)) / (10.0 * model.path_loss_n))
+
+
+def load_survey_rssi(folder_path):
+    """รวม (labels, rssi, device) ของทุก capture ที่มีคอลัมน์ rssi ในโฟลเดอร์"""
+    labels, rssi, devices = [], [], []
+    for path in find_captures(folder_path):
+        capture = open_capture(path)
+        if RSSI not in capture:
+            continue
+        n = len(capture[LABELS])
+        labels.append(np.asarray(capture[LABELS], dtype=np.float64))
+        rssi.append(np.asarray(capture[RSSI], dtype=np.float64).reshape(-1))
+        devices.append(np.asarray(capture[DEVICE]).reshape(-1) if DEVICE in capture else np.zeros(n, dtype=np.int64))
+    if not labels:
+        return None
+    return np.concatenate(labels), np.concatenate(rssi), np.concatenate(devices)
+
+
+def calibrate(labels, rssi, devices, anchor_positions=ANCHOR_POSITIONS):
+    """fit โมเดลแยกต่อ anchor จากตำแหน่งที่รู้ (labels) คืน list ของ Anchor"""
+    anchors = []
+    for anchor_id, position in sorted(anchor_positions.items()):
+        mine = devices == anchor_id
+        if not mine.any():
+            print(f"Warning: no RSSI samples for anchor {anchor_id}, skipping.")
+            continue
+        position = np.asarray(position, dtype=np.float64)
+        distances = np.linalg.norm(labels[mine] - position, axis=1)
+        model = fit_path_loss(distances, rssi[mine])
+        anchors.append(Anchor(anchor_id, position, model, int(np.isfinite(rssi[mine]).sum())))
+    return anchors
+
+
+def save_calibration(anchors, path=PATH_LOSS_FILE):
+    data = {'anchors': [
+        {'id': int(a.anchor_id), 'position': [float(v) for v in a.position], 'n_samples': a.n_samples,
+         **a.model._asdict()}
+        for a in anchors
+    ]}
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def load_calibration(path=PATH_LOSS_FILE):
+    """โหลดไฟล์ calibration คืน dict {anchor_id: Anchor}"""
+    with open(path) as f:
+        data = json.load(f)
+    anchors = {}
+    for entry in data['anchors']:
+        model = PathLossModel(entry['rssi_at_1m'], entry['path_loss_n'], entry['sigma_db'])
+        anchors[entry['id']] = Anchor(entry['id'], np.asarray(entry['position'], dtype=np.float64),
+                                      model, entry.get('n_samples', 0))
+    return anchors
+
+
+def format_calibration(anchors):
+    lines = [f"{'anchor':>6} {'position':>14} {'RSSI@1m':>9} {'n':>6} {'sigma dB':>9} {'samples':>8}"]
+    for a in anchors:
+        position = f"({a.position[0]:.2f}, {a.position[1]:.2f})"
+        lines.append(f"{a.anchor_id:>6} {position:>14} {a.model.rssi_at_1m:>9.2f} "
+                     f"{a.model.path_loss_n:>6.2f} {a.model.sigma_db:>9.2f} {a.n_samples:>8}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    survey = load_survey_rssi(folder)
+    if survey is None:
+        print(f"Error: No captures with an '{RSSI}' column found in '{folder}'.")
+        print("Collect data with csi_collector.py (OUTPUT_FORMAT = 'capture') first.")
+        sys.exit(1)
+    try:
+        anchors = calibrate(*survey)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(format_calibration(anchors))
+    save_calibration(anchors)
+    print(f"\nCalibration saved to '{PATH_LOSS_FILE}'")
@@ -0,0 +1,83 @@
+import numpy as np
+
+# --- แปลง I/Q ดิบจาก ESP32 (เฟรม FLAG_IQ) เป็น feature amplitude + phase ทีละบล็อกของเฟรม ---
+# buffer CSI ของ ESP32 (LLTF, 20 MHz): subcarrier ละ 2 ไบต์ [imag, real] เรียงแบบ FFT
+#   ตำแหน่ง 0..31 = subcarrier 0..31, ตำแหน่ง 32..63 = subcarrier -32..-1
+# ใช้เฉพาะ subcarrier ±1..±26 (52 ตัว: data + pilot) ตัด DC (0) และ guard (±27..±32) ที่ไม่มีสัญญาณ
+# phase ที่วัดได้มี offset สุ่มทุกเฟรมจาก CFO / SFO / STO ของตัวรับ: phase(k) = จริง(k) + a*k + b
+# sanitize: unwrap ตามแกน subcarrier แล้วลบเส้นตรง a*k + b ที่ fit แบบ least squares ของแต่ละเฟรม
+# ทั้งบล็อกคำนวณด้วย matrix เดียว (ไม่มี loop ต่อเฟรม) เหลือส่วนที่ขึ้นกับ multipath / ตำแหน่ง
+# เฟรมที่ยาวกว่า 64 subcarrier (HT-LTF / STBC ต่อท้าย) ใช้เฉพาะ 64 ตัวแรก (LLTF)
+
+LTF_SUBCARRIERS = 64
+MAX_SUBCARRIER_INDEX = 26
+# 'amplitude' = amplitude ทุก subcarrier ของ LLTF (เท่ากับเฟรม amplitude เดิม)
+# 'amp+phase' = amplitude + phase ที่ sanitize แล้วของ subcarrier ที่ใช้ (52 + 52)
+# 'phase'     = phase ที่ sanitize แล้วอย่างเดียว
+FEATURE_MODES = ('amplitude', 'amp+phase', 'phase')
+
+
+def subcarrier_layout(n_sc=LTF_SUBCARRIERS, max_index=MAX_SUBCARRIER_INDEX):
+    """คืนค่า (ตำแหน่งใน buffer, หมายเลข subcarrier k) ของ subcarrier ที่ใช้ เรียงตาม k จากน้อยไปมาก"""
+    k = np.fft.fftfreq(n_sc, 1.0 / n_sc).astype(np.int64)
+    columns = np.flatnonzero((k != 0) & (np.abs(k) <= max_index))
+    columns = columns[np.argsort(k[columns])]
+    return columns, k[columns]
+
+
+def iq_to_complex(iq, n_sc=LTF_SUBCARRIERS):
+    """บล็อก I/Q int8 (N, 2 x n) แบบ [imag, real] -> complex64 (N, n_sc) ของ n_sc subcarrier แรก"""
+    iq = np.atleast_2d(iq)
+    if iq.shape[1] < 2 * n_sc:
+        raise ValueError(f"expected at least {2 * n_sc} I/Q values per frame, got {iq.shape[1]}")
+    pairs = iq[:, :2 * n_sc].reshape(len(iq), n_sc, 2)
+    csi = np.empty((len(iq), n_sc), dtype=np.complex64)
+    csi.real = pairs[:, :, 1]
+    csi.imag = pairs[:, :, 0]
+    return csi
+
+
+def sanitize_phase(csi, k):
+    """
+    phase ของบล็อก complex (N, len(k)) หลัง unwrap และลบ a*k + b ของแต่ละเฟรม
+    slope / intercept ของทุกเฟรมได้จาก matrix-vector product ครั้งเดียว
+    """
+    phase = np.unwrap(np.angle(csi), axis=1)
+    centered = (k - k.mean()).astype(phase.dtype)
+    slope = phase @ centered / (centered @ centered)
+    intercept = phase.mean(axis=1)
+    return phase - slope[:, None] * centered - intercept[:, None]
+
+
+def feature_count(mode, n_sc=LTF_SUBCARRIERS):
+    n_active = len(subcarrier_layout(n_sc)[0])
+    return {'amplitude': n_sc, 'amp+phase': 2 * n_active, 'phase': n_active}[mode]
+
+
+def feature_names(mode, n_sc=LTF_SUBCARRIERS):
+    """ชื่อคอลัมน์ของ feature (sc_i สำหรับ amplitude เดิม, amp_k / phase_k ตามหมายเลข subcarrier)"""
+    if mode == 'amplitude':
+        return [f"sc_{i}" for i in range(n_sc)]
+    k = subcarrier_layout(n_sc)[1]
+    names = [f"phase_{v}" for v in k]
+    return [f"amp_{v}" for v in k] + names if mode == 'amp+phase' else names
+
+
+def iq_features(iq, mode='amp+phase'):
+    """
+    บล็อก I/Q ดิบ (N, 2 x n_sc) -> feature float32 (N, feature_count(mode))
+    เฟรมที่ I/Q เป็น 0 ทั้งหมด (เช่นแถวที่ไม่มี I/Q) ได้ NaN ให้ถูกทิ้งเหมือนแถวเสีย
+    """
+    if mode not in FEATURE_MODES:
+        raise ValueError(f"unknown feature mode '{mode}' (expected one of {FEATURE_MODES})")
+    csi = iq_to_complex(iq)
+    if mode == 'amplitude':
+        features = np.abs(csi)
+    else:
+        columns, k = subcarrier_layout()
+        csi = csi[:, columns]
+        phase = sanitize_phase(csi, k)
+        features = np.hstack([np.abs(csi), phase]) if mode == 'amp+phase' else phase
+    features = features.astype(np.float32, copy=False)
+    features[~np.asarray(iq).reshape(len(csi), -1).any(axis=1)] = np.nan
+    return features
@@ -1,38 +1,215 @@
 import serial
 import numpy as np
-import joblib # Library สำหรับโหลดโมเดล
 import os
-from collections import deque
+import time
+
+import csi_compress # ให้ joblib โหลดโมเดลแบบบีบอัด (PCA + prototype) ได้
+import csi_index # ให้ joblib โหลดโมเดลแบบ fingerprint index (brute / ivf) ได้
+from csi_artifact import load_model
+from csi_filters import make_filter
+from csi_framer import CsiFramer, read_frames
+from csi_hub import open_serial
+from csi_metrics import IngestMetrics, create_metrics
+from csi_motion import MotionDetector, format_event
+from csi_pathloss import PATH_LOSS_FILE, load_calibration
+from csi_phase import LTF_SUBCARRIERS, feature_count, iq_features
+from csi_protocol import RECORD_RSSI
+from csi_service import SERVICE_HOST, SERVICE_PORT, ModelWatcher, PositionServer, add_service_metrics
 
 # ---!!! ตั้งค่าที่สำคัญ !!!---
-SERIAL_PORT = 'COM10'  # <--- แก้ไข Port ของคุณตรงนี้
+SERIAL_PORT = 'COM10'  # <--- แก้ไข Port ของคุณตรงนี้ ('hub://127.0.0.1:5760' หรือ 'shm://csi_frames' = อ่านผ่าน csi_hub.py)
 BAUD_RATE = 115200
 MODEL_FILENAME = 'csi_knn_model.joblib' # ชื่อไฟล์โมเดลที่บันทึกไว้
+# ถ้ามี artifact (export จาก train_model.py) จะใช้แทน MODEL_FILENAME: โหลดเร็วด้วย memory-map ใช้ numpy อย่างเดียว
+# (ไม่ต้องติดตั้ง sklearn / joblib) ดู csi_artifact.py
+MODEL_ARTIFACT = 'csi_knn_model.csimodel'
+SERIAL_FORMAT = 'text' # 'text' = CSI_DATA,... (เดิม), 'binary' = เฟรมไบนารี, 'auto' = รับทั้งสองแบบ
+INDEX_N_PROBE = None # ปรับ recall/latency ของโมเดลแบบ 'ivf' ตอนใช้งาน (None = ใช้ค่าจากตอนฝึก)
+# feature ที่โมเดลใช้ (ต้องตรงกับ FEATURE_MODE ตอนฝึก) None = อ่านจาก artifact (ไม่มี = 'amplitude')
+# 'amp+phase' / 'phase' ต้องใช้เฟิร์มแวร์ CSI_IQ_OUTPUT 1 (เฟรมที่ไม่มี I/Q จะถูกข้าม)
+FEATURE_MODE = None
+
+# ค่าสำหรับ Smoothing ผลลัพธ์ (ทำให้ค่าพิกัดนิ่งขึ้น) ดูตัวกรองทั้งหมดใน csi_filters.py
+# 'moving-average' (เดิม), 'ema', 'median', 'hampel', 'kalman' (ติดตามตำแหน่ง+ความเร็ว) หรือ 'none'
+SMOOTHING_FILTER = 'moving-average'
+SMOOTHING_WINDOW_SIZE = 5       # สำหรับ moving-average / median / hampel
+EMA_ALPHA = 0.3                 # สำหรับ ema: มาก = ตอบสนองเร็ว
+KALMAN_PROCESS_NOISE = 0.5      # สำหรับ kalman: มาก = ตามการเคลื่อนที่เร็วขึ้น
+KALMAN_MEASUREMENT_NOISE = 0.25 # สำหรับ kalman: มาก = นิ่งขึ้น
+
+# ---!!! รวม RSSI เข้ากับ CSI !!!---
+# 'csi'      = ใช้แค่ fingerprint (เดิม)
+# 'csi+rssi' = รวม RSSI จาก anchor (log-distance model ที่ calibrate ไว้: python csi_pathloss.py -> PATH_LOSS_FILE)
+#              กับพิกัดจาก CSI ด้วย Kalman filter ('kalman-range' แทน SMOOTHING_FILTER)
+#              ใช้ RSSI ในเฟรมไบนารี หรือบรรทัด RSSI,<n> ของเฟิร์มแวร์ ปรับ 1 ครั้งต่อ batch
+FUSION_MODE = 'csi'
+RSSI_ANCHOR_ID = 0              # anchor (ตาม PATH_LOSS_FILE) ที่ RSSI จาก port นี้วัดเทียบ
+
+# ---!!! Micro-batching สำหรับการทำนาย !!!---
+# รวมหลายเฟรมแล้วเรียก model.predict ครั้งเดียว ลด overhead ของ sklearn ต่อเฟรม
+BATCH_MAX_FRAMES = 1        # 1 = ทำนายทีละเฟรม (เดิม), เช่น 32 = รวมได้สูงสุด 32 เฟรมต่อครั้ง
+BATCH_WINDOW_SEC = 0.05     # รอรวมเฟรมไม่เกินเวลานี้ (วินาที) ก่อนทำนาย
+STATS_INTERVAL_SEC = 5.0    # รายงาน frames/s และ latency ทุกกี่วินาที (0 = ไม่รายงาน)
+
+# ---!!! ตรวจจับการเคลื่อนไหว / การมีคน (csi_motion.py) !!!---
+# True = ป้อนทุกเฟรมให้ MotionDetector ด้วย แล้วพิมพ์ motion_start / motion_stop / presence_* แยกบรรทัด
+# (ตั้งค่า threshold ได้ใน csi_motion.py, 5 วินาทีแรกเป็นช่วงเรียนรู้ baseline ของห้อง)
+MOTION_DETECTION = False
+
+# ---!!! รันเป็น service ต่อเนื่อง (csi_service.py) !!!---
+# True = โหลดโมเดลใหม่เองเมื่อ train_model.py บันทึกทับ (ไม่ต้องปิดโปรแกรม ไม่มีเฟรมหาย)
+#        และเปิด HTTP ที่ SERVICE_HOST:SERVICE_PORT: /latest, /stream (JSON ทีละบรรทัด), /status
+# โมเดลใหม่ต้องใช้ feature ชุดเดิม (จำนวนและ FEATURE_MODE เดียวกัน) ไม่เช่นนั้นใช้โมเดลเดิมต่อ
+SERVICE_MODE = False
+
+# ---!!! Metrics (csi_metrics.py) !!!---
+# None = ปิด, 'log' = พิมพ์สรุปทุก 10 วินาที, 'http' = http://127.0.0.1:9108/metrics (Prometheus), 'log+http'
+# วัดเวลา parse / predict / smoothing / latency ต่อเฟรม และนับเฟรมที่รับ / ทิ้ง / เสีย
+METRICS_EXPORT = None
+
+class FrameBatcher:
+    """พักเฟรมไว้ใน array ที่จองล่วงหน้า จนครบจำนวนหรือครบเวลา แล้วส่งออกเป็น batch"""
+
+    def __init__(self, n_features, max_frames=BATCH_MAX_FRAMES, window_sec=BATCH_WINDOW_SEC,
+                 feature_mode='amplitude'):
+        self.n_features = n_features
+        self.window_sec = window_sec
+        self.feature_mode = feature_mode
+        self.features = np.empty((max_frames, n_features), dtype=np.float32)
+        # โหมด phase พัก I/Q ดิบไว้ แล้วคำนวณ feature ทั้ง batch พร้อมกันตอน take()
+        self.iq = np.empty((max_frames, 2 * LTF_SUBCARRIERS), dtype=np.int8) if feature_mode != 'amplitude' else None
+        self.skipped = 0    # เฟรมที่ไม่มี I/Q (โหมด phase)
+        self.device_times = np.empty(max_frames)    # timestamp ของบอร์ด (วินาที, NaN = เฟรมข้อความไม่มี)
+        self.host_times = np.empty(max_frames)      # time.time() ตอนเฟรมมาถึง host
+        self.arrival_times = np.empty(max_frames)   # time.perf_counter() ตอนเฟรมมาถึง
+        self.count = 0
+
+    def add(self, frame, arrival_time, host_time):
+        """เพิ่ม 1 เฟรม คืนค่า True ถ้า batch เต็มแล้ว"""
+        if self.iq is not None:
+            if frame.iq is None or len(frame.iq) < self.iq.shape[1] or not frame.iq.any():
+                self.skipped += 1
+                return False
+            self.iq[self.count] = frame.iq[:self.iq.shape[1]]
+        else:
+            self.features[self.count] = frame.amplitudes[:self.n_features]
+        self.device_times[self.count] = frame.timestamp_us / 1e6 if frame.timestamp_us is not None else np.nan
+        self.host_times[self.count] = host_time
+        self.arrival_times[self.count] = arrival_time
+        self.count += 1
+        return self.count == len(self.features)
+
+    def due(self, now):
+        """ครบเวลารอของเฟรมแรกใน batch แล้วหรือยัง"""
+        return self.count > 0 and now - self.arrival_times[0] >= self.window_sec
+
+    def take(self):
+        """คืนค่า (features, device_times, host_times, arrival_times) ของ batch ปัจจุบันแล้วเริ่ม batch ใหม่"""
+        n = self.count
+        self.count = 0
+        if self.iq is not None:
+            self.features[:n] = iq_features(self.iq[:n], self.feature_mode)
+        return self.features[:n], self.device_times[:n], self.host_times[:n], self.arrival_times[:n]
+
+class PredictionStats:
+    """นับ frames/s, ขนาด batch และ latency ต่อเฟรม (ตั้งแต่เฟรมมาถึงจนทำนายเสร็จ)"""
+
+    def __init__(self, interval_sec=STATS_INTERVAL_SEC):
+        self.interval_sec = interval_sec
+        self.reset(time.perf_counter())
+
+    def reset(self, now):
+        self.start = now
+        self.frames = 0
+        self.batches = 0
+        self.latencies = []
+
+    def record(self, arrival_times, done_time):
+        self.frames += len(arrival_times)
+        self.batches += 1
+        self.latencies.append(done_time - arrival_times)
+
+    def report(self, now):
+        """คืนข้อความสรุปเมื่อครบช่วงเวลา (หรือ None)"""
+        if self.interval_sec <= 0 or now - self.start < self.interval_sec or not self.frames:
+            return None
+        latencies_ms = np.concatenate(self.latencies) * 1000
+        line = (f"[stats] {self.frames / (now - self.start):.1f} frames/s, "
+                f"batch avg {self.frames / self.batches:.1f}, "
+                f"latency p50 {np.percentile(latencies_ms, 50):.1f} ms / "
+                f"p99 {np.percentile(latencies_ms, 99):.1f} ms")
+        self.reset(now)
+        return line
+
+class PredictorMetrics:
+    """metrics ของการทำนาย วัดครั้งละ 1 batch (ไม่เพิ่มงานต่อเฟรม)"""
+
+    def __init__(self, registry, batcher):
+        self.predict = registry.histogram('csi_predict_seconds', 'model.predict time per batch')
+        self.smooth = registry.histogram('csi_smooth_seconds', 'Smoothing and RSSI fusion time per batch')
+        self.latency = registry.histogram('csi_frame_latency_seconds', 'Time from frame arrival to its prediction')
+        self.positions = registry.counter('csi_positions_total', 'Frames turned into positions')
+        skipped = registry.counter('csi_frames_skipped_total', 'Frames without I/Q skipped in phase feature modes')
+        registry.add_collector(lambda: setattr(skipped, 'value', batcher.skipped))
 
-# ค่าสำหรับ Smoothing ผลลัพธ์ (ทำให้ค่าพิกัดนิ่งขึ้น)
-SMOOTHING_WINDOW_SIZE = 5
-prediction_history = deque(maxlen=SMOOTHING_WINDOW_SIZE)
+    def observe_batch(self, arrival_times, predict_start, predict_done, smooth_done):
+        self.predict.observe(predict_done - predict_start)
+        self.smooth.observe(smooth_done - predict_done)
+        self.latency.observe_many(predict_done - arrival_times)
+        self.positions.inc(len(arrival_times))
+
+def predict_batch(model, features):
+    """ทำนายตำแหน่งของทั้ง batch ด้วยการเรียก model.predict ครั้งเดียว คืนค่า array (N, 2)"""
+    return np.asarray(model.predict(features))
+
+def load_predictor_model(model_path, mmap=True):
+    """โหลดโมเดลและตรวจ feature mode คืนค่า (model, feature_mode) (โยน exception ถ้าใช้ไม่ได้)"""
+    model = load_model(model_path, mmap=mmap)
+    index = model.index_ if isinstance(model, csi_compress.CompressedFingerprintModel) else model
+    if INDEX_N_PROBE is not None and isinstance(index, csi_index.IVFIndex):
+        index.n_probe = INDEX_N_PROBE
+    feature_mode = FEATURE_MODE or getattr(model, 'manifest_', {}).get('metadata', {}).get('feature_mode', 'amplitude')
+    if feature_mode != 'amplitude' and feature_count(feature_mode) != model.n_features_in_:
+        raise ValueError(f"feature mode '{feature_mode}' gives {feature_count(feature_mode)} features, "
+                         f"model expects {model.n_features_in_}")
+    return model, feature_mode
+
+def make_smoother(name=None):
+    """ตัวกรองพิกัด (x, y) ตามค่าตั้ง smoothing ด้านบน (None = SMOOTHING_FILTER) ใช้ร่วมกับ csi_relocalize.py"""
+    return make_filter(name or SMOOTHING_FILTER, 2, window=SMOOTHING_WINDOW_SIZE, alpha=EMA_ALPHA,
+                       process_noise=KALMAN_PROCESS_NOISE, measurement_noise=KALMAN_MEASUREMENT_NOISE)
+
+def model_version(model, model_path):
+    """เวลาที่สร้างโมเดล (จาก manifest ของ artifact หรือเวลาแก้ไขไฟล์) ใช้บอก client ว่าตำแหน่งมาจากโมเดลไหน"""
+    created = getattr(model, 'manifest_', {}).get('created')
+    return created or time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(os.path.getmtime(model_path)))
 
 def predict_location_realtime():
     """ฟังก์ชันหลักสำหรับทำนายตำแหน่งแบบ Real-time"""
     
     # 1. โหลดโมเดลที่ฝึกสอนไว้แล้ว
-    print(f"Loading model from '{MODEL_FILENAME}'...")
-    if not os.path.exists(MODEL_FILENAME):
-        print(f"Error: Model file '{MODEL_FILENAME}' not found.")
+    model_path = MODEL_ARTIFACT if os.path.exists(MODEL_ARTIFACT) else MODEL_FILENAME
+    print(f"Loading model from '{model_path}'...")
+    if not os.path.exists(model_path):
+        print(f"Error: Model file '{model_path}' not found.")
         print("Please run train_model.py to create the model first.")
         return
         
     try:
-        model = joblib.load(MODEL_FILENAME)
-        print("Model loaded successfully!")
+        # service อ่าน artifact เข้าหน่วยความจำทั้งหมด (ไม่ memory-map) เพื่อไม่ให้ไฟล์ถูกเปิดค้างไว้
+        # Windows แทนที่ไฟล์ที่ถูก map อยู่ไม่ได้ train_model.py จะ export โมเดลใหม่ทับไม่สำเร็จ
+        model, feature_mode = load_predictor_model(model_path, mmap=not SERVICE_MODE)
+        model_name = model_version(model, model_path)
+        print(f"Model loaded successfully! (features: {feature_mode})")
     except Exception as e:
         print(f"Error loading model: {e}")
         return
 
     # 2. เปิดการเชื่อมต่อ Serial Port
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=2)
+        # โหมด batch ใช้ timeout สั้น เพื่อให้ batch ที่ค้างอยู่ถูกทำนายตรงเวลาแม้ข้อมูลหยุดมา
+        timeout = BATCH_WINDOW_SEC if BATCH_MAX_FRAMES > 1 else 2
+        ser = open_serial(SERIAL_PORT, BAUD_RATE, timeout=timeout)
         ser.flushInput()
         print(f"Connected to {SERIAL_PORT}. Waiting for CSI data...")
     except serial.SerialException as e:
@@ -40,38 +217,150 @@ def predict_location_realtime():
         return
 
     # 3. วนลูปเพื่ออ่านข้อมูลและทำนายตำแหน่ง
+    # ตรวจสอบว่าจำนวน Feature ตรงกับที่โมเดลเคยเรียนรู้มาหรือไม่ (เฟรมที่สั้นกว่าจะถูกทิ้ง)
+    use_rssi = FUSION_MODE == 'csi+rssi'
+    min_len = model.n_features_in_ if feature_mode == 'amplitude' else LTF_SUBCARRIERS
+    framer = CsiFramer(SERIAL_FORMAT, min_len=min_len, text_records=use_rssi)
+    batcher = FrameBatcher(model.n_features_in_, BATCH_MAX_FRAMES, BATCH_WINDOW_SEC, feature_mode)
+    stats = PredictionStats(STATS_INTERVAL_SEC)
+    detector = MotionDetector(min_len) if MOTION_DETECTION else None
+    anchor = None
+    pending_rssi = []   # ค่า RSSI ที่ยังไม่ได้ใช้ (จากเฟรมไบนารีหรือบรรทัด RSSI)
+    watcher = server = None
+    exporter = ingest = predictor_metrics = None
+
+    def reload_model(path):
+        # ทำงานใน thread ของ watcher: โหลดและตรวจให้เสร็จก่อน ลูปหลักแค่สลับ reference
+        new_model, new_mode = load_predictor_model(path, mmap=False)
+        if new_mode != feature_mode or new_model.n_features_in_ != model.n_features_in_:
+            raise ValueError(f"new model uses {new_model.n_features_in_} '{new_mode}' features, running model "
+                             f"uses {model.n_features_in_} '{feature_mode}' (restart to switch)")
+        return new_model
+
+    def service_status():
+        return {'model': model_path, 'model_version': model_name, 'feature_mode': feature_mode,
+                'reloads': watcher.reloads, 'reload_failures': watcher.failures,
+                'stream_quality': framer.stats_line()}
+
+    try:
+        metrics, exporter = create_metrics(METRICS_EXPORT)
+        if metrics is not None:
+            ingest = IngestMetrics(metrics)
+            ingest.track(framer)
+            predictor_metrics = PredictorMetrics(metrics, batcher)
+        if use_rssi:
+            anchor = load_calibration(PATH_LOSS_FILE).get(RSSI_ANCHOR_ID)
+            if anchor is None:
+                raise ValueError(f"anchor {RSSI_ANCHOR_ID} not found in '{PATH_LOSS_FILE}'")
+            print(f"RSSI fusion: anchor {RSSI_ANCHOR_ID} at {tuple(anchor.position)}, "
+                  f"RSSI@1m={anchor.model.rssi_at_1m:.1f} dBm, n={anchor.model.path_loss_n:.2f}")
+        smoother = make_smoother('kalman-range' if use_rssi else None)
+        if SERVICE_MODE:
+            server = PositionServer(SERVICE_HOST, SERVICE_PORT, service_status).start()
+            watcher = ModelWatcher(model_path, reload_model).start()
+            if metrics is not None:
+                add_service_metrics(metrics, watcher, server)
+            print(f"Service: http://{server.address[0]}:{server.address[1]}/latest (/stream, /status), "
+                  f"watching '{model_path}' for new models")
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        if watcher is not None:
+            watcher.stop()
+        if server is not None:
+            server.close()
+        if exporter is not None:
+            exporter.close()
+        ser.close()
+        return
+
+    def run_batch():
+        features, device_times, host_times, arrival_times = batcher.take()
+        if not len(features):
+            return
+        # ตัวกรองใช้เวลาของบอร์ด (ช่วงห่างระหว่างเฟรมแม่นกว่า) ถ้าไม่มีใช้เวลาที่มาถึง host
+        frame_times = np.where(np.isnan(device_times), host_times, device_times)
+        
+        # --- การทำนายตำแหน่ง (ครั้งเดียวทั้ง batch) ---
+        predict_start = time.perf_counter()
+        predicted = predict_batch(model, features)
+        predict_done = time.perf_counter()
+        stats.record(arrival_times, predict_done)
+        
+        # ผลลัพธ์แต่ละแถวตรงกับเฟรมลำดับเดียวกันใน batch: แถวละ (t, x, y) โดย t = เวลาที่เฟรมมาถึง host
+        positions = np.empty((len(predicted), 3))
+        positions[:, 0] = host_times
+        for i, (frame_time, predicted_xy) in enumerate(zip(frame_times, predicted)):
+            # --- Smoothing ผลลัพธ์ ---
+            # กรองค่าที่ทำนายได้ทีละเฟรม (state อยู่ในตัวกรอง ไม่ต้องเฉลี่ยประวัติทั้งหมดใหม่)
+            positions[i, 1:] = smoother.update(predicted_xy, frame_time)
+        
+        if pending_rssi:
+            # RSSI ทั้งหมดที่มาถึงระหว่าง batch เฉลี่ยเป็นค่าเดียว ปรับตำแหน่งของเฟรมสุดท้าย (งานต่อเฟรมไม่เพิ่มขึ้น)
+            model_rssi = anchor.model
+            positions[-1, 1:] = smoother.update_rssi(anchor.position, [np.mean(pending_rssi)], model_rssi.rssi_at_1m,
+                                                     model_rssi.path_loss_n, model_rssi.sigma_db, frame_times[-1])
+            pending_rssi.clear()
+        if predictor_metrics is not None:
+            predictor_metrics.observe_batch(arrival_times, predict_start, predict_done, time.perf_counter())
+        
+        if server is not None:
+            # ทุกเฟรมเป็น 1 ข้อความ (device_t = เวลาของบอร์ดถ้ามี)
+            for (t, pos_x, pos_y), device_t in zip(positions, device_times):
+                server.publish_position(pos_x, pos_y, t, model_name, device_t)
+        
+        # แสดงผลลัพธ์ล่าสุด (ใช้ \r เพื่อให้แสดงผลทับบรรทัดเดิม)
+        t, pos_x, pos_y = positions[-1]
+        print(f"Predicted Location -> X: {pos_x:.2f}, Y: {pos_y:.2f} (t={t:.3f})   ", end='\r')
+
     try:
         while True:
-            line = ser.readline().decode('utf-8').strip()
+            # สลับเป็นโมเดลที่โหลดเสร็จแล้ว (ระหว่าง batch: แต่ละ batch ทำนายด้วยโมเดลเดียว)
+            new_model = watcher.take() if watcher is not None else None
+            if new_model is not None:
+                model = new_model
+                model_name = model_version(model, model_path)
+                print(f"\nModel reloaded from '{model_path}' ({model_name}).")
             
-            if line.startswith('CSI_DATA,'):
-                # เตรียมข้อมูล CSI ให้อยู่ในรูปแบบที่โมเดลต้องการ
-                parts = line.split(',')[1:]
-                csi_values_str = [p for p in parts if p]
-                
-                # ตรวจสอบว่าจำนวน Feature ตรงกับที่โมเดลเคยเรียนรู้มาหรือไม่
-                if len(csi_values_str) >= model.n_features_in_:
-                    csi_features = np.array(csi_values_str[:model.n_features_in_], dtype=float).reshape(1, -1)
-                    
-                    # --- การทำนายตำแหน่ง ---
-                    predicted_xy = model.predict(csi_features)[0]
-                    prediction_history.append(predicted_xy)
-                    
-                    # --- Smoothing ผลลัพธ์ ---
-                    # นำค่าที่ทำนายได้ย้อนหลังมาหาค่าเฉลี่ยเพื่อให้ตำแหน่งนิ่งขึ้น
-                    smoothed_prediction = np.mean(prediction_history, axis=0)
-                    
-                    pos_x = smoothed_prediction[0]
-                    pos_y = smoothed_prediction[1]
-                    
-                    # แสดงผลลัพธ์ (ใช้ \r เพื่อให้แสดงผลทับบรรทัดเดิม)
-                    print(f"Predicted Location -> X: {pos_x:.2f}, Y: {pos_y:.2f}   ", end='\r')
+            frames = read_frames(ser, framer, ingest)
+            arrival_time = time.perf_counter()
+            host_time = time.time()
+            if use_rssi:
+                pending_rssi.extend(frame.rssi for frame in frames if frame.rssi is not None)
+                pending_rssi.extend(r.value for r in framer.take_records() if r.kind == RECORD_RSSI)
+            for frame in frames:
+                if detector is not None:
+                    t = frame.timestamp_us / 1e6 if frame.timestamp_us is not None else host_time
+                    for event in detector.update(frame.amplitudes, t):
+                        print(f"\n{format_event(event)}")
+                        if server is not None:
+                            server.publish_event(event)
+                if batcher.add(frame, arrival_time, host_time):
+                    run_batch()
+            
+            now = time.perf_counter()
+            if batcher.due(now):
+                run_batch()
+            
+            stats_line = stats.report(now)
+            if stats_line:
+                print(f"\n{stats_line}")
+            if server is not None:
+                server.flush()
                 
     except KeyboardInterrupt:
         print("\nStopping prediction.")
+        print(f"Stream quality: {framer.stats_line()}")
+        if batcher.skipped:
+            print(f"Skipped {batcher.skipped} frames without I/Q (feature mode '{feature_mode}')")
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
+        if watcher is not None:
+            watcher.stop()
+        if server is not None:
+            server.close()
+        if exporter is not None:
+            exporter.close()
         if 'ser' in locals() and ser.is_open:
             ser.close()
             print("\nSerial port closed.")
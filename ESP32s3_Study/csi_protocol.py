@@ -0,0 +1,170 @@
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+# --- รูปแบบข้อมูล CSI ที่รับจาก ESP32 ---
+# 1) แบบข้อความ (เดิม):  CSI_DATA,<amp0>,<amp1>,...\n
+# 2) แบบไบนารี (ใหม่):   [SYNC][HEADER][PAYLOAD][CRC32]
+#
+# HEADER (little-endian):
+#   sync(2) version(1) flags(1) payload_len(2) seq(4) timestamp_us(8) rssi(1) n_sc(1)
+# PAYLOAD (n_sc x 2 ไบต์ ตาม flags):
+#   flags = 0:       int16 x n_sc (ค่า amplitude x AMP_SCALE)
+#   flags = FLAG_IQ: int8 คู่ [imag, real] x n_sc ตามที่ได้จาก Wi-Fi driver (CSI_IQ_OUTPUT ในเฟิร์มแวร์)
+#                    host คำนวณ amplitude เอง และเก็บ I/Q ไว้ใน CsiFrame.iq สำหรับ phase (ดู csi_phase.py)
+# CRC32: คำนวณตั้งแต่ version ถึงไบต์สุดท้ายของ payload (ไม่รวม sync)
+
+TEXT_PREFIX = b'CSI_DATA,'
+BINARY_SYNC = b'\xC5\x1A'
+BINARY_VERSION = 1
+AMP_SCALE = 100.0           # ต้องตรงกับ CSI_AMP_SCALE ในเฟิร์มแวร์
+FLAG_IQ = 0x01              # ต้องตรงกับ CSI_FLAG_IQ ในเฟิร์มแวร์
+KNOWN_FLAGS = FLAG_IQ
+MAX_PAYLOAD_LEN = 1024      # กันค่า payload_len ที่เพี้ยนจากสัญญาณรบกวน
+
+HEADER = struct.Struct('<2sBBHIQbB')
+CRC = struct.Struct('<I')
+HEADER_SIZE = HEADER.size
+FRAME_OVERHEAD = HEADER.size + CRC.size
+
+AMP_DTYPE = np.dtype('<i2')
+IQ_DTYPE = np.dtype('i1')
+
+# seq, timestamp_us, rssi เป็น None สำหรับข้อมูลแบบข้อความ
+# iq = I/Q ดิบ int8 (2 x n_sc) เฉพาะเฟรม FLAG_IQ, None สำหรับเฟรม amplitude
+CsiFrame = namedtuple('CsiFrame', ['seq', 'timestamp_us', 'rssi', 'amplitudes', 'iq'], defaults=(None,))
+
+
+class CsiFrameError(ValueError):
+    """เฟรมไบนารีเสียหาย (CRC ไม่ตรง, ความยาวผิด ฯลฯ)"""
+
+
+def iq_amplitudes(iq):
+    """amplitude sqrt(I^2 + Q^2) จาก I/Q int8 แบบ interleaved (เท่ากับที่เฟิร์มแวร์คำนวณ)"""
+    pairs = np.asarray(iq, dtype=np.float32).reshape(-1, 2)
+    return np.sqrt(np.einsum('ij,ij->i', pairs, pairs))
+
+
+def encode_binary_frame(seq, timestamp_us, rssi, amplitudes, iq=None):
+    """สร้างเฟรมไบนารีจากค่า amplitude หรือ I/Q int8 (ใช้ทดสอบ/จำลองข้อมูลฝั่ง host และ csi_hub)"""
+    if iq is not None:
+        payload = np.asarray(iq, dtype=IQ_DTYPE).tobytes()
+        flags = FLAG_IQ
+    else:
+        amp = np.rint(np.asarray(amplitudes, dtype=np.float32) * AMP_SCALE)
+        payload = np.clip(amp, -32768, 32767).astype(AMP_DTYPE).tobytes()
+        flags = 0
+    header = HEADER.pack(BINARY_SYNC, BINARY_VERSION, flags, len(payload),
+                         seq & 0xFFFFFFFF, timestamp_us, rssi, len(payload) // 2)
+    crc = zlib.crc32(header[2:] + payload)
+    return header + payload + CRC.pack(crc)
+
+
+def decode_binary_frame(buf, offset=0):
+    """
+    ถอดรหัสเฟรมไบนารีจาก bytes/bytearray/memoryview ที่ตำแหน่ง offset
+    คืนค่า (frame, next_offset) หรือ (None, offset) ถ้าข้อมูลยังมาไม่ครบ
+    โยน CsiFrameError ถ้าเฟรมเสียหาย
+    """
+    view = memoryview(buf)
+    if len(view) - offset < HEADER_SIZE:
+        return None, offset
+
+    sync, version, flags, payload_len, seq, timestamp_us, rssi, n_sc = HEADER.unpack_from(view, offset)
+    if sync != BINARY_SYNC:
+        raise CsiFrameError("bad sync bytes")
+    if version != BINARY_VERSION or payload_len > MAX_PAYLOAD_LEN or payload_len != n_sc * AMP_DTYPE.itemsize:
+        raise CsiFrameError(f"bad header (version={version}, payload_len={payload_len}, n_sc={n_sc})")
+    if flags & ~KNOWN_FLAGS:
+        raise CsiFrameError(f"unknown flags 0x{flags:02x}")
+
+    end = offset + HEADER_SIZE + payload_len
+    if len(view) < end + CRC.size:
+        return None, offset
+
+    (crc,) = CRC.unpack_from(view, end)
+    if zlib.crc32(view[offset + 2:end]) != crc:
+        raise CsiFrameError("CRC mismatch")
+
+    if flags & FLAG_IQ:
+        # คัดลอก I/Q ออกจาก buffer (framer จะเขียนทับ buffer ภายหลัง)
+        iq = np.frombuffer(view, dtype=IQ_DTYPE, count=2 * n_sc, offset=offset + HEADER_SIZE).copy()
+        return CsiFrame(seq, timestamp_us, rssi, iq_amplitudes(iq), iq), end + CRC.size
+
+    # อ่าน int16 ตรงจาก buffer แล้วแปลงเป็น float32 ครั้งเดียวทั้งเฟรม
+    raw = np.frombuffer(view, dtype=AMP_DTYPE, count=n_sc, offset=offset + HEADER_SIZE)
+    amplitudes = raw.astype(np.float32) / np.float32(AMP_SCALE)
+    return CsiFrame(seq, timestamp_us, rssi, amplitudes), end + CRC.size
+
+
+def parse_text_payload(payload):
+    """แปลงส่วนหลัง 'CSI_DATA,' เป็น numpy array (ไม่เรียก float() ทีละค่า)"""
+    if isinstance(payload, str):
+        payload = payload.encode('ascii', 'replace')
+    payload = payload.strip().strip(b',')
+    if not payload:
+        return np.empty(0, dtype=np.float32)
+    return np.array(payload.split(b','), dtype=np.float32)
+
+
+
+# --- บรรทัดข้อความอื่นที่เฟิร์มแวร์พิมพ์ปนกับ CSI ---
+#   esp32class: RSSI,<n> / DISTANCE_RSSI,<m> / --- (คั่นรอบการพิมพ์)
+#   ESP32c3:    Distance:<m> (บางเวอร์ชันมีข้อความนำหน้า เช่น "...,Distance:<m>")
+#   csi_hub:    HOST_TIME,<วินาที> (เวลาที่ hub อ่านข้อมูลชุดถัดไปจาก Serial ส่งเฉพาะ subscriber ที่ขอ)
+# บรรทัดที่ไม่รู้จักเป็น RECORD_LOG (value = ข้อความทั้งบรรทัด)
+RECORD_CSI = 'csi'
+RECORD_RSSI = 'rssi'
+RECORD_DISTANCE_RSSI = 'distance_rssi'
+RECORD_DISTANCE = 'distance'
+RECORD_SEPARATOR = 'separator'
+RECORD_LOG = 'log'
+RECORD_KINDS = (RECORD_CSI, RECORD_RSSI, RECORD_DISTANCE_RSSI, RECORD_DISTANCE, RECORD_SEPARATOR, RECORD_LOG)
+RECORD_HOST_TIME = 'host_time'  # ไม่ได้มาจากเฟิร์มแวร์ จึงไม่อยู่ใน RECORD_KINDS
+
+# value: CsiFrame (csi), int (rssi), float (เมตร), None (separator), str (log), float (host_time, time.time())
+TextRecord = namedtuple('TextRecord', ['kind', 'value'])
+
+
+def parse_text_record(line):
+    """แปลงบรรทัดที่ไม่ใช่ CSI_DATA เป็น TextRecord (ตัวเลขที่อ่านไม่ได้ = RECORD_LOG)"""
+    if isinstance(line, (bytes, bytearray)):
+        line = line.decode('ascii', 'replace')
+    line = line.strip()
+    try:
+        if line == '---':
+            return TextRecord(RECORD_SEPARATOR, None)
+        if line.startswith('RSSI,'):
+            return TextRecord(RECORD_RSSI, int(line[len('RSSI,'):]))
+        if line.startswith('DISTANCE_RSSI,'):
+            return TextRecord(RECORD_DISTANCE_RSSI, float(line[len('DISTANCE_RSSI,'):]))
+        if line.startswith('HOST_TIME,'):
+            return TextRecord(RECORD_HOST_TIME, float(line[len('HOST_TIME,'):]))
+        at = line.rfind('Distance:')
+        if at >= 0:
+            return TextRecord(RECORD_DISTANCE, float(line[at + len('Distance:'):]))
+    except ValueError:
+        pass
+    return TextRecord(RECORD_LOG, line)
+
+
+def encode_text_frame(amplitudes):
+    """สร้างบรรทัด CSI_DATA,... แบบที่เฟิร์มแวร์ส่ง"""
+    return TEXT_PREFIX + ",".join(f"{v:.2f}" for v in amplitudes).encode() + b"\n"
+
+
+def encode_text_record(record):
+    """สร้างบรรทัดข้อความมาตรฐานของ TextRecord (รูปแบบเดียวกับเฟิร์มแวร์)"""
+    if record.kind == RECORD_RSSI:
+        return f"RSSI,{record.value}\n".encode()
+    if record.kind == RECORD_DISTANCE_RSSI:
+        return f"DISTANCE_RSSI,{record.value:.2f}\n".encode()
+    if record.kind == RECORD_DISTANCE:
+        return f"Distance:{record.value:.2f}\n".encode()
+    if record.kind == RECORD_SEPARATOR:
+        return b"---\n"
+    if record.kind == RECORD_HOST_TIME:
+        return f"HOST_TIME,{record.value:.6f}\n".encode()
+    return record.value.encode('ascii', 'replace') + b"\n"
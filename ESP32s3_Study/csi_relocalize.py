@@ -0,0 +1,402 @@
+import glob
+import io
+import os
+import sys
+import time
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import csi_predictor
+from csi_capture import (AMPLITUDES, CAPTURE_SUFFIX, DEVICE, IQ, TIMESTAMPS, capture_features, find_captures,
+                         open_capture, parse_csv_lines)
+from csi_session import SESSION_SUFFIX, find_sessions, iter_segment_lines, read_index
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:     # ไม่มีก็ได้ (pip install threadpoolctl) แต่ BLAS ของแต่ละ process อาจแย่ง core กัน
+    threadpool_limits = None
+
+try:
+    import zstandard
+except ImportError:     # ไม่มี = อ่าน session แบบ zstd ไม่ได้ (ดู csi_session.py)
+    zstandard = None
+
+# --- ระบุตำแหน่งย้อนหลังจากข้อมูลที่บันทึกไว้ (offline) โดยใช้ทุก core ---
+# อ่าน .csicap / .session / .csv แล้วทำนายตำแหน่งทุกแถวด้วยโมเดลและ smoothing ชุดเดียวกับ csi_predictor.py
+# (SMOOTHING_FILTER และค่าที่เกี่ยวข้อง, FEATURE_MODE, INDEX_N_PROBE) เขียนผลเป็น <ชื่อไฟล์>_trace.csv:
+#   t, x, y (หลัง smoothing), x_raw, y_raw (ก่อน smoothing) [, device ถ้า capture เก็บหลายพอร์ต]
+# แบ่งข้อมูลเป็นชิ้น (shard) กระจายให้ process pool:
+#   .csicap  = ช่วงแถวละ SHARD_ROWS (memmap แต่ละ process อ่านเฉพาะช่วงของตัวเอง)
+#   .csv     = ช่วงบรรทัดละ SHARD_ROWS (หาตำแหน่งขึ้นบรรทัดใหม่ก่อน แล้วอ่านเฉพาะช่วง byte)
+#   .session = 1 segment ต่อ shard (ไฟล์บีบอัดเริ่มอ่านกลางไฟล์ไม่ได้)
+# แต่ละ process โหลดโมเดลครั้งเดียว (artifact แบบ memory-map ใช้หน้าหน่วยความจำร่วมกัน) ทำนายทีละ BATCH_ROWS แถว
+# แล้ว smoothing ใน shard เอง: เริ่มตัวกรองก่อนต้น shard WARMUP_ROWS แถว (ต่ออุปกรณ์) แล้วทิ้งแถวช่วงนั้น
+#   moving-average / median / hampel ได้ผลเท่ากับกรองทั้งไฟล์ต่อเนื่อง (window สั้นกว่า WARMUP_ROWS)
+#   ema / kalman ลืมค่าเริ่มต้นแบบ exponential: ต่างจากกรองต่อเนื่อง < 1e-12 m (kalman ที่ 1024 แถว)
+# ไม่มีขั้นตอนที่ต้องทำทีละแถวต่อเนื่องทั้งไฟล์ process หลักแค่เขียนข้อความที่ worker จัดรูปแบบแล้วตามลำดับ
+# เวลา t: .csicap ใช้คอลัมน์ timestamps (ไม่มี = ลำดับแถว / ASSUMED_RATE_HZ), .session เฉลี่ยจากช่วงเวลาของ
+#   segment ใน index, .csv ไม่มีเวลาจึงใช้ลำดับบรรทัด / ASSUMED_RATE_HZ
+# FUSION_MODE = 'csi+rssi' ไม่ใช้ที่นี่ (ข้อมูลที่บันทึกไม่มี RSSI ต่อแถวครบทุกแบบ) ใช้ SMOOTHING_FILTER เสมอ
+# ใช้งาน: python csi_relocalize.py <ไฟล์หรือโฟลเดอร์> [...] [จำนวน process]
+
+# ---!!! ตั้งค่าที่สำคัญ !!!---
+MODEL_PATH = None               # None = เหมือน csi_predictor.py (MODEL_ARTIFACT ถ้ามี ไม่เช่นนั้น MODEL_FILENAME)
+WORKERS = None                  # จำนวน process (None = ทุก core)
+OUTPUT_FOLDER = None            # None = เขียน _trace.csv ไว้ข้างไฟล์ต้นฉบับ
+SHARD_ROWS = 65536              # แถวต่องาน 1 ชิ้น (มาก = overhead น้อย, น้อย = กระจายงานได้ทั่วถึงกว่า)
+BATCH_ROWS = 8192               # แถวต่อการเรียก model.predict 1 ครั้ง
+WARMUP_ROWS = 1024              # แถวก่อนต้น shard ที่ป้อนให้ตัวกรองก่อน (ต้องมากกว่า SMOOTHING_WINDOW_SIZE)
+ASSUMED_RATE_HZ = 100.0         # อัตราเฟรมที่ใช้สร้างเวลาเมื่อไฟล์ไม่มีเวลา
+TRACE_SUFFIX = '_trace.csv'
+
+# error ที่เกิดจากไฟล์ต้นฉบับ (อ่านไม่ได้, segment บีบอัดเสีย) ทำให้ไฟล์นั้นล้มเหลว ไม่หยุดไฟล์อื่น
+READ_ERRORS = (ValueError, OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+Shard = namedtuple('Shard', ['path', 'kind', 'start', 'end', 'warmup', 'info'])
+# start/end = ช่วงแถว (capture, csv) หรือลำดับ segment (session), warmup = จำนวนแถวก่อน start ที่ใช้เริ่มตัวกรอง
+# info = ข้อมูลเพิ่มต่อชนิด: csv -> (byte เริ่ม warm-up, byte เริ่ม, byte จบ, header)
+#                          session -> (segment, segment ก่อนหน้าหรือ None, header)
+
+# โมเดลของ worker (โหลดครั้งเดียวต่อ process ใน _init_worker)
+_model = None
+_feature_mode = None
+_thread_limits = None
+
+
+def default_model_path():
+    if os.path.exists(csi_predictor.MODEL_ARTIFACT):
+        return csi_predictor.MODEL_ARTIFACT
+    return csi_predictor.MODEL_FILENAME
+
+
+def _init_worker(model_path):
+    global _model, _feature_mode, _thread_limits
+    if threadpool_limits is not None:
+        # งานขนานกันที่ระดับ process แล้ว BLAS ใช้ thread เดียวต่อ process
+        _thread_limits = threadpool_limits(1)
+    _model, _feature_mode = csi_predictor.load_predictor_model(model_path)
+
+
+def trace_name(path):
+    """ชื่อไฟล์ผลลัพธ์ของไฟล์ต้นฉบับ"""
+    base = os.path.basename(os.path.normpath(path))
+    for suffix in (CAPTURE_SUFFIX, SESSION_SUFFIX, '.csv'):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+            break
+    return os.path.join(OUTPUT_FOLDER or os.path.dirname(os.path.abspath(path)), base + TRACE_SUFFIX)
+
+
+def prefer_captures(paths):
+    """ตัดไฟล์ซ้ำ และ CSV ที่มี capture ชื่อเดียวกันอยู่ในรายการด้วย (ใช้ capture แทน ผลลัพธ์ชื่อเดียวกัน)"""
+    paths = list(dict.fromkeys(os.path.normpath(p) for p in paths))
+    converted = {p[:-len(CAPTURE_SUFFIX)] for p in paths if p.endswith(CAPTURE_SUFFIX)}
+    return [p for p in paths if not (p.endswith('.csv') and p[:-len('.csv')] in converted)]
+
+
+def find_recordings(folder_path):
+    """capture, session และ CSV ในโฟลเดอร์ (CSV ที่มี capture ชื่อเดียวกันแล้วใช้ capture แทน)"""
+    csvs = [p for p in sorted(glob.glob(os.path.join(folder_path, '*.csv'))) if not p.endswith(TRACE_SUFFIX)]
+    return prefer_captures(find_captures(folder_path) + find_sessions(folder_path) + csvs)
+
+
+# --- แบ่งงาน (process หลัก อ่านแค่ข้อมูลเล็กน้อย) ---
+
+def _row_ranges(n_rows, warmup_rows):
+    for start in range(0, n_rows, SHARD_ROWS):
+        yield start, min(start + SHARD_ROWS, n_rows), min(start, warmup_rows)
+
+
+def _capture_shards(path, feature_mode, n_features):
+    capture = open_capture(path)
+    if feature_mode != 'amplitude' and IQ not in capture:
+        raise ValueError(f"feature mode '{feature_mode}' needs an '{IQ}' column")
+    if feature_mode == 'amplitude' and capture[AMPLITUDES].shape[1] < n_features:
+        raise ValueError(f"{capture[AMPLITUDES].shape[1]} subcarriers, model expects {n_features}")
+    n_devices = len(np.unique(capture[DEVICE])) if DEVICE in capture else 1
+    return [Shard(path, 'capture', start, end, warmup, None)
+            for start, end, warmup in _row_ranges(len(capture[AMPLITUDES]), WARMUP_ROWS * max(n_devices, 1))]
+
+
+def _line_offsets(path):
+    """ตำแหน่ง byte ของต้นบรรทัดข้อมูลทุกบรรทัด (ไม่รวม header) ต่อท้ายด้วยขนาดไฟล์"""
+    size = os.path.getsize(path)
+    data = np.memmap(path, dtype=np.uint8, mode='r') if size else np.empty(0, np.uint8)
+    chunk = 64 << 20
+    newlines = [np.flatnonzero(data[pos:pos + chunk] == 10) + pos for pos in range(0, size, chunk)]
+    starts = np.concatenate(newlines + [np.empty(0, np.int64)]) + 1
+    starts = starts[starts < size]
+    return np.append(starts, size)
+
+
+def _csv_shards(path, feature_mode, n_features):
+    if feature_mode != 'amplitude':
+        raise ValueError(f"feature mode '{feature_mode}' needs I/Q, which CSV files do not store")
+    with open(path, 'r') as f:
+        header = f.readline().strip().split(',')
+    n_values = len(header) - 2 if header[-2:] == ['pos_x', 'pos_y'] else len(header)
+    if n_values < n_features:
+        raise ValueError(f"{n_values} subcarrier columns, model expects {n_features}")
+    offsets = _line_offsets(path)
+    return [Shard(path, 'csv', start, end, warmup,
+                  (int(offsets[start - warmup]), int(offsets[start]), int(offsets[end]), header))
+            for start, end, warmup in _row_ranges(len(offsets) - 1, WARMUP_ROWS)]
+
+
+def _session_shards(path, feature_mode, n_features):
+    if feature_mode != 'amplitude':
+        raise ValueError(f"feature mode '{feature_mode}' needs I/Q, which sessions do not store")
+    index = read_index(path)
+    header = index['header'].split(',')
+    n_values = len(header) - 2 if header[-2:] == ['pos_x', 'pos_y'] else len(header)
+    if n_values < n_features:
+        raise ValueError(f"{n_values} subcarrier columns, model expects {n_features}")
+    segments = index['segments']
+    return [Shard(path, 'session', i, i + 1, WARMUP_ROWS if i > 0 else 0,
+                  (segment, segments[i - 1] if i > 0 else None, header))
+            for i, segment in enumerate(segments)]
+
+
+def plan_shards(path, feature_mode, n_features):
+    """แบ่งไฟล์เป็นรายการ Shard (โยน ValueError ถ้าใช้กับโมเดลนี้ไม่ได้)"""
+    if os.path.isdir(path) and path.rstrip('/\\').endswith(CAPTURE_SUFFIX):
+        return _capture_shards(path, feature_mode, n_features)
+    if os.path.isdir(path) and path.rstrip('/\\').endswith(SESSION_SUFFIX):
+        return _session_shards(path, feature_mode, n_features)
+    if path.endswith('.csv'):
+        return _csv_shards(path, feature_mode, n_features)
+    raise ValueError(f"expected a {CAPTURE_SUFFIX} capture, a {SESSION_SUFFIX} session or a .csv file")
+
+
+# --- อ่านข้อมูลของ shard (ใน worker) คืนค่า (features, เวลา, device หรือ None, จำนวนแถว warm-up ที่อ่านได้) ---
+
+def _read_capture_shard(shard):
+    capture = open_capture(shard.path)
+    begin = shard.start - shard.warmup
+    part = {name: value[begin:shard.end] for name, value in capture.items() if name != 'amplitude_scale'}
+    part['amplitude_scale'] = capture['amplitude_scale']
+    features = np.asarray(capture_features(part, _feature_mode), dtype=np.float32)
+    times = np.array(part[TIMESTAMPS], dtype=np.float64)
+    unknown = np.isnan(times)
+    times[unknown] = (begin + np.flatnonzero(unknown)) / ASSUMED_RATE_HZ
+    devices = np.asarray(part[DEVICE]).reshape(-1) if DEVICE in part else None
+    return features, times, devices, shard.warmup
+
+
+def _parse_lines(lines, times, n_cols):
+    """parse_csv_lines ที่คืนเวลาของแถวที่เหลือด้วย (แถวที่รูปแบบผิดถูกทิ้งพร้อมเวลาของมัน)"""
+    good = [i for i, line in enumerate(lines) if line.count(',') == n_cols - 1 and 'CSI' not in line]
+    values = parse_csv_lines([lines[i] for i in good], n_cols)
+    if len(values) == len(good):
+        return values, times[good]
+    # มีแถวที่ไม่ใช่ตัวเลขปน (พบน้อย) แปลงทีละแถวเพื่อรู้ว่าแถวไหนถูกทิ้ง
+    rows, kept = [], []
+    for i in good:
+        try:
+            rows.append(np.array(lines[i].split(','), dtype=np.float32))
+        except ValueError:
+            continue
+        kept.append(i)
+    return np.array(rows, dtype=np.float32).reshape(-1, n_cols), times[kept]
+
+
+def _amplitude_columns(values, header):
+    return values[:, :-2] if header[-2:] == ['pos_x', 'pos_y'] else values
+
+
+def _read_csv_shard(shard):
+    warm_offset, start_offset, end_offset, header = shard.info
+    with open(shard.path, 'rb') as f:
+        f.seek(warm_offset)
+        data = f.read(end_offset - warm_offset).decode('ascii', 'replace')
+    split = start_offset - warm_offset
+    warm_lines, lines = data[:split].splitlines(), data[split:].splitlines()
+    first = shard.start - len(warm_lines)
+    warm, warm_times = _parse_lines(warm_lines, (first + np.arange(len(warm_lines))) / ASSUMED_RATE_HZ, len(header))
+    rows, times = _parse_lines(lines, (shard.start + np.arange(len(lines))) / ASSUMED_RATE_HZ, len(header))
+    values = _amplitude_columns(np.concatenate([warm, rows]), header)
+    return values, np.concatenate([warm_times, times]), None, len(warm)
+
+
+def _segment_times(segment, n_lines):
+    """เวลาของแต่ละแถวใน segment (เฉลี่ยจาก start_time / end_time ใน index)"""
+    n = max(segment['samples'], n_lines)
+    return segment['start_time'] + (segment['end_time'] - segment['start_time']) * np.arange(n) / max(n - 1, 1)
+
+
+def _read_session_shard(shard):
+    segment, previous, header = shard.info
+    warm, warm_times = np.empty((0, len(header)), np.float32), np.empty(0)
+    if previous is not None:
+        # แถวท้ายของ segment ก่อนหน้าใช้เริ่มตัวกรอง (ต้องถอดรหัสทั้งไฟล์ แต่ parse แค่ warmup แถว)
+        lines = iter_segment_lines(os.path.join(shard.path, previous['file']))
+        next(lines, None)   # header
+        tail = deque(enumerate(lines), maxlen=shard.warmup)
+        if tail:
+            times = _segment_times(previous, tail[-1][0] + 1)[[i for i, _ in tail]]
+            warm, warm_times = _parse_lines([line for _, line in tail], times, len(header))
+    lines = iter_segment_lines(os.path.join(shard.path, segment['file']))
+    next(lines, None)
+    lines = list(lines)
+    rows, times = _parse_lines(lines, _segment_times(segment, len(lines)), len(header))
+    values = _amplitude_columns(np.concatenate([warm, rows]), header)
+    return values, np.concatenate([warm_times, times]), None, len(warm)
+
+
+SHARD_READERS = {'capture': _read_capture_shard, 'csv': _read_csv_shard, 'session': _read_session_shard}
+
+
+# --- ทำนาย + smoothing (ใน worker) ---
+
+def smooth_trace(predicted, times, devices=None):
+    """กรองพิกัดทีละแถวด้วยตัวกรองแบบเดียวกับ csi_predictor.py (แยกตัวกรองต่ออุปกรณ์ถ้ามี device)"""
+    smoothed = np.empty_like(predicted)
+    groups = [np.arange(len(predicted))] if devices is None else [np.flatnonzero(devices == d)
+                                                                  for d in np.unique(devices)]
+    for rows in groups:
+        smoother = csi_predictor.make_smoother()
+        for i in rows:
+            smoothed[i] = smoother.update(predicted[i], times[i])
+    return smoothed
+
+
+def format_trace(times, smoothed, predicted, devices=None):
+    """แถวของไฟล์ _trace.csv เป็นข้อความ (จัดรูปแบบใน worker process หลักแค่เขียนต่อกัน)"""
+    columns = [times, smoothed[:, 0], smoothed[:, 1], predicted[:, 0], predicted[:, 1]]
+    fmt = ['%.6f'] + ['%.4f'] * 4
+    if devices is not None:
+        columns.append(devices)
+        fmt.append('%d')
+    buf = io.StringIO()
+    np.savetxt(buf, np.column_stack(columns), fmt=fmt, delimiter=',')
+    return buf.getvalue()
+
+
+def process_shard(shard):
+    """
+    ทำนาย + smoothing 1 shard คืนค่า (ข้อความ CSV, จำนวนแถว, จำนวนแถวที่ข้าม, error หรือ None)
+    error ของไฟล์ (เช่นไฟล์เสีย) คืนเป็นข้อความ ไม่หยุดไฟล์อื่น
+    """
+    try:
+        features, times, devices, n_warmup = SHARD_READERS[shard.kind](shard)
+    except READ_ERRORS as e:
+        return '', 0, 0, str(e)
+    features = features[:, :_model.n_features_in_]
+    # แถวที่ไม่มีค่า (เช่นไม่มี I/Q ในโหมด phase) ข้ามเหมือนตอนใช้งานจริง
+    valid = np.isfinite(features).all(axis=1)
+    skipped = int(len(valid) - n_warmup - valid[n_warmup:].sum())
+    if not valid.all():
+        n_warmup = int(valid[:n_warmup].sum())
+        features, times = features[valid], times[valid]
+        devices = devices[valid] if devices is not None else None
+    predicted = np.empty((len(features), 2))
+    for start in range(0, len(features), BATCH_ROWS):
+        predicted[start:start + BATCH_ROWS] = csi_predictor.predict_batch(_model, features[start:start + BATCH_ROWS])
+    smoothed = smooth_trace(predicted, times, devices)
+    keep = slice(n_warmup, None)
+    text = format_trace(times[keep], smoothed[keep], predicted[keep],
+                        devices[keep] if devices is not None else None)
+    return text, len(predicted) - n_warmup, skipped, None
+
+
+# --- process หลัก ---
+
+def relocalize(paths, model_path=None, workers=None):
+    """ระบุตำแหน่งทุกแถวของไฟล์ที่บันทึกไว้ เขียน _trace.csv ต่อไฟล์ คืน dict {ไฟล์ต้นฉบับ: ไฟล์ผลลัพธ์}"""
+    model_path = model_path or MODEL_PATH or default_model_path()
+    workers = workers or WORKERS or os.cpu_count() or 1
+    # process หลักโหลดโมเดลเพื่อตรวจ feature และแบ่งงานเท่านั้น (artifact แบบ memory-map โหลดเร็ว)
+    model, feature_mode = csi_predictor.load_predictor_model(model_path)
+    shards, columns, targets = [], {}, {}
+    for path in paths:
+        try:
+            output = trace_name(path)
+            if output in targets.values():
+                # ไม่เขียนทับผลของไฟล์อื่น (เช่น x.csicap กับ x.csv)
+                other = next(p for p, o in targets.items() if o == output)
+                raise ValueError(f"output '{output}' is already used by {other}")
+            file_shards = plan_shards(path, feature_mode, model.n_features_in_)
+        except (ValueError, OSError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        shards += file_shards
+        targets[path] = output
+        with_device = bool(file_shards) and file_shards[0].kind == 'capture' and DEVICE in open_capture(path)
+        columns[path] = 't,x,y,x_raw,y_raw' + (',device' if with_device else '')
+    if not shards:
+        print("Nothing to relocalize.")
+        return {}
+    print(f"Model '{model_path}' ({feature_mode}): {len(shards)} shards from {len(columns)} files, "
+          f"{workers} workers, smoothing '{csi_predictor.SMOOTHING_FILTER}'")
+
+    started = time.perf_counter()
+    if workers == 1:
+        # process เดียว: ทำใน process นี้ (ไม่มี overhead ของ pool)
+        _init_worker(model_path)
+        executor, results = None, map(process_shard, shards)
+    else:
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_path,))
+        results = executor.map(process_shard, shards)
+
+    # ผลลัพธ์มาตามลำดับ shard (ไฟล์เดียวกันต่อเนื่องกัน) เขียนต่อกันได้เลย
+    outputs, counts, errors = {}, {}, {}
+    out, finished = None, False
+    try:
+        for shard, (text, rows, skipped, error) in zip(shards, results):
+            if shard.path not in outputs:
+                if out is not None:
+                    out.close()
+                outputs[shard.path] = targets[shard.path]
+                out = open(outputs[shard.path], 'w', newline='')
+                out.write(columns[shard.path] + '\n')
+                counts[shard.path] = [0, 0]
+            if error is not None:
+                errors.setdefault(shard.path, error)
+                continue
+            out.write(text)
+            counts[shard.path][0] += rows
+            counts[shard.path][1] += skipped
+        finished = True
+    finally:
+        if out is not None:
+            out.close()
+            if not finished:
+                # หยุดกลางทาง (Ctrl+C, worker ล้ม): ไม่ทิ้ง _trace.csv ที่เขียนไม่ครบไว้
+                os.remove(out.name)
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    for path, output in list(outputs.items()):
+        name = os.path.basename(os.path.normpath(path))
+        if path in errors:
+            # ไฟล์ที่อ่านไม่ได้บางส่วนไม่เขียนผลครึ่งๆ กลางๆ ทิ้งไว้
+            print(f"Error in {name}: {errors[path]}")
+            os.remove(output)
+            del outputs[path]
+            continue
+        rows, skipped = counts[path]
+        print(f"{name}: {rows} positions" + (f" ({skipped} rows skipped)" if skipped else "") + f" -> {output}")
+    elapsed = time.perf_counter() - started
+    total = sum(counts[path][0] for path in outputs)
+    print(f"Done: {total} positions in {elapsed:.2f} s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+    return outputs
+
+
+if __name__ == "__main__":
+    # ใช้งาน: python csi_relocalize.py <ไฟล์หรือโฟลเดอร์> [...] [จำนวน process]
+    args = sys.argv[1:]
+    n_workers = int(args.pop()) if args and args[-1].isdigit() else None
+    if not args:
+        args = [os.path.dirname(os.path.abspath(__file__))]
+    recordings = []
+    for arg in args:
+        is_recording = arg.rstrip('/\\').endswith((CAPTURE_SUFFIX, SESSION_SUFFIX))
+        recordings += find_recordings(arg) if os.path.isdir(arg) and not is_recording else [arg]
+    recordings = prefer_captures(recordings)
+    if not recordings:
+        print(f"No {CAPTURE_SUFFIX}, {SESSION_SUFFIX} or .csv recordings found in {args}")
+    else:
+        relocalize(recordings, workers=n_workers)
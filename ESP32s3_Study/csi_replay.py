@@ -0,0 +1,234 @@
+import os
+import time
+
+import numpy as np
+
+from csi_capture import CAPTURE_SUFFIX, iter_capture_blocks, iter_csv_blocks
+from csi_protocol import encode_binary_frame, encode_text_frame
+
+# --- Serial จำลองสำหรับทดสอบ/วัดประสิทธิภาพโดยไม่ต้องมีบอร์ด ---
+# เล่นข้อมูลที่บันทึกไว้ (csi_data_x*.csv, .csicap หรือ log ดิบจาก Serial) ซ้ำตามอัตราที่กำหนด
+# ReplaySerial มี read / readline / in_waiting / flushInput / close เหมือน serial.Serial
+# จึงส่งเข้า read_frames() และโค้ดเดิมได้ทันที
+# โหมดจำลองปัญหาของสตรีมจริง:
+#   'clean'  = เฟรมสมบูรณ์ทุกเฟรม
+#   'merged' = บางเฟรมถูกตัดกลางบรรทัดแล้วมีเฟรมถัดไปต่อท้าย (เหมือน "...,CSI_DATA,..." ในไฟล์เดิม)
+#   'corrupt'= สุ่มเปลี่ยนค่าไบต์ในสตรีม
+# burst_size > 1 = ปล่อยเฟรมออกมาเป็นกลุ่มๆ (เหมือน USB/UART buffer ที่ส่งทีละก้อน)
+
+REPLAY_RATE_HZ = 100        # อัตราเฟรมเริ่มต้น (None = เร็วที่สุด)
+MERGE_PROBABILITY = 0.02    # สัดส่วนเฟรมที่ถูกตัดครึ่งในโหมด 'merged'
+CORRUPT_PROBABILITY = 1e-4  # สัดส่วนไบต์ที่ถูกเปลี่ยนในโหมด 'corrupt'
+REPLAY_MODES = ('clean', 'merged', 'corrupt')
+
+
+def load_amplitudes(path):
+    """โหลด amplitude ทุกเฟรมจาก .csv หรือ .csicap เป็น array (N, n_subcarriers)"""
+    blocks = iter_capture_blocks(path) if path.rstrip('/\\').endswith(CAPTURE_SUFFIX) else iter_csv_blocks(path)
+    amplitudes = [X for X, _, _ in blocks]
+    return np.concatenate(amplitudes) if amplitudes else np.empty((0, 0), dtype=np.float32)
+
+
+def encode_text_frames(amplitudes):
+    """สร้างบรรทัด CSI_DATA,... แบบที่เฟิร์มแวร์ส่ง (1 บรรทัดต่อเฟรม)"""
+    return [encode_text_frame(row) for row in amplitudes]
+
+
+def encode_binary_frames(amplitudes, rate_hz=REPLAY_RATE_HZ):
+    """สร้างเฟรมไบนารี (seq และ timestamp เรียงตามอัตราเฟรม)"""
+    period_us = int(1e6 / rate_hz) if rate_hz else 10000
+    return [encode_binary_frame(i, i * period_us, -50, row) for i, row in enumerate(amplitudes)]
+
+
+def synthesize_iq(amplitudes, seed=0):
+    """I/Q int8 [imag, real] ที่มี amplitude ใกล้ค่าเดิมและ phase สุ่ม (ใช้ทดสอบโหมด CSI_IQ_OUTPUT)"""
+    amplitudes = np.asarray(amplitudes, dtype=np.float32)
+    phase = np.random.default_rng(seed).uniform(-np.pi, np.pi, amplitudes.shape)
+    iq = np.empty((len(amplitudes), 2 * amplitudes.shape[1]), dtype=np.int8)
+    iq[:, 0::2] = np.clip(np.rint(amplitudes * np.sin(phase)), -128, 127)
+    iq[:, 1::2] = np.clip(np.rint(amplitudes * np.cos(phase)), -128, 127)
+    return iq
+
+
+def encode_iq_frames(iq, rate_hz=REPLAY_RATE_HZ):
+    """สร้างเฟรมไบนารีแบบ FLAG_IQ จาก I/Q int8 (N, 2 x n_sc)"""
+    period_us = int(1e6 / rate_hz) if rate_hz else 10000
+    return [encode_binary_frame(i, i * period_us, -50, None, row) for i, row in enumerate(iq)]
+
+
+def build_stream(frames, mode='clean', seed=0):
+    """
+    รวมเฟรม (list ของ bytes) เป็นสตรีมเดียวตามโหมด
+    คืนค่า (stream bytes, offsets) โดย offsets[i] คือตำแหน่งท้ายเฟรม i ในสตรีม
+    """
+    if mode not in REPLAY_MODES:
+        raise ValueError(f"unknown replay mode '{mode}' (expected one of {REPLAY_MODES})")
+    rng = np.random.default_rng(seed)
+    if mode == 'merged':
+        cut = rng.random(len(frames)) < MERGE_PROBABILITY
+        frames = [f[:int(rng.integers(1, len(f)))] if c else f for f, c in zip(frames, cut)]
+
+    offsets = np.cumsum([len(f) for f in frames], dtype=np.int64)
+    stream = bytearray(b"".join(frames))
+    if mode == 'corrupt' and stream:
+        n_bad = rng.binomial(len(stream), CORRUPT_PROBABILITY)
+        positions = rng.choice(len(stream), n_bad, replace=False)
+        stream_view = np.frombuffer(stream, dtype=np.uint8)
+        stream_view[positions] = rng.integers(0, 256, n_bad, dtype=np.uint8)
+    return bytes(stream), offsets
+
+
+def load_raw_log(path):
+    """log ดิบที่บันทึกจาก Serial: ใช้ทั้งไฟล์ตามเดิม แบ่งเฟรมตามบรรทัด"""
+    with open(path, 'rb') as f:
+        stream = f.read()
+    ends = list(np.flatnonzero(np.frombuffer(stream, dtype=np.uint8) == 0x0A) + 1)
+    if not ends or ends[-1] != len(stream):
+        ends.append(len(stream))
+    return stream, np.asarray(ends, dtype=np.int64)
+
+
+class ReplaySerial:
+    """
+    stand-in ของ serial.Serial ที่ปล่อยข้อมูลจากสตรีมที่เตรียมไว้ตามเวลา
+    rate_hz=None ปล่อยทุกอย่างทันที (วัด throughput สูงสุด)
+    loop=True เล่นซ้ำตั้งแต่ต้นเมื่อจบสตรีม
+    """
+
+    def __init__(self, stream, offsets, rate_hz=REPLAY_RATE_HZ, burst_size=1, timeout=1, loop=False):
+        self.stream = stream
+        self.offsets = offsets
+        self.rate_hz = rate_hz
+        self.burst_size = max(burst_size, 1)
+        self.timeout = timeout
+        self.loop = loop
+        self.is_open = True
+        self.port = 'replay'
+        self._pos = 0
+        self._cycle = 0
+        self._start = time.perf_counter()
+
+    @classmethod
+    def from_file(cls, path, serial_format='text', mode='clean', seed=0, **kwargs):
+        """สร้างจาก .csv / .csicap (เข้ารหัสเป็น text หรือ binary) หรือ log ดิบ (.log / .txt / .bin)"""
+        if os.path.splitext(path.rstrip('/\\'))[1] in ('.log', '.txt', '.bin'):
+            stream, offsets = load_raw_log(path)
+            if mode != 'clean':
+                # แบ่งตามบรรทัดเดิม แล้วใส่ปัญหาตามโหมดเหมือนข้อมูลอื่น
+                frames = [stream[a:b] for a, b in zip(np.concatenate([[0], offsets[:-1]]), offsets)]
+                stream, offsets = build_stream(frames, mode, seed)
+        else:
+            amplitudes = load_amplitudes(path)
+            if serial_format == 'binary':
+                frames = encode_binary_frames(amplitudes, kwargs.get('rate_hz', REPLAY_RATE_HZ))
+            else:
+                frames = encode_text_frames(amplitudes)
+            stream, offsets = build_stream(frames, mode, seed)
+        return cls(stream, offsets, **kwargs)
+
+    @property
+    def n_frames(self):
+        return len(self.offsets)
+
+    def _available(self):
+        """ตำแหน่งสุดท้ายในสตรีม (รวมรอบที่เล่นซ้ำ) ที่ 'มาถึง' แล้ว ณ เวลานี้"""
+        total = len(self.stream)
+        if self.rate_hz is None:
+            return total * (self._cycle + 1)
+        arrived = int((time.perf_counter() - self._start) * self.rate_hz)
+        arrived -= arrived % self.burst_size
+        cycles, index = divmod(arrived, len(self.offsets))
+        if not self.loop and cycles > 0:
+            return total
+        return cycles * total + (int(self.offsets[index - 1]) if index > 0 else 0)
+
+    @property
+    def in_waiting(self):
+        available = self._available()
+        if not self.loop:
+            available = min(available, len(self.stream))
+        return max(available - self._pos, 0)
+
+    def _wait_for_data(self):
+        if self.rate_hz is None or self.in_waiting:
+            return
+        deadline = time.perf_counter() + (self.timeout if self.timeout is not None else 1e9)
+        step = self.burst_size / self.rate_hz
+        while not self.in_waiting and not self.finished and time.perf_counter() < deadline:
+            time.sleep(min(step, max(deadline - time.perf_counter(), 0)))
+
+    @property
+    def finished(self):
+        """เล่นสตรีมจบแล้ว (ไม่นับกรณี loop)"""
+        return not self.loop and self._pos >= len(self.stream)
+
+    def read(self, size=1):
+        self._wait_for_data()
+        n = min(size, self.in_waiting)
+        if self.rate_hz is None and self.loop and n == 0:
+            self._cycle += 1
+            n = min(size, self.in_waiting)
+        total = len(self.stream)
+        out = bytearray()
+        while n > 0:
+            start = self._pos % total
+            chunk = self.stream[start:start + n]
+            out += chunk
+            self._pos += len(chunk)
+            n -= len(chunk)
+        return bytes(out)
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            data = self.read(1)
+            if not data:
+                break
+            line += data
+        return bytes(line)
+
+    def reset_input_buffer(self):
+        """ทิ้งข้อมูลที่มาถึงแล้วแต่ยังไม่ได้อ่าน (เหมือน serial.Serial)"""
+        self._pos += self.in_waiting
+
+    flushInput = reset_input_buffer
+
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+
+
+def serve_pty(replay):
+    """
+    (Linux/macOS) สร้าง pseudo-terminal แล้วเขียนสตรีมเข้าไปตามเวลา
+    ตั้ง SERIAL_PORT ของสคริปต์ใดก็ได้เป็น path ที่พิมพ์ออกมา เพื่อทดสอบโดยไม่แก้โค้ด
+    """
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    print(f"Replaying {replay.n_frames} frames on {os.ttyname(slave)} (Ctrl+C to stop)")
+    try:
+        while not replay.finished:
+            data = replay.read(4096)
+            if data:
+                os.write(master, data)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+if __name__ == "__main__":
+    import sys
+    # ใช้งาน: python csi_replay.py <ไฟล์ .csv/.csicap/.log> [text|binary] [clean|merged|corrupt] [อัตราเฟรม Hz]
+    if len(sys.argv) < 2:
+        print("Usage: python csi_replay.py <capture.csv|.csicap|.log> [text|binary] [clean|merged|corrupt] [rate_hz]")
+        sys.exit(1)
+    fmt = sys.argv[2] if len(sys.argv) > 2 else 'text'
+    mode = sys.argv[3] if len(sys.argv) > 3 else 'clean'
+    rate = float(sys.argv[4]) if len(sys.argv) > 4 else REPLAY_RATE_HZ
+    serve_pty(ReplaySerial.from_file(sys.argv[1], fmt, mode, rate_hz=rate, loop=True))
@@ -0,0 +1,58 @@
+import threading
+
+import numpy as np
+
+# --- Ring buffer ขนาดคงที่สำหรับข้อมูลแบบเรียลไทม์ ---
+# จองหน่วยความจำครั้งเดียว (frames x columns) ไม่มีการสร้าง list/deque ใหม่ระหว่างทำงาน
+# ฝั่งเขียน (thread อ่าน Serial) และฝั่งอ่าน (การวาดกราฟ) ทำงานคนละจังหวะกันได้
+# lock ถูกถือเฉพาะตอนคัดลอกแถว จึงไม่บล็อกกันนาน
+
+
+class FrameRingBuffer:
+    """เก็บ capacity แถวล่าสุด แถวละ n_cols ค่า (แถวที่สั้นกว่าเติม 0 ยาวกว่าตัดทิ้ง)"""
+
+    def __init__(self, capacity, n_cols, dtype=np.float32):
+        self.capacity = capacity
+        self.n_cols = n_cols
+        self.data = np.zeros((capacity, n_cols), dtype=dtype)
+        self.total = 0      # จำนวนแถวที่เคยเขียนทั้งหมด (ใช้ดูว่ามีข้อมูลใหม่หรือไม่)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def append(self, row):
+        n = min(len(row), self.n_cols)
+        with self._lock:
+            slot = self.data[self.total % self.capacity]
+            slot[:n] = row[:n]
+            slot[n:] = 0
+            self.total += 1
+
+    def extend(self, rows):
+        """เขียนหลายแถว (array 2 มิติที่มี n_cols คอลัมน์) ในครั้งเดียว"""
+        rows = rows[-self.capacity:]
+        with self._lock:
+            start = self.total % self.capacity
+            first = min(len(rows), self.capacity - start)
+            self.data[start:start + first] = rows[:first]
+            self.data[:len(rows) - first] = rows[first:]
+            self.total += len(rows)
+
+    def latest(self, n):
+        """คัดลอก n แถวล่าสุด เรียงจากเก่าไปใหม่"""
+        with self._lock:
+            n = min(n, self.total, self.capacity)
+            idx = (self.total - n + np.arange(n)) % self.capacity
+            return self.data[idx]
+
+    def ordered(self):
+        """คัดลอกทั้ง buffer เรียงจากเก่าไปใหม่ (แถวที่ยังไม่เคยเขียนเป็น 0 อยู่ด้านเก่า)"""
+        with self._lock:
+            start = self.total % self.capacity
+            return np.concatenate([self.data[start:], self.data[:start]])
+
+    def clear(self):
+        with self._lock:
+            self.data[:] = 0
+            self.total = 0
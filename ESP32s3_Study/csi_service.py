@@ -0,0 +1,285 @@
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+from csi_artifact import MANIFEST_FILE, is_artifact
+
+# --- ส่วนประกอบของ predictor แบบ service ที่รันต่อเนื่อง (ใช้กับ SERVICE_MODE ใน csi_predictor.py) ---
+# ModelWatcher:   เฝ้าไฟล์โมเดล (.joblib หรือ manifest.json ของ .csimodel) เมื่อเปลี่ยนและนิ่งแล้ว
+#                 โหลดโมเดลใหม่ใน thread แยก ลูปอ่าน Serial ไม่หยุดรอ แล้วสลับโมเดลระหว่าง batch
+#                 (reference เดียว ทุกเฟรมถูกทำนายด้วยโมเดลเก่าหรือใหม่ครบทั้ง batch ไม่มีเฟรมหาย)
+#                 โหลดไม่สำเร็จ = พิมพ์ error แล้วใช้โมเดลเดิมต่อ
+# PositionServer: HTTP บน localhost ให้โปรแกรมอื่นอ่านตำแหน่ง
+#   GET /latest  -> JSON ตำแหน่งล่าสุด {"x", "y", "t", "seq", "model"} (ยังไม่มี = 503)
+#                   t = เวลาที่เฟรมมาถึง host (time.time()), "device_t" = timestamp ของบอร์ด (เฉพาะเฟรมไบนารี)
+#   GET /stream  -> newline-delimited JSON ทุกตำแหน่ง 1 ข้อความต่อเฟรม (และเหตุการณ์ motion ถ้าเปิด MOTION_DETECTION)
+#   GET /status  -> โมเดลที่ใช้, จำนวน reload, client และข้อความที่ถูกทิ้ง
+# client ของ /stream ที่อ่านไม่ทันถูกทิ้งข้อความเก่าสุด (เก็บไม่เกิน MAX_STREAM_BACKLOG ข้อความ)
+# จึงได้ตำแหน่งล่าสุดเสมอ และไม่ทำให้การทำนายหรือ client อื่นช้าลง
+# ตัวอย่าง: curl http://127.0.0.1:5770/latest  หรือ  curl -N http://127.0.0.1:5770/stream
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 5770
+MODEL_POLL_SEC = 2.0            # ตรวจไฟล์โมเดลทุกกี่วินาที
+RELOAD_SETTLE_SEC = 1.0         # ไฟล์ต้องไม่เปลี่ยนนานเท่านี้ก่อนโหลด (joblib.dump เขียนทับไฟล์เดิมทีละส่วน)
+MAX_STREAM_BACKLOG = 256        # ข้อความที่ค้างส่งต่อ client ของ /stream เกินนี้ทิ้งข้อความเก่าสุด
+REQUEST_TIMEOUT_SEC = 0.5
+
+
+def model_signature(path):
+    """(mtime_ns, size) ของไฟล์โมเดล หรือ manifest ของ artifact (None = ไม่มีไฟล์ เช่นระหว่าง export)"""
+    target = os.path.join(path, MANIFEST_FILE) if is_artifact(path) else path
+    try:
+        st = os.stat(target)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ModelWatcher:
+    """
+    เฝ้าไฟล์โมเดลใน thread แยก loader(path) คืนโมเดลที่พร้อมใช้ (โยน exception = ใช้ไม่ได้)
+    take() คืนโมเดลที่โหลดเสร็จแล้วแต่ยังไม่ถูกนำไปใช้ (หรือ None)
+    """
+
+    def __init__(self, path, loader, poll_sec=MODEL_POLL_SEC, settle_sec=RELOAD_SETTLE_SEC):
+        self.path = path
+        self.loader = loader
+        self.poll_sec = poll_sec
+        self.settle_sec = settle_sec
+        self.signature = model_signature(path)
+        self.reloads = 0
+        self.failures = 0
+        self._ready = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="csi-model-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        pending, since = None, None
+        while not self._stop.wait(self.poll_sec):
+            signature = model_signature(self.path)
+            if signature is None or signature == self.signature:
+                pending = None
+                continue
+            if signature != pending:
+                pending, since = signature, time.monotonic()
+            if time.monotonic() - since < self.settle_sec:
+                continue
+            try:
+                model = self.loader(self.path)
+            except Exception as e:
+                self.failures += 1
+                print(f"\nModel reload failed ({e}); keeping the current model.")
+            else:
+                with self._lock:
+                    self._ready = model
+            # ไฟล์เดียวกันโหลดครั้งเดียว (สำเร็จหรือไม่ก็ตาม) จนกว่าจะเปลี่ยนอีก
+            self.signature, pending = signature, None
+
+    def take(self):
+        with self._lock:
+            model, self._ready = self._ready, None
+        if model is not None:
+            self.reloads += 1
+        return model
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+class StreamClient:
+    """client ของ /stream: คิวข้อความของตัวเอง ส่งแบบ non-blocking"""
+
+    def __init__(self, sock, address, max_backlog=MAX_STREAM_BACKLOG):
+        sock.setblocking(False)
+        self.sock = sock
+        self.address = address
+        self.queue = deque()
+        self.max_backlog = max_backlog
+        self.current = b""      # ข้อความที่ส่งไปได้บางส่วน (ต้องส่งให้ครบก่อนข้อความถัดไป)
+        self.dropped = 0
+
+    def send(self, message):
+        if len(self.queue) >= self.max_backlog:
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(message)
+        self.flush()
+
+    def flush(self):
+        """ส่งเท่าที่ socket รับได้ตอนนี้ (โยน OSError ถ้าการเชื่อมต่อหลุด)"""
+        while self.current or self.queue:
+            if not self.current:
+                self.current = self.queue.popleft()
+            try:
+                sent = self.sock.send(self.current)
+            except BlockingIOError:
+                return
+            self.current = self.current[sent:]
+
+    def close(self):
+        self.sock.close()
+
+
+def _http_response(status, body, content_type='application/json'):
+    return (f"HTTP/1.0 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n").encode('ascii') + body
+
+
+def _json_line(value):
+    return (json.dumps(value, separators=(',', ':')) + "\n").encode()
+
+
+class PositionServer:
+    """HTTP server ของตำแหน่งล่าสุด / สตรีมตำแหน่ง ลูปหลักเรียก publish() ทุกครั้งที่ได้ตำแหน่งใหม่"""
+
+    def __init__(self, host=SERVICE_HOST, port=SERVICE_PORT, status=None):
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()
+        self.status = status        # ฟังก์ชันคืน dict ข้อมูลเพิ่มเติมของ /status
+        self.clients = []
+        self.latest = None          # JSON ของตำแหน่งล่าสุด (bytes)
+        self.seq = 0
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._acceptor = threading.Thread(target=self._accept_loop, name="csi-service-accept", daemon=True)
+
+    def start(self):
+        self._acceptor.start()
+        return self
+
+    def publish_position(self, x, y, t, model_name, device_t=None):
+        self.seq += 1
+        position = {'x': round(float(x), 4), 'y': round(float(y), 4), 't': float(t),
+                    'seq': self.seq, 'model': model_name}
+        if device_t is not None and device_t == device_t:   # NaN = ไม่มีเวลาของบอร์ด
+            position['device_t'] = float(device_t)
+        message = _json_line(position)
+        self.latest = message
+        self._broadcast(message)
+
+    def publish_event(self, event):
+        self._broadcast(_json_line({'event': event.kind, 't': float(event.t), 'score': round(event.score, 3),
+                                    'correlation': round(event.correlation, 3)}))
+
+    def flush(self):
+        """ส่งข้อมูลที่ค้างอยู่ของทุก client (เรียกจากลูปหลักแม้ไม่มีตำแหน่งใหม่)"""
+        self._broadcast(None)
+
+    def _broadcast(self, message):
+        with self._lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                if message is None:
+                    client.flush()
+                else:
+                    client.send(message)
+            except OSError:
+                self._remove(client)
+
+    def _remove(self, client):
+        with self._lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        client.close()
+        print(f"\nStream client {client.address} disconnected (dropped {client.dropped} messages).")
+
+    def _accept_loop(self):
+        """รับการเชื่อมต่อและตอบ request (thread แยก ไม่หน่วงการทำนาย)"""
+        self.server.settimeout(0.2)
+        while not self.stop_event.is_set():
+            try:
+                sock, address = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                self._handle(sock, address)
+            except OSError:
+                sock.close()
+
+    def _read_request_path(self, sock):
+        sock.settimeout(REQUEST_TIMEOUT_SEC)
+        data = b""
+        try:
+            while b"\r\n\r\n" not in data and b"\n\n" not in data and len(data) < 8192:
+                chunk = sock.recv(1024)
+                if not chunk:
+                    break
+                data += chunk
+        except socket.timeout:
+            pass
+        parts = data.split(b"\n", 1)[0].decode('ascii', 'replace').split()
+        if len(parts) < 2:
+            return None, None
+        return parts[0], parts[1].split('?', 1)[0]
+
+    def _handle(self, sock, address):
+        method, path = self._read_request_path(sock)
+        if method != 'GET':
+            sock.sendall(_http_response('405 Method Not Allowed', b'{"error":"only GET is supported"}\n'))
+        elif path == '/latest':
+            latest = self.latest
+            if latest is None:
+                sock.sendall(_http_response('503 Service Unavailable', b'{"error":"no position yet"}\n'))
+            else:
+                sock.sendall(_http_response('200 OK', latest))
+        elif path == '/status':
+            sock.sendall(_http_response('200 OK', _json_line(self.status_dict())))
+        elif path == '/stream':
+            sock.sendall(b"HTTP/1.0 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                         b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+            with self._lock:
+                self.clients.append(StreamClient(sock, address))
+            print(f"\nStream client {address} connected.")
+            return
+        else:
+            sock.sendall(_http_response('404 Not Found', b'{"error":"use /latest, /stream or /status"}\n'))
+        sock.close()
+
+    def status_dict(self):
+        with self._lock:
+            clients = list(self.clients)
+        status = {'positions': self.seq, 'stream_clients': len(clients),
+                  'dropped': sum(client.dropped for client in clients)}
+        if self.status is not None:
+            status.update(self.status())
+        return status
+
+    def close(self):
+        self.stop_event.set()
+        if self._acceptor.is_alive():
+            self._acceptor.join()
+        self.server.close()
+        with self._lock:
+            clients, self.clients = self.clients, []
+        for client in clients:
+            client.close()
+
+
+def add_service_metrics(registry, watcher, server):
+    """เพิ่มค่าของ watcher / server เข้า MetricsRegistry (csi_metrics.py) อ่านตอน export"""
+    reloads = registry.counter('csi_model_reloads_total', 'Models swapped in while running')
+    failures = registry.counter('csi_model_reload_failures_total', 'Changed model files that could not be used')
+    clients = registry.gauge('csi_stream_clients', 'Connected /stream clients')
+    dropped = registry.counter('csi_stream_dropped_total', 'Stream messages dropped for slow clients (connected clients)')
+
+    def collect():
+        reloads.value, failures.value = watcher.reloads, watcher.failures
+        with server._lock:
+            connected = list(server.clients)
+        clients.value = len(connected)
+        dropped.value = sum(client.dropped for client in connected)
+    registry.add_collector(collect)
@@ -0,0 +1,334 @@
+import glob
+import gzip
+import io
+import itertools
+import json
+import os
+import time
+import zlib
+
+import numpy as np
+
+from csi_capture import STREAM_BLOCK_ROWS, _finite_rows, parse_csv_lines
+
+try:
+    import zstandard
+except ImportError:     # zstd เป็นตัวเลือกเสริม (pip install zstandard)
+    zstandard = None
+
+# --- บันทึกข้อมูลเป็น session: CSV หลายไฟล์ (segment) + index (ทนต่อโปรแกรมค้าง/สาย USB หลุด) ---
+# 1 session = 1 โฟลเดอร์ <name>.session ที่มี
+#   segment_0000.csv[.gz|.zst], segment_0001... = CSV รูปแบบเดิม (มี header ทุกไฟล์ เปิดแยกกันได้)
+#   index.json = รายการ segment พร้อมช่วงเวลา (host time.time()) และจำนวนแถว ใช้เลือกอ่านเฉพาะช่วงที่ต้องการ
+# - แถวถูกพักในหน่วยความจำแล้วเขียนทีละ batch_rows แถว
+# - เปิด segment ใหม่เมื่อครบ rotate_sec วินาที หรือข้อมูล (ก่อนบีบอัด) เกิน rotate_bytes
+# - ทุก checkpoint_sec วินาที: เขียนแถวที่พักไว้, flush ตัวบีบอัด (sync flush ถอดรหัสได้ถึงจุดนี้),
+#   fsync ไฟล์ แล้วเขียน index ใหม่แบบ atomic (ไฟล์ชั่วคราว + os.replace)
+#   ถ้าโปรแกรมหยุดกะทันหัน ข้อมูลหายไม่เกินช่วง checkpoint สุดท้าย และ segment ที่ค้างอยู่มี closed = false
+# ฝั่งอ่าน (iter_session_blocks) อ่านทุกบรรทัดที่สมบูรณ์ แม้ไฟล์บีบอัดจะถูกตัดกลางทาง
+
+SESSION_SUFFIX = '.session'
+SEGMENT_PREFIX = 'segment_'
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+COMPRESSIONS = (None, 'gzip', 'zstd')
+COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+
+ROTATE_SEC = 600                # เปิด segment ใหม่ทุกกี่วินาที (None = ไม่แบ่งตามเวลา)
+ROTATE_BYTES = 64 << 20         # ขนาดข้อมูลก่อนบีบอัดสูงสุดต่อ segment (None = ไม่แบ่งตามขนาด)
+WRITE_BATCH_ROWS = 256          # จำนวนแถวที่พักไว้ก่อนเขียน 1 ครั้ง
+CHECKPOINT_SEC = 5.0            # flush + fsync + อัปเดต index ทุกกี่วินาที
+READ_CHUNK_BYTES = 1 << 20
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+        _fsync(f)
+    os.replace(tmp_path, path)
+
+
+class _SegmentStream:
+    """ไฟล์ segment 1 ไฟล์ (บีบอัดหรือไม่ก็ได้) ที่ flush ให้ถอดรหัสได้ถึงจุดปัจจุบันได้ตลอด"""
+
+    def __init__(self, path, compression, level):
+        self.raw = open(path, 'xb')     # ไม่เขียนทับไฟล์ที่มีอยู่ (เช่น segment ที่ index ยังไม่ได้บันทึก)
+        if compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=level)
+        elif compression == 'zstd':
+            self.stream = zstandard.ZstdCompressor(level=level).stream_writer(self.raw, closefd=False)
+        else:
+            self.stream = self.raw
+        self.compression = compression
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def sync(self):
+        """ให้ข้อมูลที่เขียนแล้วทั้งหมดลงดิสก์ในรูปที่ถอดรหัสได้"""
+        if self.compression == 'gzip':
+            self.stream.flush(zlib.Z_SYNC_FLUSH)
+        elif self.compression == 'zstd':
+            self.stream.flush(zstandard.FLUSH_BLOCK)
+        _fsync(self.raw)
+
+    def close(self):
+        if self.stream is not self.raw:
+            self.stream.close()
+        _fsync(self.raw)
+        self.raw.close()
+
+
+class SessionRecorder:
+    """
+    เขียนแถว CSV (ข้อความไม่รวม newline) ลง session แบบแบ่งไฟล์ บีบอัด และ checkpoint เป็นระยะ
+    header = บรรทัด header ของ CSV (เขียนซ้ำทุก segment), metadata = dict ที่บันทึกใน index
+    """
+
+    def __init__(self, path, header, compression=None, level=None, rotate_sec=ROTATE_SEC,
+                 rotate_bytes=ROTATE_BYTES, batch_rows=WRITE_BATCH_ROWS, checkpoint_sec=CHECKPOINT_SEC,
+                 metadata=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"unknown compression '{compression}' (expected one of {COMPRESSIONS})")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression needs the 'zstandard' package (pip install zstandard)")
+        self.path = path
+        self.header = header.rstrip('\n')
+        self.compression = compression
+        self.level = DEFAULT_LEVELS.get(compression) if level is None else level
+        self.rotate_sec = rotate_sec
+        self.rotate_bytes = rotate_bytes
+        self.batch_rows = batch_rows
+        self.checkpoint_sec = checkpoint_sec
+        os.makedirs(path, exist_ok=True)
+
+        self.index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(self.index_path):
+            # เขียนต่อ session เดิม (เช่นหลังโปรแกรมค้าง): segment เดิมไม่ถูกแก้ เริ่ม segment ใหม่
+            self.index = read_index(path)
+            if self.index['header'] != self.header:
+                raise ValueError(f"{path}: existing session has a different CSV header")
+        else:
+            self.index = {'version': INDEX_VERSION, 'header': self.header, 'segments': []}
+        self.index['compression'] = compression
+        self.index['metadata'] = metadata or self.index.get('metadata', {})
+
+        self._pending = []
+        self._segment = None
+        self._stream = None
+        self._segment_opened = 0.0
+        self._segment_bytes = 0
+        self._last_checkpoint = time.monotonic()
+        self.rows = 0
+
+    def _next_segment_number(self):
+        """
+        หมายเลข segment ถัดไปที่ยังไม่มีไฟล์ ทั้งใน index และบนดิสก์
+        (โปรแกรมหยุดหลังสร้างไฟล์แต่ก่อนเขียน index ครั้งแรก ไฟล์นั้นไม่อยู่ใน index แต่ยังมีข้อมูล)
+        """
+        number = len(self.index['segments'])
+        for path in glob.glob(os.path.join(self.path, SEGMENT_PREFIX + '*')):
+            digits = os.path.basename(path)[len(SEGMENT_PREFIX):].split('.', 1)[0]
+            if digits.isdigit():
+                number = max(number, int(digits) + 1)
+        return number
+
+    def _open_segment(self, t):
+        number = self._next_segment_number()
+        name = f"{SEGMENT_PREFIX}{number:04d}.csv{COMPRESSION_EXTENSIONS[self.compression]}"
+        self._stream = _SegmentStream(os.path.join(self.path, name), self.compression, self.level)
+        header = (self.header + '\n').encode('ascii')
+        self._stream.write(header)
+        self._segment_bytes = len(header)
+        self._segment_opened = time.monotonic()
+        self._segment = {'file': name, 'start_time': t, 'end_time': t, 'samples': 0, 'closed': False}
+        self.index['segments'].append(self._segment)
+
+    def _close_segment(self):
+        if self._stream is None:
+            return
+        self._stream.close()
+        self._stream = None
+        self._segment['closed'] = True
+        self._segment = None
+
+    def _rotate_due(self):
+        if self.rotate_sec is not None and time.monotonic() - self._segment_opened >= self.rotate_sec:
+            return True
+        return self.rotate_bytes is not None and self._segment_bytes >= self.rotate_bytes
+
+    def write(self, line, t=None):
+        """เพิ่ม 1 แถว (t = เวลา host ของแถวนี้ ค่าเริ่มต้น time.time())"""
+        self._pending.append((line, time.time() if t is None else t))
+        if len(self._pending) >= self.batch_rows:
+            self.flush()
+        elif time.monotonic() - self._last_checkpoint >= self.checkpoint_sec:
+            self.checkpoint()
+
+    def write_rows(self, rows, t=None, fmt='%.2f'):
+        """เพิ่มหลายแถวจาก array (N, n_cols) ในครั้งเดียว"""
+        buf = io.StringIO()
+        np.savetxt(buf, rows, fmt=fmt, delimiter=',')
+        t = time.time() if t is None else t
+        for line in buf.getvalue().splitlines():
+            self.write(line, t)
+
+    def flush(self):
+        """เขียนแถวที่พักไว้ (แบ่ง segment ตามเงื่อนไข) ไม่ fsync"""
+        pending, self._pending = self._pending, []
+        start = 0
+        while start < len(pending):
+            if self._stream is None:
+                self._open_segment(pending[start][1])
+            # เขียนให้ได้มากที่สุดก่อนถึงขนาดที่ต้องแบ่ง segment
+            end = len(pending)
+            if self.rotate_bytes is not None:
+                room = self.rotate_bytes - self._segment_bytes
+                sizes = np.cumsum([len(line) + 1 for line, _ in pending[start:end]])
+                end = start + max(int(np.searchsorted(sizes, room, side='right')), 1)
+            data = ('\n'.join(line for line, _ in pending[start:end]) + '\n').encode('ascii')
+            self._stream.write(data)
+            self._segment_bytes += len(data)
+            self._segment['samples'] += end - start
+            self._segment['end_time'] = pending[end - 1][1]
+            self.rows += end - start
+            start = end
+            if self._rotate_due():
+                self._close_segment()
+                _write_json_atomic(self.index_path, self.index)
+
+    def checkpoint(self):
+        """เขียนแถวที่พักไว้ แล้ว fsync ข้อมูลและ index (ข้อมูลถึงจุดนี้ปลอดภัยแม้โปรแกรมหยุดกะทันหัน)"""
+        self.flush()
+        if self._stream is not None:
+            self._stream.sync()
+        _write_json_atomic(self.index_path, self.index)
+        self._last_checkpoint = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._close_segment()
+        _write_json_atomic(self.index_path, self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_index(path):
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        index = json.load(f)
+    if index.get('version') != INDEX_VERSION:
+        raise ValueError(f"{path}: unsupported session index version {index.get('version')!r}")
+    return index
+
+
+def find_sessions(folder_path, pattern='*'):
+    """หา session ทั้งหมดในโฟลเดอร์ (เฉพาะโฟลเดอร์ที่มี index)"""
+    paths = sorted(glob.glob(os.path.join(folder_path, pattern + SESSION_SUFFIX)))
+    return [p for p in paths if os.path.exists(os.path.join(p, INDEX_FILE))]
+
+
+def select_segments(index, t_start=None, t_end=None):
+    """segment ที่ช่วงเวลาซ้อนกับ [t_start, t_end] (None = ไม่จำกัด) ไม่ต้องเปิดไฟล์ข้อมูล"""
+    return [s for s in index['segments']
+            if (t_start is None or s['end_time'] >= t_start) and (t_end is None or s['start_time'] <= t_end)]
+
+
+def _iter_chunks(path):
+    """
+    อ่านไฟล์ segment เป็นก้อนข้อมูลที่ถอดรหัสแล้ว
+    ไฟล์บีบอัดที่ถูกตัดกลางทาง (โปรแกรมหยุดก่อนปิดไฟล์) คืนข้อมูลเท่าที่ถอดได้ ไม่โยน error
+    """
+    with open(path, 'rb') as f:
+        if path.endswith('.gz'):
+            decoder = zlib.decompressobj(wbits=31)
+            while True:
+                data = f.read(READ_CHUNK_BYTES)
+                if not data:
+                    break
+                try:
+                    yield decoder.decompress(data)
+                except zlib.error:
+                    return
+        elif path.endswith('.zst'):
+            if zstandard is None:
+                raise ValueError(f"{path}: reading zstd segments needs the 'zstandard' package")
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+            while True:
+                try:
+                    data = reader.read(READ_CHUNK_BYTES)
+                except zstandard.ZstdError:
+                    return
+                if not data:
+                    break
+                yield data
+        else:
+            while True:
+                data = f.read(READ_CHUNK_BYTES)
+                if not data:
+                    break
+                yield data
+
+
+def iter_segment_lines(path):
+    """บรรทัดข้อมูลของ segment (ไม่รวม header และบรรทัดสุดท้ายที่เขียนไม่ครบ)"""
+    tail = b''
+    for chunk in _iter_chunks(path):
+        lines = (tail + chunk).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line.decode('ascii', 'replace').rstrip('\r')
+
+
+def iter_session_blocks(session_path, block_rows=STREAM_BLOCK_ROWS, t_start=None, t_end=None):
+    """
+    อ่าน session ทีละ block_rows แถว คืนค่าแบบเดียวกับ csi_capture.iter_csv_blocks
+    (amplitudes float32, labels, จำนวนแถวที่ทิ้ง) เลือกเฉพาะ segment ในช่วงเวลาที่ต้องการได้
+    """
+    index = read_index(session_path)
+    header = index['header'].split(',')
+    if header[-2:] != ['pos_x', 'pos_y']:
+        raise ValueError(f"{session_path}: expected 'pos_x,pos_y' as the last header columns")
+    n_cols = len(header)
+    for segment in select_segments(index, t_start, t_end):
+        lines = iter_segment_lines(os.path.join(session_path, segment['file']))
+        next(lines, None)   # header
+        while True:
+            block = list(itertools.islice(lines, block_rows))
+            if not block:
+                break
+            data = parse_csv_lines(block, n_cols)
+            amplitudes, labels, dropped = _finite_rows(data[:, :-2], data[:, -2:])
+            yield amplitudes, labels, dropped + len(block) - len(data)
+
+
+def format_index(index):
+    lines = [f"{'segment':<22} {'start':>19} {'duration s':>11} {'samples':>9} {'closed':>7}"]
+    for s in index['segments']:
+        start = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(s['start_time']))
+        lines.append(f"{s['file']:<22} {start:>19} {s['end_time'] - s['start_time']:>11.1f} "
+                     f"{s['samples']:>9} {'yes' if s['closed'] else 'NO':>7}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import sys
+    # ใช้งาน: python csi_session.py <โฟลเดอร์ .session> แสดงรายการ segment
+    if len(sys.argv) < 2:
+        print("Usage: python csi_session.py <name.session>")
+        sys.exit(1)
+    try:
+        print(format_index(read_index(sys.argv[1])))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,237 @@
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from csi_protocol import CsiFrame
+
+# --- ส่งเฟรม CSI ให้หลายโปรแกรมผ่าน shared memory (ไม่ pickle / ไม่คัดลอกต่อผู้อ่านฝั่ง writer) ---
+# writer 1 ตัว (csi_hub.py) เขียนเฟรมลง ring buffer ขนาดคงที่ใน shared memory
+# reader กี่ตัวก็ได้อ่านจาก memory เดียวกันโดยไม่ใช้ lock และไม่ต้องแจ้ง writer
+#   - แต่ละ reader มี cursor ของตัวเอง (อ่านช้าไม่ทำให้ writer หรือ reader อื่นช้าลง)
+#   - ถ้า reader อ่านไม่ทันจนเฟรมถูกเขียนทับ จะข้ามไปเฟรมเก่าสุดที่ยังอยู่ และนับไว้ใน overruns
+# ลำดับการเขียน: writer เขียนข้อมูลลงช่องก่อน แล้วค่อยเพิ่ม head (จำนวนเฟรมที่เขียนทั้งหมด)
+# reader คัดลอกช่อง [cursor, head) แล้วอ่าน head อีกครั้ง ช่องที่ writer อาจเขียนทับระหว่างคัดลอกจะถูกทิ้ง
+# (ช่องถัดจาก head คือช่องที่ writer กำลังเขียน จึงอ่านได้สูงสุด capacity - 1 เฟรมย้อนหลัง)
+#
+# ใช้งาน: รัน csi_hub.py (เขียนลง SHARED_MEMORY_NAME) แล้วตั้ง SERIAL_PORT = 'shm://csi_frames'
+# ใน csi_predictor.py / csi_visualizer.py / csi_collector.py
+
+SHM_URL_PREFIX = 'shm://'
+SHM_NAME = 'csi_frames'
+SHM_CAPACITY = 4096             # จำนวนเฟรมใน ring buffer
+SHM_MAX_SUBCARRIERS = 256       # จำนวน amplitude สูงสุดต่อเฟรม (เฟรมที่ยาวกว่าถูกตัด)
+SHM_POLL_SEC = 0.002            # ความถี่ที่ reader ตรวจหาเฟรมใหม่ระหว่างรอ
+RSSI_UNKNOWN = -32768           # ค่า rssi ใน shared memory เมื่อเฟรมไม่มี rssi (อ่านกลับเป็น None)
+
+SHM_MAGIC = 0x43534952          # 'CSIR'
+SHM_VERSION = 2                 # 2 = เพิ่มคอลัมน์ iq (เฟรม FLAG_IQ ใช้กับ FEATURE_MODE แบบ phase ได้)
+# header: int64 x 8 = magic, version, capacity, max_subcarriers, head, writer_open, (สำรอง)
+HEADER_SLOTS = 8
+HEADER_BYTES = HEADER_SLOTS * 8
+H_MAGIC, H_VERSION, H_CAPACITY, H_MAX_SC, H_HEAD, H_WRITER_OPEN = range(6)
+
+_created_here = set()           # segment ที่ writer ในโปรแกรมนี้สร้าง (resource_tracker ต้องรู้จักไว้)
+
+
+def record_dtype(max_subcarriers):
+    """โครงสร้างของ 1 เฟรมใน shared memory (ขนาดคงที่)"""
+    return np.dtype([
+        ('seq', '<u8'),
+        ('timestamp_us', '<u8'),
+        ('host_time', '<f8'),
+        ('rssi', '<i2'),
+        ('n_sc', '<u2'),
+        ('n_iq', '<u2'),                            # จำนวนค่า I/Q (0 = เฟรมไม่มี I/Q)
+        ('amplitudes', '<f4', (max_subcarriers,)),
+        ('iq', 'i1', (2 * max_subcarriers,)),       # I/Q ดิบ int8 (I, Q สลับกัน) ของเฟรม FLAG_IQ
+    ])
+
+
+def _attach(name):
+    """เปิด segment ที่มีอยู่แล้วโดยไม่ให้ resource_tracker ลบทิ้งเมื่อโปรแกรมนี้ปิด"""
+    try:
+        return shared_memory.SharedMemory(name, track=False)    # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name)
+        if os.name == 'posix' and name not in _created_here:
+            # Python < 3.13 ลงทะเบียนทุก segment ที่เปิด แล้วลบทิ้งตอนจบโปรแกรม ทั้งที่ writer ยังใช้อยู่
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _map(shm):
+    """สร้าง view ของ header และ ring buffer บน shared memory (ไม่คัดลอก)"""
+    header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=shm.buf)
+    if header[H_MAGIC] != SHM_MAGIC or header[H_VERSION] != SHM_VERSION:
+        raise ValueError(f"shared memory '{shm.name}' is not a CSI frame buffer (version {SHM_VERSION})")
+    dtype = record_dtype(int(header[H_MAX_SC]))
+    records = np.ndarray((int(header[H_CAPACITY]),), dtype=dtype, buffer=shm.buf, offset=HEADER_BYTES)
+    return header, records
+
+
+class SharedFrameWriter:
+    """ฝั่งเขียน (มีได้ตัวเดียวต่อชื่อ) สร้าง segment ใหม่และลบทิ้งเมื่อ close()"""
+
+    def __init__(self, name=SHM_NAME, capacity=SHM_CAPACITY, max_subcarriers=SHM_MAX_SUBCARRIERS):
+        size = HEADER_BYTES + capacity * record_dtype(max_subcarriers).itemsize
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # segment ค้างจาก writer ที่ปิดไม่สมบูรณ์ (reader เดิมต้องเชื่อมต่อใหม่)
+            stale = _attach(name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.name = name
+        _created_here.add(name)
+        header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=self.shm.buf)
+        header[:] = 0
+        header[H_MAGIC], header[H_VERSION] = SHM_MAGIC, SHM_VERSION
+        header[H_CAPACITY], header[H_MAX_SC] = capacity, max_subcarriers
+        header[H_WRITER_OPEN] = 1
+        self.header, self.records = _map(self.shm)
+        self.capacity = capacity
+        self.max_subcarriers = max_subcarriers
+        self.head = 0
+        # view ของแต่ละคอลัมน์สร้างครั้งเดียว (เขียนทีละเฟรมโดยไม่สร้าง view ใหม่)
+        self._seq = self.records['seq']
+        self._timestamp = self.records['timestamp_us']
+        self._host_time = self.records['host_time']
+        self._rssi = self.records['rssi']
+        self._n_sc = self.records['n_sc']
+        self._amplitudes = self.records['amplitudes']
+        self._n_iq = self.records['n_iq']
+        self._iq = self.records['iq']
+
+    def write(self, frame, host_time):
+        """เขียน CsiFrame 1 เฟรม (seq/timestamp ที่เป็น None บันทึกเป็น 0, rssi เป็น RSSI_UNKNOWN)"""
+        i = self.head % self.capacity
+        n = min(len(frame.amplitudes), self.max_subcarriers)
+        self._seq[i] = frame.seq or 0
+        self._timestamp[i] = frame.timestamp_us or 0
+        self._host_time[i] = host_time
+        self._rssi[i] = RSSI_UNKNOWN if frame.rssi is None else frame.rssi
+        self._n_sc[i] = n
+        self._amplitudes[i, :n] = frame.amplitudes[:n]
+        n_iq = 0 if frame.iq is None else len(frame.iq)
+        if n_iq > 2 * self.max_subcarriers:
+            n_iq = 0    # ตัด I/Q ครึ่งๆ ไม่ได้ (phase ผิด) ส่งเฉพาะ amplitude
+        self._n_iq[i] = n_iq
+        self._iq[i, :n_iq] = frame.iq[:n_iq] if n_iq else 0
+        # เผยแพร่หลังเขียนข้อมูลครบแล้วเท่านั้น
+        self.head += 1
+        self.header[H_HEAD] = self.head
+
+    def close(self):
+        if self.shm is None:
+            return
+        self.header[H_WRITER_OPEN] = 0
+        self.header = self.records = None
+        self._seq = self._timestamp = self._host_time = self._rssi = self._n_sc = self._amplitudes = None
+        self._n_iq = self._iq = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+        _created_here.discard(self.name)
+
+
+class SharedFrameReader:
+    """
+    ฝั่งอ่าน: ใช้แทน serial.Serial กับ read_frames() ได้ (read_frames / flushInput / close)
+    หรือเรียก read() เพื่อรับเฟรมเป็น structured array
+    start='latest' เริ่มอ่านจากเฟรมถัดไป, 'oldest' เริ่มจากเฟรมเก่าสุดที่ยังอยู่ใน buffer
+    """
+
+    def __init__(self, name=SHM_NAME, timeout=1, start='latest'):
+        self.shm = _attach(name)
+        self.header, self.records = _map(self.shm)
+        self.name = name
+        self.port = f"{SHM_URL_PREFIX}{name}"
+        self.timeout = timeout
+        self.capacity = len(self.records)
+        self.is_open = True
+        self.overruns = 0       # จำนวนเฟรมที่ถูกเขียนทับก่อน reader นี้อ่านทัน
+        # buffer ของ reader เอง จองครั้งเดียว ผลของ read() เป็น view ที่ใช้ได้จนถึงการ read ครั้งถัดไป
+        self._out = np.empty(self.capacity, dtype=self.records.dtype)
+        head = int(self.header[H_HEAD])
+        self.cursor = head if start == 'latest' else max(head - self.capacity + 1, 0)
+
+    @classmethod
+    def from_url(cls, url, timeout=1):
+        """shm://<name>"""
+        return cls(url[len(SHM_URL_PREFIX):] or SHM_NAME, timeout)
+
+    @property
+    def in_waiting(self):
+        """จำนวนเฟรมที่ยังไม่ได้อ่าน (ไม่ใช่จำนวนไบต์)"""
+        return int(self.header[H_HEAD]) - self.cursor
+
+    @property
+    def writer_open(self):
+        return bool(self.header[H_WRITER_OPEN])
+
+    def read(self, max_records=None):
+        """คัดลอกเฟรมใหม่ทั้งหมด (หรือไม่เกิน max_records) คืน structured array ตาม record_dtype"""
+        head = int(self.header[H_HEAD])
+        cursor = self.cursor
+        oldest = head - self.capacity + 1
+        if cursor < oldest:
+            self.overruns += oldest - cursor
+            cursor = oldest
+        n = head - cursor
+        if max_records is not None:
+            n = min(n, max_records)
+        if n <= 0:
+            return self._out[:0]
+
+        start = cursor % self.capacity
+        first = min(n, self.capacity - start)
+        self._out[:first] = self.records[start:start + first]
+        self._out[first:n] = self.records[:n - first]
+
+        # ช่องที่ writer เขียนทับระหว่างคัดลอก (ถ้าอ่านช้ามาก) ใช้ไม่ได้ ข้ามไป
+        lost = min(max(int(self.header[H_HEAD]) - self.capacity + 1 - cursor, 0), n)
+        self.overruns += lost
+        self.cursor = cursor + n
+        return self._out[lost:n]
+
+    def wait(self, timeout=None):
+        """รอจนมีเฟรมใหม่หรือหมดเวลา (โยน ConnectionError ถ้า writer ปิดไปแล้วและไม่มีเฟรมเหลือ)"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + (timeout if timeout is not None else 1e9)
+        while self.in_waiting <= 0:
+            if not self.writer_open:
+                raise ConnectionError(f"shared memory writer '{self.name}' closed")
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(SHM_POLL_SEC)
+        return True
+
+    def read_frames(self, framer=None):
+        """
+        รอเฟรมใหม่ตาม timeout แล้วคืนรายการ CsiFrame (amplitudes / iq เป็น view ของ buffer ของ reader
+        ใช้ได้จนถึงการอ่านครั้งถัดไป) ถ้าส่ง framer มาจะตรวจจำนวน subcarrier และนับสถิติแบบเดียวกับ Serial
+        """
+        if not self.wait():
+            return []
+        records = self.read()
+        frames = [CsiFrame(int(r['seq']), int(r['timestamp_us']),
+                           None if r['rssi'] == RSSI_UNKNOWN else int(r['rssi']), r['amplitudes'][:r['n_sc']],
+                           r['iq'][:r['n_iq']] if r['n_iq'] else None)
+                  for r in records]
+        return framer.feed_frames(frames) if framer is not None else frames
+
+    def reset_input_buffer(self):
+        self.cursor = int(self.header[H_HEAD])
+
+    flushInput = reset_input_buffer
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.header = self.records = None
+        self._out = None
+        self.shm.close()
+        self.is_open = False
@@ -0,0 +1,151 @@
+import json
+import math
+from collections import namedtuple
+
+import numpy as np
+
+# --- Survey อัตโนมัติตามแผนตำแหน่ง (ใช้กับ csi_collector.py <plan>) ---
+# ไฟล์แผนแบบ JSON:
+#   {
+#     "dwell_sec": 60,              เวลาเก็บสูงสุดต่อจุด (ค่าเริ่มต้นของทุกจุด)
+#     "settle_sec": 10,             เวลาให้ย้ายอุปกรณ์ไปจุดถัดไปก่อนเริ่มเก็บ
+#     "confirm": false,             true = รอกด Enter ก่อนเก็บแต่ละจุด
+#     "target_samples": 3000,       หยุดเมื่อได้ครบจำนวนเฟรมนี้ (null = ไม่ใช้)
+#     "max_stderr": 0.05,           หยุดเมื่อ standard error ของค่าเฉลี่ยทุก subcarrier ไม่เกินค่านี้ (null = ไม่ใช้)
+#     "min_samples": 200,           จำนวนเฟรมขั้นต่ำก่อนเช็ค max_stderr
+#     "grid": {"x": [1, 3, 1], "y": [1, 3, 0.5], "serpentine": true},   [เริ่ม, สิ้นสุด, ระยะห่าง]
+#     "points": [{"x": 4.5, "y": 2.0, "dwell_sec": 30}]                 จุดเพิ่มเติม (ต่อท้าย grid)
+#   }
+# หรือไฟล์ข้อความ/CSV 1 จุดต่อบรรทัด: x,y[,dwell_sec] (บรรทัดที่ขึ้นต้นด้วย # ถูกข้าม)
+# grid แบบ serpentine เดินกลับทิศทุกแถว (ไม่ต้องเดินย้อนกลับไปต้นแถว)
+
+DEFAULT_DWELL_SEC = 60
+DEFAULT_SETTLE_SEC = 10
+DEFAULT_MIN_SAMPLES = 200
+
+SurveyPoint = namedtuple('SurveyPoint', ['x', 'y', 'dwell_sec'])
+SurveyPlan = namedtuple('SurveyPlan', ['points', 'settle_sec', 'confirm', 'target_samples', 'max_stderr',
+                                       'min_samples'])
+
+
+def _axis_values(spec, name):
+    """[เริ่ม, สิ้นสุด, ระยะห่าง] -> ค่าบนแกน (รวมจุดสิ้นสุด) หรือ list ของค่าโดยตรง"""
+    if len(spec) != 3:
+        return [float(v) for v in spec]
+    start, stop, step = (float(v) for v in spec)
+    if step <= 0 or stop < start:
+        raise ValueError(f"grid '{name}' needs start <= stop and step > 0, got {spec}")
+    n = int(math.floor((stop - start) / step + 1e-9)) + 1
+    return [round(start + i * step, 6) for i in range(n)]
+
+
+def grid_points(grid, dwell_sec):
+    """จุดของ grid เรียงทีละแถว (y) serpentine=true สลับทิศ x ทุกแถว"""
+    xs = _axis_values(grid['x'], 'x')
+    ys = _axis_values(grid['y'], 'y')
+    points = []
+    for row, y in enumerate(ys):
+        row_xs = xs[::-1] if grid.get('serpentine', True) and row % 2 else xs
+        points.extend(SurveyPoint(x, y, dwell_sec) for x in row_xs)
+    return points
+
+
+def _load_point_list(path, dwell_sec):
+    points = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                values = [float(v) for v in line.split(',')]
+            except ValueError:
+                if not points and line_no == 1:
+                    continue    # header เช่น x,y,dwell_sec
+                raise ValueError(f"{path}:{line_no}: expected 'x,y[,dwell_sec]', got '{line}'")
+            if len(values) not in (2, 3):
+                raise ValueError(f"{path}:{line_no}: expected 'x,y[,dwell_sec]', got '{line}'")
+            points.append(SurveyPoint(values[0], values[1], values[2] if len(values) == 3 else dwell_sec))
+    return points
+
+
+def load_plan(path):
+    """อ่านไฟล์แผน (.json หรือรายการจุด x,y[,dwell_sec]) คืนค่า SurveyPlan"""
+    if not path.lower().endswith('.json'):
+        points = _load_point_list(path, DEFAULT_DWELL_SEC)
+        config = {}
+    else:
+        with open(path) as f:
+            config = json.load(f)
+        dwell_sec = float(config.get('dwell_sec', DEFAULT_DWELL_SEC))
+        points = grid_points(config['grid'], dwell_sec) if 'grid' in config else []
+        for p in config.get('points', []):
+            points.append(SurveyPoint(float(p['x']), float(p['y']), float(p.get('dwell_sec', dwell_sec))))
+    if not points:
+        raise ValueError(f"{path}: survey plan has no positions")
+    if any(p.dwell_sec <= 0 for p in points):
+        raise ValueError(f"{path}: dwell_sec must be positive")
+    target_samples = config.get('target_samples')
+    max_stderr = config.get('max_stderr')
+    return SurveyPlan(points, float(config.get('settle_sec', DEFAULT_SETTLE_SEC)), bool(config.get('confirm', False)),
+                      None if target_samples is None else int(target_samples),
+                      None if max_stderr is None else float(max_stderr),
+                      int(config.get('min_samples', DEFAULT_MIN_SAMPLES)))
+
+
+class ConvergenceMonitor:
+    """
+    ติดตามค่าเฉลี่ย/ความแปรปรวนของแต่ละ subcarrier แบบ online (Welford, รวมทีละบล็อกแบบ Chan)
+    done() คืนเหตุผลที่หยุดได้: 'target' = ครบ target_samples เฟรม,
+    'converged' = standard error ของค่าเฉลี่ย sqrt(var / n) ทุก subcarrier <= max_stderr
+    (fingerprint ที่ใช้ฝึกนิ่งแล้ว เก็บต่อไม่ได้ข้อมูลเพิ่ม) หรือ None = ยังเก็บต่อ
+    """
+
+    def __init__(self, target_samples=None, max_stderr=None, min_samples=DEFAULT_MIN_SAMPLES):
+        self.target_samples = target_samples
+        self.max_stderr = max_stderr
+        self.min_samples = min_samples
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, amplitudes):
+        """เพิ่มเฟรม 1 เฟรม (1 มิติ) หรือหลายเฟรม (2 มิติ)"""
+        block = np.atleast_2d(np.asarray(amplitudes, dtype=np.float64))
+        n_b = len(block)
+        if n_b == 0:
+            return
+        mean_b = block.mean(axis=0)
+        m2_b = ((block - mean_b) ** 2).sum(axis=0)
+        if self.mean is None:
+            self.n, self.mean, self.m2 = n_b, mean_b, m2_b
+            return
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * (n_b / n)
+        self.m2 = self.m2 + m2_b + delta ** 2 * (self.n * n_b / n)
+        self.n = n
+
+    def stderr(self):
+        """standard error ของค่าเฉลี่ยที่มากที่สุดในทุก subcarrier (inf ถ้ายังมีไม่ถึง 2 เฟรม)"""
+        if self.n < 2:
+            return np.inf
+        return float(np.sqrt(self.m2.max() / (self.n - 1) / self.n))
+
+    def done(self):
+        if self.target_samples is not None and self.n >= self.target_samples:
+            return 'target'
+        if self.max_stderr is not None and self.n >= self.min_samples and self.stderr() <= self.max_stderr:
+            return 'converged'
+        return None
+
+
+def format_survey_results(results):
+    """ตารางสรุปผล survey: results = list ของ (SurveyPoint, จำนวนเฟรม, วินาที, เหตุผลที่หยุด)"""
+    lines = [f"{'x':>7} {'y':>7} {'samples':>8} {'time s':>7} {'stop':>10}"]
+    for point, samples, elapsed, reason in results:
+        lines.append(f"{point.x:>7g} {point.y:>7g} {samples:>8} {elapsed:>7.1f} {reason:>10}")
+    total = sum(r[2] for r in results)
+    planned = sum(r[0].dwell_sec for r in results)
+    lines.append(f"Total collection time: {total:.0f} s (planned maximum {planned:.0f} s)")
+    return "\n".join(lines)
@@ -0,0 +1,208 @@
+import hashlib
+import itertools
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge
+from sklearn.neighbors import KNeighborsRegressor
+
+from csi_compress import MIN_FEATURE_STD
+from csi_index import make_index, measure_latency
+
+# --- Sweep ค่า hyper-parameter ด้วย leave-one-position-out cross-validation ---
+# แต่ละ fold กันตำแหน่ง (pos_x, pos_y) ไว้ 1 ตำแหน่ง ฝึกด้วยตำแหน่งที่เหลือ แล้ววัดระยะผิดพลาด
+# ข้อมูลของแต่ละ fold (หลัง preprocess) ถูกเก็บเป็นไฟล์ .npy ใน cache
+# worker แต่ละ process เปิดด้วย np.load(mmap_mode='r') จึงไม่ต้องส่ง array ข้าม process
+# และการ sweep รอบถัดไปไม่ต้อง parse ไฟล์ CSV ใหม่
+
+SWEEP_CACHE_DIR = '.sweep_cache'
+FEATURE_SUBSETS = ('all', 'active')             # 'active' = ตัด subcarrier ที่แทบไม่เปลี่ยนค่า
+NORMALISATIONS = ('none', 'zscore', 'frame')    # 'frame' = หารด้วยค่าเฉลี่ยของเฟรม (ตัดผลของ gain/AGC)
+NEIGHBOR_MODELS = ('knn', 'brute', 'ivf')       # โมเดลที่ใช้ค่า n_neighbors / weights
+RANDOM_FOREST_TREES = 50
+
+
+def _signature_files(path):
+    """ไฟล์ที่ใช้คิดรหัสของข้อมูล 1 ชุด: ตัวไฟล์เอง หรือทุกไฟล์ในโฟลเดอร์ (.csicap / .session)"""
+    if not os.path.isdir(path):
+        return [(os.path.basename(path), path)]
+    # ขนาด/เวลาของโฟลเดอร์ไม่เปลี่ยนเมื่อเขียนต่อท้ายไฟล์คอลัมน์หรือ segment เดิม จึงดูไฟล์ข้างใน
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            full = os.path.join(root, name)
+            files.append((os.path.join(os.path.basename(path), os.path.relpath(full, path)), full))
+    return sorted(files)
+
+
+def file_signature(paths):
+    """รหัสของชุดไฟล์ข้อมูล (ชื่อ ขนาด เวลาแก้ไข) ใช้ตั้งชื่อ cache"""
+    h = hashlib.sha1()
+    for path in sorted(paths):
+        for name, full in _signature_files(path):
+            st = os.stat(full)
+            h.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()[:16]
+
+
+def load_cached_dataset(paths, load_fn, cache_dir=SWEEP_CACHE_DIR):
+    """
+    คืนค่า (X, y, cache_path) ของข้อมูลทั้งหมด ถ้าไฟล์ข้อมูลไม่เปลี่ยนจะอ่านจาก cache (.npy)
+    แทนการเรียก load_fn() ซึ่ง parse ไฟล์ต้นฉบับ
+    """
+    cache_path = os.path.join(cache_dir, file_signature(paths))
+    x_path, y_path = os.path.join(cache_path, 'X.npy'), os.path.join(cache_path, 'y.npy')
+    if os.path.exists(x_path) and os.path.exists(y_path):
+        return np.load(x_path, mmap_mode='r'), np.load(y_path, mmap_mode='r'), cache_path
+
+    X, y = load_fn()
+    if X is None:
+        return None, None, None
+    os.makedirs(cache_path, exist_ok=True)
+    np.save(x_path, np.asarray(X, dtype=np.float32))
+    np.save(y_path, np.asarray(y, dtype=np.float32))
+    return np.load(x_path, mmap_mode='r'), np.load(y_path, mmap_mode='r'), cache_path
+
+
+def position_folds(y):
+    """leave-one-position-out: คืน list ของ (ตำแหน่ง, mask ของแถวทดสอบ)"""
+    positions, inverse = np.unique(np.asarray(y), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return [(tuple(float(v) for v in position), inverse == p) for p, position in enumerate(positions)]
+
+
+def preprocess_fold(X_train, X_test, features='all', normalisation='none'):
+    """เลือก feature และ normalise โดยหาค่าสถิติจากข้อมูลฝึกของ fold เท่านั้น"""
+    X_train = np.asarray(X_train, dtype=np.float32)
+    X_test = np.asarray(X_test, dtype=np.float32)
+    if features == 'active':
+        keep = np.flatnonzero(X_train.std(axis=0) > MIN_FEATURE_STD)
+        X_train, X_test = X_train[:, keep], X_test[:, keep]
+    elif features != 'all':
+        raise ValueError(f"unknown feature subset '{features}' (expected one of {FEATURE_SUBSETS})")
+
+    if normalisation == 'zscore':
+        mean = X_train.mean(axis=0)
+        std = np.maximum(X_train.std(axis=0), MIN_FEATURE_STD)
+        X_train, X_test = (X_train - mean) / std, (X_test - mean) / std
+    elif normalisation == 'frame':
+        X_train = X_train / np.maximum(X_train.mean(axis=1, keepdims=True), MIN_FEATURE_STD)
+        X_test = X_test / np.maximum(X_test.mean(axis=1, keepdims=True), MIN_FEATURE_STD)
+    elif normalisation != 'none':
+        raise ValueError(f"unknown normalisation '{normalisation}' (expected one of {NORMALISATIONS})")
+    return X_train, X_test
+
+
+def prepare_fold_cache(X, y, cache_path, preprocessings):
+    """
+    เขียนข้อมูล train/test ของทุก fold และทุกแบบ preprocess ลง cache (ข้ามไฟล์ที่มีอยู่แล้ว)
+    คืนค่า dict {(features, normalisation): [โฟลเดอร์ของแต่ละ fold]} และรายชื่อตำแหน่งของ fold
+    """
+    folds = position_folds(y)
+    fold_dirs = {}
+    for features, normalisation in preprocessings:
+        dirs = []
+        for i, (_, test_mask) in enumerate(folds):
+            fold_dir = os.path.join(cache_path, f"{features}_{normalisation}_fold{i}")
+            if not os.path.exists(os.path.join(fold_dir, 'y_test.npy')):
+                X_train, X_test = preprocess_fold(X[~test_mask], X[test_mask], features, normalisation)
+                os.makedirs(fold_dir, exist_ok=True)
+                np.save(os.path.join(fold_dir, 'X_train.npy'), X_train)
+                np.save(os.path.join(fold_dir, 'y_train.npy'), np.asarray(y[~test_mask], dtype=np.float32))
+                np.save(os.path.join(fold_dir, 'X_test.npy'), X_test)
+                # เขียน y_test ท้ายสุด: ถ้าไฟล์นี้มีอยู่แปลว่า fold นี้เขียนครบแล้ว
+                np.save(os.path.join(fold_dir, 'y_test.npy'), np.asarray(y[test_mask], dtype=np.float32))
+            dirs.append(fold_dir)
+        fold_dirs[(features, normalisation)] = dirs
+    return fold_dirs, [position for position, _ in folds]
+
+
+def make_regressor(model, n_neighbors=5, weights='uniform'):
+    """สร้างโมเดลตามชื่อ: 'knn' (sklearn), 'brute' / 'ivf' (csi_index), 'random-forest', 'ridge'"""
+    if model == 'knn':
+        return KNeighborsRegressor(n_neighbors=n_neighbors, weights=weights)
+    if model in ('brute', 'ivf'):
+        return make_index(model, n_neighbors, weights)
+    if model == 'random-forest':
+        return RandomForestRegressor(n_estimators=RANDOM_FOREST_TREES, n_jobs=1, random_state=0)
+    if model == 'ridge':
+        return Ridge(alpha=1.0)
+    raise ValueError(f"unknown model '{model}'")
+
+
+def expand_grid(models, neighbors, weights, features, normalisations):
+    """
+    สร้างรายการ config (dict) จากทุกค่าผสม
+    โมเดลที่ไม่ใช้ n_neighbors/weights จะไม่ถูกขยายตามสองค่านี้ (ไม่เกิด config ซ้ำ)
+    """
+    configs = []
+    for model, feat, norm in itertools.product(models, features, normalisations):
+        if model in NEIGHBOR_MODELS:
+            for k, w in itertools.product(neighbors, weights):
+                configs.append({'model': model, 'n_neighbors': k, 'weights': w, 'features': feat, 'normalisation': norm})
+        else:
+            configs.append({'model': model, 'n_neighbors': None, 'weights': None, 'features': feat, 'normalisation': norm})
+    return configs
+
+
+def _load_fold(fold_dir):
+    return [np.load(os.path.join(fold_dir, name + '.npy'), mmap_mode='r')
+            for name in ('X_train', 'y_train', 'X_test', 'y_test')]
+
+
+def evaluate_fold(task):
+    """(worker) ฝึกและทดสอบ 1 config บน 1 fold คืนค่า (config_id, errors, size_bytes, latency_ms)"""
+    config_id, config, fold_dir = task
+    X_train, y_train, X_test, y_test = _load_fold(fold_dir)
+    model = make_regressor(config['model'], config['n_neighbors'] or 5, config['weights'] or 'uniform')
+    model.fit(X_train, y_train)
+    errors = np.linalg.norm(np.asarray(model.predict(X_test)) - y_test, axis=1)
+    return config_id, errors, len(pickle.dumps(model)), measure_latency(model, X_test)
+
+
+def run_sweep(X, y, cache_path, configs, workers=None):
+    """
+    ประเมินทุก config ด้วย leave-one-position-out แบบขนาน (1 งาน = 1 config x 1 fold)
+    คืนค่า list ของ dict ผลลัพธ์ เรียงตาม median error
+    """
+    preprocessings = sorted({(c['features'], c['normalisation']) for c in configs})
+    fold_dirs, positions = prepare_fold_cache(X, y, cache_path, preprocessings)
+    if len(positions) < 2:
+        raise ValueError("leave-one-position-out needs data from at least 2 positions")
+
+    tasks = [(config_id, config, fold_dir)
+             for config_id, config in enumerate(configs)
+             for fold_dir in fold_dirs[(config['features'], config['normalisation'])]]
+    errors = {config_id: [] for config_id in range(len(configs))}
+    sizes = {config_id: [] for config_id in range(len(configs))}
+    latencies = {config_id: [] for config_id in range(len(configs))}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for config_id, fold_errors, size, latency in pool.map(evaluate_fold, tasks, chunksize=4):
+            errors[config_id].append(fold_errors)
+            sizes[config_id].append(size)
+            latencies[config_id].append(latency)
+
+    results = []
+    for config_id, config in enumerate(configs):
+        all_errors = np.concatenate(errors[config_id])
+        results.append(dict(config,
+                            median_error=float(np.median(all_errors)),
+                            p90_error=float(np.percentile(all_errors, 90)),
+                            size_kb=float(np.mean(sizes[config_id])) / 1024,
+                            latency_ms=float(np.mean(latencies[config_id]))))
+    results.sort(key=lambda r: r['median_error'])
+    return results
+
+
+def format_sweep_results(results):
+    """จัดผลลัพธ์จาก run_sweep เป็นตาราง (เรียงจาก error น้อยไปมาก)"""
+    lines = [f"{'model':<13} {'k':>3} {'weights':<8} {'features':<8} {'norm':<6} "
+             f"{'median err':>10} {'p90 err':>8} {'size(KB)':>9} {'ms/frame':>9}"]
+    for r in results:
+        lines.append(f"{r['model']:<13} {r['n_neighbors'] or '-':>3} {r['weights'] or '-':<8} "
+                     f"{r['features']:<8} {r['normalisation']:<6} {r['median_error']:>10.3f} "
+                     f"{r['p90_error']:>8.3f} {r['size_kb']:>9.1f} {r['latency_ms']:>9.4f}")
+    return "\n".join(lines)
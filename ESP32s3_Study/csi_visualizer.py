@@ -2,37 +2,115 @@ import serial
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import numpy as np
-from collections import deque
+import threading
+import time
+
+from csi_filters import make_filter
+from csi_framer import CsiFramer, read_frames
+from csi_hub import open_serial
+from csi_metrics import IngestMetrics, RenderMetrics, create_metrics
+from csi_ringbuffer import FrameRingBuffer
 
 # ---!!! ตั้งค่าที่สำคัญ !!!---
-SERIAL_PORT = 'COM10'  # <--- แก้ไข Port ของคุณตรงนี้
+SERIAL_PORT = 'COM10'  # <--- แก้ไข Port ของคุณตรงนี้ ('hub://127.0.0.1:5760' หรือ 'shm://csi_frames' = อ่านผ่าน csi_hub.py)
 BAUD_RATE = 115200
 NUM_SUBcarriers = 64
+SERIAL_FORMAT = 'text' # 'text' = CSI_DATA,... (เดิม), 'binary' = เฟรมไบนารี, 'auto' = รับทั้งสองแบบ
 
 # ---!!! ค่าสำหรับปรับความนิ่ง (Smoothing) !!!---
 # ยิ่งค่าสูง กราฟจะยิ่งนิ่งแต่จะตอบสนองช้าลง (แนะนำ: 3-10)
 SMOOTHING_WINDOW_SIZE = 5
+# ตัวกรอง (ดู csi_filters.py): 'moving-average' (เดิม), 'ema', 'median', 'hampel' หรือ 'none'
+SMOOTHING_FILTER = 'moving-average'
+EMA_ALPHA = 0.3
+
+# ---!!! การแสดงผล !!!---
+# 'bars' = amplitude ของแต่ละ subcarrier (เดิม), 'waterfall' = amplitude ตามเวลา (spectrogram), 'both' = ทั้งสองแบบ
+VIEW_MODE = 'both'
+HISTORY_FRAMES = 300        # จำนวนเฟรมย้อนหลังใน ring buffer (= ความสูงของ waterfall)
+RENDER_INTERVAL_MS = 50     # วาดกราฟทุกกี่ ms (ไม่ขึ้นกับอัตราที่ข้อมูลเข้ามา)
+AMPLITUDE_MAX = 40          # ค่าสูงสุดของแกน amplitude / สีของ waterfall
+# Metrics (csi_metrics.py): None = ปิด, 'log', 'http' (http://127.0.0.1:9108/metrics) หรือ 'log+http'
+METRICS_EXPORT = None
 
 # --- ตัวแปรสำหรับเก็บข้อมูล ---
 ser = None
-# ใช้ deque เพื่อเก็บข้อมูล CSI ย้อนหลังตามขนาดของ window
-csi_history = deque(maxlen=SMOOTHING_WINDOW_SIZE) 
+framer = CsiFramer(SERIAL_FORMAT)
+# thread อ่าน Serial เขียนเฟรมลง ring buffer, การวาดกราฟอ่านจาก buffer เดียวกันตามจังหวะของตัวเอง
+csi_ring = FrameRingBuffer(HISTORY_FRAMES, NUM_SUBcarriers)
+# ตัวกรองทำงานทุกเฟรมใน thread อ่าน ผลล่าสุดเก็บใน buffer 1 แถว (อ่าน/เขียนผ่าน lock ของ buffer)
+csi_filter = make_filter(SMOOTHING_FILTER, NUM_SUBcarriers, window=SMOOTHING_WINDOW_SIZE, alpha=EMA_ALPHA)
+smoothed_ring = FrameRingBuffer(1, NUM_SUBcarriers)
 latest_smoothed_csi = np.zeros(NUM_SUBcarriers)
+render_metrics = None
 
 # --- ตั้งค่ากราฟ (ปรับขนาดให้กว้างขึ้น) ---
 # figsize=(width, height) หน่วยเป็นนิ้ว
-fig, ax = plt.subplots(figsize=(12, 6)) # <--- ปรับขนาดกราฟตรงนี้
-bars = ax.bar(range(NUM_SUBcarriers), latest_smoothed_csi)
+if VIEW_MODE == 'both':
+    fig, (ax, ax_waterfall) = plt.subplots(2, 1, figsize=(12, 9)) # <--- ปรับขนาดกราฟตรงนี้
+elif VIEW_MODE == 'waterfall':
+    fig, ax_waterfall = plt.subplots(figsize=(12, 6))
+    ax = None
+else:
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax_waterfall = None
+
+artists = []
+spectrum = None
+waterfall = None
+if ax is not None:
+    # แท่งกราฟทั้งหมดเป็น artist เดียว (StepPatch) อัปเดตครั้งเดียวต่อการวาด แทน set_height ทีละแท่ง
+    spectrum = ax.stairs(latest_smoothed_csi, np.arange(NUM_SUBcarriers + 1) - 0.5, fill=True)
+    artists.append(spectrum)
+    ax.set_xlim(-0.5, NUM_SUBcarriers - 0.5)
+    ax.set_ylim(0, AMPLITUDE_MAX)
+    ax.set_xlabel('Subcarrier Index')
+    ax.set_ylabel('Amplitude')
+    ax.set_title(f'Real-time CSI Amplitude (filter: {SMOOTHING_FILTER})')
+if ax_waterfall is not None:
+    waterfall = ax_waterfall.imshow(csi_ring.ordered(), aspect='auto', origin='lower', interpolation='nearest',
+                                    vmin=0, vmax=AMPLITUDE_MAX, extent=(-0.5, NUM_SUBcarriers - 0.5, -HISTORY_FRAMES, 0))
+    artists.append(waterfall)
+    ax_waterfall.set_xlabel('Subcarrier Index')
+    ax_waterfall.set_ylabel('Frames ago')
+    ax_waterfall.set_title(f'CSI Amplitude Waterfall (last {HISTORY_FRAMES} frames)')
+    fig.colorbar(waterfall, ax=ax_waterfall, label='Amplitude')
+fig.tight_layout()
+
+def ingest_frame(amplitudes):
+    """เขียนเฟรมดิบลง ring buffer แล้วกรองเฟรมนั้นเก็บผลไว้ให้การวาดกราฟ"""
+    csi_ring.append(amplitudes)
+    row = csi_ring.latest(1)[0]     # เฟรมที่เติม 0 / ตัดให้ยาว NUM_SUBcarriers แล้ว
+    smoothed_ring.append(csi_filter.update(row))
+
+class SerialReader(threading.Thread):
+    """อ่านเฟรมจาก Serial ตลอดเวลาใน background แล้วเขียนลง ring buffer (ไม่รอการวาดกราฟ)"""
 
-ax.set_ylim(0, 40)
-ax.set_xlabel('Subcarrier Index')
-ax.set_ylabel('Amplitude')
-ax.set_title(f'Real-time CSI Amplitude (Smoothed over {SMOOTHING_WINDOW_SIZE} frames)')
+    def __init__(self, ser, framer, metrics=None):
+        super().__init__(name="csi-visualizer-reader", daemon=True)
+        self.ser = ser
+        self.framer = framer
+        self.metrics = metrics
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                for csi_frame in read_frames(self.ser, self.framer, self.metrics):
+                    ingest_frame(csi_frame.amplitudes)
+        except (serial.SerialException, OSError) as e:
+            self.error = e
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
 
 def init_serial():
     global ser
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+        # timeout สั้นเพื่อให้ thread อ่านหยุดได้เร็วเมื่อปิดหน้าต่าง
+        ser = open_serial(SERIAL_PORT, BAUD_RATE, timeout=0.1)
         # เคลียร์ buffer เก่าที่อาจค้างอยู่
         ser.flushInput()
         print(f"Connected to {SERIAL_PORT} at {BAUD_RATE} bps.")
@@ -43,38 +121,40 @@ def init_serial():
 
 # --- ฟังก์ชันสำหรับอัปเดตกราฟ ---
 def update_graph(frame):
+    """วาดจากข้อมูลใน ring buffer (ไม่อ่าน Serial เอง) อัปเดต 1 ครั้งต่อ artist"""
     global latest_smoothed_csi
-    if ser and ser.is_open:
-        try:
-            line = ser.readline().decode('utf-8').strip()
-            
-            if line.startswith('CSI_DATA,'):
-                parts = line.split(',')[1:]
-                csi_values = np.array([float(p) for p in parts if p], dtype=float)
-                
-                # เพิ่มข้อมูลใหม่เข้าไปใน history
-                if len(csi_values) > 0:
-                    full_csi_frame = np.zeros(NUM_SUBcarriers)
-                    num_received = len(csi_values)
-                    full_csi_frame[:num_received] = csi_values
-                    csi_history.append(full_csi_frame)
-
-                # --- ส่วนของการทำ Smoothing ---
-                # คำนวณค่าเฉลี่ยจากข้อมูลใน history
-                if len(csi_history) > 0:
-                    latest_smoothed_csi = np.mean(csi_history, axis=0)
-                
-                # อัปเดตความสูงของแท่งกราฟ
-                for bar, height in zip(bars, latest_smoothed_csi):
-                    bar.set_height(height)
-
-        except Exception as e:
-            pass
-    return bars
+    started = time.perf_counter()
+    # --- ส่วนของการทำ Smoothing ---
+    # ใช้ผลล่าสุดของตัวกรองที่ thread อ่านคำนวณไว้แล้ว
+    if smoothed_ring.total > 0:
+        latest_smoothed_csi = smoothed_ring.latest(1)[0]
+
+    if spectrum is not None:
+        spectrum.set_data(latest_smoothed_csi)
+    if waterfall is not None:
+        waterfall.set_data(csi_ring.ordered())
+    if render_metrics is not None:
+        render_metrics.observe(started, time.perf_counter())
+    return artists
 
 # --- เริ่มการทำงาน ---
-if init_serial():
-    ani = animation.FuncAnimation(fig, update_graph, blit=True, interval=20, save_count=0)
-    plt.show()
-    ser.close()
-    print("Serial port closed.")
\ No newline at end of file
+if __name__ == "__main__":
+    if init_serial():
+        metrics, exporter = create_metrics(METRICS_EXPORT)
+        ingest = None
+        if metrics is not None:
+            ingest = IngestMetrics(metrics)
+            ingest.track(framer)
+            render_metrics = RenderMetrics(metrics)
+        reader = SerialReader(ser, framer, ingest)
+        reader.start()
+        ani = animation.FuncAnimation(fig, update_graph, blit=True, interval=RENDER_INTERVAL_MS, save_count=0)
+        plt.show()
+        reader.stop()
+        if reader.error is not None:
+            print(f"Serial error: {reader.error}")
+        ser.close()
+        print("Serial port closed.")
+        print(f"Stream quality: {framer.stats_line()}")
+        if exporter is not None:
+            exporter.close()
@@ -1,18 +1,21 @@
 import serial
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-from collections import deque
 import time
 import threading
 
+from csi_hub import open_serial
+from csi_liveplot import TimeSeriesBuffer, update_time_series
+from csi_protocol import RECORD_DISTANCE, RECORD_DISTANCE_RSSI, parse_text_record
+
 # --- การตั้งค่า (CONFIGURATION) ---
-SERIAL_PORT = 'COM10' # TODO: แก้ไข Port ให้ถูกต้อง
+SERIAL_PORT = 'COM10' # TODO: แก้ไข Port ให้ถูกต้อง ('hub://127.0.0.1:5760' = อ่านผ่าน csi_hub.py)
 BAUD_RATE = 115200
-POINTS_TO_SHOW = 100000 # แสดง 100 จุดล่าสุด
+POINTS_TO_SHOW = 100000 # จำนวนจุดย้อนหลังที่เก็บไว้ (เก็บใน numpy ring buffer)
+WINDOW_SEC = 20 # ช่วงเวลาล่าสุดที่แสดงบนกราฟ (วินาที)
 
 # --- ตัวแปรสำหรับเก็บข้อมูล ---
-times = deque(maxlen=POINTS_TO_SHOW)
-distances = deque(maxlen=POINTS_TO_SHOW)
+distances = TimeSeriesBuffer(POINTS_TO_SHOW)
 start_time = time.time()
 ser = None
 
@@ -34,17 +37,8 @@ def setup_plot():
     return line,
 
 def update_plot(frame):
-    """ฟังก์ชันสำหรับอัปเดตกราฟในแต่ละเฟรม"""
-    if times:
-        time_window = max(20, times[-1])
-        ax.set_xlim(max(0, time_window - 20), time_window + 2)
-    
-        min_dist = min(distances)
-        max_dist = max(distances)
-        ax.set_ylim(min_dist - 1, max_dist + 1)
-
-    line.set_data(list(times), list(distances))
-    return line,
+    """ฟังก์ชันสำหรับอัปเดตกราฟในแต่ละเฟรม (วาดเฉพาะช่วงที่มองเห็น ย่อให้พอดีกับความกว้างกราฟ)"""
+    return update_time_series(ax, line, distances, WINDOW_SEC)
 
 def serial_reader_thread():
     """ฟังก์ชันสำหรับอ่านข้อมูลจาก Serial และดึงเฉพาะค่า Distance"""
@@ -52,27 +46,19 @@ def serial_reader_thread():
     while True:
         try:
             if not ser or not ser.is_open: break
-            line_str = ser.readline().decode('utf-8').strip()
-            
-            # --- Logic การอ่านข้อมูลที่แก้ไขแล้ว ---
-            if "Distance:" in line_str:
-                # แยกข้อมูลด้วย ',' ก่อน แล้วเอาส่วนท้ายมาทำงานต่อ
-                dist_part = line_str.split(',')[-1]
-                # แยกด้วย ':' แล้วเอาค่าตัวเลข
-                dist_val = float(dist_part.split(':')[1])
-                
+            # แยกบรรทัดด้วยตัวแปลงเดียวกับ csi_hub: รับทั้ง "Distance:<m>" (ESP32c3) และ "DISTANCE_RSSI,<m>"
+            record = parse_text_record(ser.readline())
+            if record.kind in (RECORD_DISTANCE, RECORD_DISTANCE_RSSI):
                 current_time = time.time() - start_time
                 
-                times.append(current_time)
-                distances.append(dist_val)
-            # ----------------------------------------
+                distances.append(current_time, record.value)
         except (serial.SerialException, TypeError, OSError, ValueError, IndexError):
             break
 
 # --- ส่วนการทำงานหลัก ---
 if __name__ == '__main__':
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+        ser = open_serial(SERIAL_PORT, BAUD_RATE, timeout=1)
         print(f"Connected to {SERIAL_PORT} at {BAUD_RATE} bps.")
 
         reader_thread = threading.Thread(target=serial_reader_thread, args=(), daemon=True)
@@ -1,4 +1,3 @@
-import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.neighbors import KNeighborsRegressor
@@ -7,65 +6,305 @@ import joblib
 import os
 import glob
 
+from csi_artifact import artifact_nbytes, export_artifact
+from csi_capture import STREAM_BLOCK_ROWS, find_captures, iter_capture_blocks, iter_csv_blocks, load_capture_dataset
+from csi_compress import CompressedFingerprintModel, evaluate_operating_points, format_operating_points
+from csi_index import BruteForceIndex, make_index, measure_latency, recall_at_k
+from csi_session import SESSION_SUFFIX, find_sessions, iter_session_blocks
+from csi_sweep import SWEEP_CACHE_DIR, expand_grid, format_sweep_results, load_cached_dataset, run_sweep
+
 # ---!!! ตั้งค่าที่สำคัญ !!!---
 DATA_FOLDER = r'C:\Users\user\Documents\GitHub\CSI_MINI_unclassic\ESP32s3_Study'
 MODEL_FILENAME = 'csi_knn_model.joblib'
+# export โมเดลเป็น artifact (.csimodel) ด้วย ให้ csi_predictor.py โหลดเร็วด้วย numpy อย่างเดียว (ดู csi_artifact.py)
+EXPORT_ARTIFACT = True
+ARTIFACT_FILENAME = 'csi_knn_model.csimodel'
+# 'auto' = ใช้ไฟล์ .csicap (memory-mapped) ถ้ามี ไม่เช่นนั้นใช้ CSV, 'csv' หรือ 'capture' = บังคับรูปแบบ
+# (โหมด CSV อ่านโฟลเดอร์ csi_data_x*.session จาก csi_collector.py ด้วย)
+DATA_FORMAT = 'auto'
+# feature ที่ใช้ฝึก (ดู csi_phase.py): 'amplitude' = amplitude เดิม,
+# 'amp+phase' / 'phase' = คำนวณจาก I/Q ดิบในคอลัมน์ iq ของ .csicap (เก็บด้วย CAPTURE_IQ = True ใน csi_collector.py)
+FEATURE_MODE = 'amplitude'
+
+# ---!!! ตัวเลือกของโมเดล (Fingerprint Index) !!!---
+# 'sklearn-knn' = KNeighborsRegressor (เดิม)
+# 'brute'       = ค้นหาแบบตรงด้วย numpy float32 (ผลเท่า sklearn แต่ไฟล์เล็กกว่า)
+# 'ivf'         = Approximate index สำหรับ radio map ขนาดใหญ่ (ดู csi_index.py)
+MODEL_BACKEND = 'sklearn-knn'
+N_NEIGHBORS = 5
+IVF_N_LISTS = 64        # จำนวนกลุ่มของ fingerprint (แนะนำ ~sqrt(จำนวนแถว))
+IVF_N_PROBE = 8         # จำนวนกลุ่มที่ค้นต่อ query: มากขึ้น = recall สูงขึ้นแต่ช้าลง
+IVF_QUANTIZE = 'int8'   # 'int8' = เก็บ fingerprint แบบ 1 ไบต์ต่อมิติ, None = float32
+
+# ---!!! การบีบอัด Fingerprint (PCA + prototype ต่อตำแหน่ง) !!!---
+COMPRESS_MODEL = False          # True = ลดมิติ + ย่อเฟรมของแต่ละตำแหน่งก่อนสร้าง index (ดู csi_compress.py)
+PCA_COMPONENTS = 16             # จำนวนมิติหลัง PCA (0 = ไม่ทำ PCA)
+PROTOTYPES_PER_POSITION = 32    # จำนวน prototype สูงสุดต่อ 1 ตำแหน่ง (0 = เก็บทุกเฟรม)
+# รายงานความแม่นยำเทียบกับขนาดโมเดลของหลายๆ ค่า เพื่อเลือกจุดที่เหมาะสม
+REPORT_OPERATING_POINTS = False
+OPERATING_POINTS_PCA = [0, 8, 16, 32]
+OPERATING_POINTS_PROTOTYPES = [0, 8, 32, 128]
 
-def load_and_combine_data(folder_path):
-    """ฟังก์ชันสำหรับอ่านและรวมไฟล์ CSV ทั้งหมด"""
-    csv_files = glob.glob(os.path.join(folder_path, 'csi_data_x*.csv'))
-    if not csv_files:
+# ---!!! การฝึกแบบ Streaming (ไม่โหลดข้อมูลทั้งหมดเข้าหน่วยความจำ) !!!---
+# 'full'   = โหลดทั้งหมดแล้วแบ่ง train/test (เดิม)
+# 'stream' = อ่านทีละบล็อก ทำความสะอาด แล้วเพิ่มเข้า index ทีละบล็อก (หน่วยความจำคงที่ตามขนาดบล็อก)
+# 'append' = เพิ่มเฉพาะไฟล์ใหม่เข้าโมเดลเดิมใน MODEL_FILENAME โดยไม่ฝึกใหม่ทั้งหมด
+# โหมด 'stream'/'append' ใช้ index ของ csi_index ('sklearn-knn' จะใช้ 'brute' แทน ผลเท่ากัน)
+TRAIN_MODE = 'full'
+STREAM_TEST_FRACTION = 0.2      # สัดส่วนแถวที่สุ่มกันไว้ทดสอบในแต่ละบล็อก
+STREAM_TEST_MAX_ROWS = 20000    # จำนวนแถวทดสอบสูงสุดที่เก็บไว้ในหน่วยความจำ
+STREAM_TRAIN_SAMPLES = 20000    # จำนวนตัวอย่างสำหรับหา centroid (ivf) / PCA ก่อนเพิ่มข้อมูล
+
+# ---!!! Sweep hyper-parameter (leave-one-position-out, ขนานทุก core) !!!---
+# True = ประเมินทุกค่าผสมด้านล่างแล้วพิมพ์ตารางผลลัพธ์ (ไม่บันทึกโมเดล) ดู csi_sweep.py
+SWEEP_MODE = False
+SWEEP_MODELS = ['knn', 'ivf', 'random-forest', 'ridge']
+SWEEP_NEIGHBORS = [1, 3, 5, 10]
+SWEEP_WEIGHTS = ['uniform', 'distance']
+SWEEP_FEATURES = ['all', 'active']
+SWEEP_NORMALISATIONS = ['none', 'zscore', 'frame']
+SWEEP_WORKERS = None            # None = ใช้ทุก core
+
+def load_features_from_csv(folder_path):
+    """
+    อ่านไฟล์ CSV (และ session) ด้วยตัวอ่านเดียวกับ TRAIN_MODE = 'stream' แล้วรวมเป็น (X, y)
+    แถวที่จำนวนคอลัมน์ไม่ครบหรือไม่ใช่ตัวเลข (เฟรมที่ขาดหรือหลายเฟรมต่อกัน เช่น "...,CSI_DATA,...")
+    และแถวที่มีค่าว่างถูกทิ้งทีละแถว ไม่ทำให้ทั้งไฟล์อ่านผิดและไม่ให้โมเดลเรียนรู้จากข้อมูลเสีย
+    """
+    paths = sorted(glob.glob(os.path.join(folder_path, 'csi_data_x*.csv')) + find_sessions(folder_path, 'csi_data_x*'))
+    if not paths:
         print(f"Error: No data files found in '{folder_path}'.")
-        return None
-    
-    df_list = []
-    for file in csv_files:
+        return None, None
+
+    X_blocks, y_blocks = [], []
+    dropped = 0
+    for path in paths:
         try:
-            df = pd.read_csv(file, on_bad_lines='skip')
-            df_list.append(df)
-        except Exception as e:
-            print(f"Could not read file {file} due to error: {e}")
+            blocks = list(iter_source_blocks(path))
+        except (ValueError, OSError) as e:
+            print(f"Could not read file {path} due to error: {e}")
+            continue
+        for X_block, y_block, n_dropped in blocks:
+            X_blocks.append(X_block)
+            y_blocks.append(y_block)
+            dropped += n_dropped
 
-    if not df_list:
+    if not X_blocks:
         print("No data could be loaded.")
-        return None
+        return None, None
 
-    full_df = pd.concat(df_list, ignore_index=True)
-    
+    X = np.concatenate(X_blocks)
+    y = np.concatenate(y_blocks)
     print(f"Data loaded successfully!")
-    print(f" - Found {len(csv_files)} data files.")
-    print(f" - Total valid samples: {len(full_df)}")
-    
-    if 'pos_x' not in full_df.columns or 'pos_y' not in full_df.columns:
-        print("Error: 'pos_x' or 'pos_y' columns not found in the data.")
-        return None
+    print(f" - Found {len(paths)} data files.")
+    print(f" - Total valid samples: {len(X)}")
+    print(f"\nCleaned data: Dropped {dropped} malformed rows.")
+    return X, y
+
+def load_features_from_captures(folder_path):
+    """เปิดไฟล์ .csicap ผ่าน np.memmap (ไม่ต้อง parse ข้อความ) คืนค่า (X, y)"""
+    try:
+        data = load_capture_dataset(folder_path, FEATURE_MODE)
+    except ValueError as e:
+        print(f"Error: Could not load captures: {e}")
+        return None, None
+    if data is None:
+        print(f"Error: No capture files found in '{folder_path}'.")
+        return None, None
+
+    X, y = data
+    print(f"Data loaded successfully!")
+    print(f" - Found {len(find_captures(folder_path))} capture files.")
+    print(f" - Total valid samples: {len(X)}")
+    return X, y
+
+def load_dataset(folder_path):
+    """โหลด (X, y) จาก .csicap หรือ CSV ตาม DATA_FORMAT"""
+    use_captures = DATA_FORMAT == 'capture' or (DATA_FORMAT == 'auto' and find_captures(folder_path))
+    if use_captures:
+        return load_features_from_captures(folder_path)
+    if FEATURE_MODE != 'amplitude':
+        print(f"Error: FEATURE_MODE = '{FEATURE_MODE}' needs .csicap captures with raw I/Q (CSV has amplitude only).")
+        return None, None
+    return load_features_from_csv(folder_path)
+
+def build_model():
+    """สร้างโมเดลตาม MODEL_BACKEND"""
+    ivf_options = {'n_lists': IVF_N_LISTS, 'n_probe': IVF_N_PROBE, 'quantize': IVF_QUANTIZE}
+    if COMPRESS_MODEL:
+        # โมเดลบีบอัดใช้ index ของ csi_index เสมอ ('sklearn-knn' จะใช้ 'brute' แทน)
+        backend = 'ivf' if MODEL_BACKEND == 'ivf' else 'brute'
+        return CompressedFingerprintModel(PCA_COMPONENTS, PROTOTYPES_PER_POSITION, backend, N_NEIGHBORS,
+                                          index_options=ivf_options if backend == 'ivf' else None)
+    if MODEL_BACKEND == 'sklearn-knn':
+        return KNeighborsRegressor(n_neighbors=N_NEIGHBORS)
+    return make_index(MODEL_BACKEND, N_NEIGHBORS, **ivf_options)
+
+def list_source_files(folder_path):
+    """ไฟล์ข้อมูลที่ใช้ฝึก (.csicap หรือ csi_data_x*.csv / .session ตาม DATA_FORMAT)"""
+    captures = find_captures(folder_path)
+    # feature จาก I/Q มีเฉพาะใน .csicap (CSV / session เก็บแค่ amplitude)
+    if DATA_FORMAT == 'capture' or (DATA_FORMAT == 'auto' and captures) or FEATURE_MODE != 'amplitude':
+        return captures
+    return sorted(glob.glob(os.path.join(folder_path, 'csi_data_x*.csv')) + find_sessions(folder_path, 'csi_data_x*'))
+
+def iter_source_blocks(path):
+    """อ่านไฟล์ข้อมูล 1 ไฟล์ทีละบล็อก คืนค่า (X, y, จำนวนแถวที่ทิ้ง)"""
+    if path.endswith('.csv'):
+        return iter_csv_blocks(path, STREAM_BLOCK_ROWS)
+    if path.rstrip('/\\').endswith(SESSION_SUFFIX):
+        return iter_session_blocks(path, STREAM_BLOCK_ROWS)
+    return iter_capture_blocks(path, STREAM_BLOCK_ROWS, FEATURE_MODE)
+
+def collect_training_sample(paths, n_samples, rng):
+    """สุ่มตัวอย่างจากทุกไฟล์ (ไฟล์ละเท่าๆ กัน) สำหรับ model.train() ก่อนเพิ่มข้อมูลทีละบล็อก"""
+    quota = max(n_samples // max(len(paths), 1), 1)
+    sample = []
+    for path in paths:
+        remaining = quota
+        for X_block, _, _ in iter_source_blocks(path):
+            take = min(remaining, len(X_block))
+            sample.append(X_block[rng.choice(len(X_block), take, replace=False)])
+            remaining -= take
+            if remaining == 0:
+                break
+    return np.concatenate(sample) if sample else None
 
-    return full_df
+def build_streaming_model():
+    """สร้างโมเดลที่รองรับ partial_fit ตาม MODEL_BACKEND"""
+    if MODEL_BACKEND == 'sklearn-knn' and not COMPRESS_MODEL:
+        return make_index('brute', N_NEIGHBORS)
+    return build_model()
+
+def train_streaming(mode):
+    """
+    ฝึก/เพิ่มข้อมูลเข้าโมเดลทีละบล็อก (TRAIN_MODE 'stream' หรือ 'append')
+    ทุกบล็อกสุ่มแถวส่วนหนึ่งไว้ทดสอบ ที่เหลือเพิ่มเข้าโมเดลด้วย partial_fit
+    ไฟล์ที่เคยใช้ฝึกแล้ว (model.sources_) จะถูกข้าม
+    """
+    rng = np.random.default_rng(42)
+    paths = list_source_files(DATA_FOLDER)
+    if not paths:
+        print(f"Error: No data files found in '{DATA_FOLDER}'.")
+        return
+
+    if mode == 'append':
+        if not os.path.exists(MODEL_FILENAME):
+            print(f"Error: Model file '{MODEL_FILENAME}' not found. Use TRAIN_MODE = 'stream' first.")
+            return
+        model = joblib.load(MODEL_FILENAME)
+        if not hasattr(model, 'partial_fit'):
+            print(f"Error: '{MODEL_FILENAME}' cannot be extended. Retrain it with TRAIN_MODE = 'stream'.")
+            return
+        model.sources_ = list(getattr(model, 'sources_', []))
+    else:
+        model = build_streaming_model()
+        model.sources_ = []
+
+    new_paths = [p for p in paths if os.path.basename(p) not in model.sources_]
+    print(f"Found {len(paths)} data files, {len(new_paths)} not yet in the model.")
+    if not new_paths:
+        return
+
+    if mode == 'stream' and model.requires_training:
+        print(f"Sampling up to {STREAM_TRAIN_SAMPLES} rows to train the index...")
+        model.train(collect_training_sample(new_paths, STREAM_TRAIN_SAMPLES, rng))
+
+    X_test = np.empty((STREAM_TEST_MAX_ROWS, 0), dtype=np.float32)
+    y_test = np.empty((STREAM_TEST_MAX_ROWS, 2), dtype=np.float32)
+    n_test = n_train = n_dropped = 0
+    for path in new_paths:
+        try:
+            for X_block, y_block, dropped in iter_source_blocks(path):
+                n_dropped += dropped
+                if X_test.shape[1] == 0:
+                    X_test = np.empty((STREAM_TEST_MAX_ROWS, X_block.shape[1]), dtype=np.float32)
+                held_out = rng.random(len(X_block)) < STREAM_TEST_FRACTION
+                keep = np.flatnonzero(held_out)[:STREAM_TEST_MAX_ROWS - n_test]
+                X_test[n_test:n_test + len(keep)] = X_block[keep]
+                y_test[n_test:n_test + len(keep)] = y_block[keep]
+                n_test += len(keep)
+                if (~held_out).any():
+                    model.partial_fit(X_block[~held_out], y_block[~held_out])
+                    n_train += int((~held_out).sum())
+        except (OSError, ValueError) as e:
+            print(f"Could not read file {path} due to error: {e}")
+            continue
+        model.sources_.append(os.path.basename(path))
+        print(f" - {path}: {n_train} training rows so far")
+
+    print(f"\nAdded {n_train} training rows ({n_dropped} malformed rows dropped), kept {n_test} test rows.")
+    if n_train == 0:
+        print("No data could be loaded.")
+        return
+
+    avg_error_distance = None
+    if n_test:
+        y_pred = model.predict(X_test[:n_test])
+        avg_error_distance = np.mean(np.sqrt(np.sum((y_test[:n_test] - y_pred)**2, axis=1)))
+        print("\n--- Model Evaluation (held-out rows of the new files) ---")
+        print(f"Average Error Distance on Test Set: {avg_error_distance:.2f} meters")
+        print(f"Predict latency: {measure_latency(model, X_test[:n_test]):.4f} ms/frame (batched)")
+    print(f"Model size in memory: {model.nbytes() / 1024:.1f} KB")
+
+    joblib.dump(model, MODEL_FILENAME)
+    print(f"\nModel has been saved to '{MODEL_FILENAME}' ({len(model.sources_)} data files)")
+    export_model_artifact(model, n_train, avg_error_distance)
+
+def export_model_artifact(model, n_train, test_error):
+    """บันทึก artifact คู่กับไฟล์ joblib (ข้อมูลการฝึกเก็บใน manifest)"""
+    if not EXPORT_ARTIFACT:
+        return
+    metadata = {
+        'backend': MODEL_BACKEND,
+        'compressed': COMPRESS_MODEL,
+        'feature_mode': FEATURE_MODE,
+        'train_rows': int(n_train),
+        'test_error_m': None if test_error is None else float(test_error),
+        'sources': list(getattr(model, 'sources_', [])),
+    }
+    try:
+        export_artifact(model, ARTIFACT_FILENAME, metadata)
+    except (OSError, ValueError) as e:
+        print(f"Could not export model artifact: {e}")
+        return
+    print(f"Model artifact has been saved to '{ARTIFACT_FILENAME}' ({artifact_nbytes(ARTIFACT_FILENAME) / 1024:.1f} KB)")
+
+def run_parameter_sweep():
+    """ประเมินทุก config ใน SWEEP_* ด้วย leave-one-position-out แล้วพิมพ์ตารางผลลัพธ์"""
+    paths = list_source_files(DATA_FOLDER)
+    if not paths:
+        print(f"Error: No data files found in '{DATA_FOLDER}'.")
+        return
+    # parse ไฟล์ข้อมูลครั้งแรกครั้งเดียว รอบถัดไปอ่านจาก cache
+    X, y, cache_path = load_cached_dataset(paths, lambda: load_dataset(DATA_FOLDER),
+                                           os.path.join(DATA_FOLDER, SWEEP_CACHE_DIR, FEATURE_MODE))
+    if X is None:
+        return
+
+    configs = expand_grid(SWEEP_MODELS, SWEEP_NEIGHBORS, SWEEP_WEIGHTS, SWEEP_FEATURES, SWEEP_NORMALISATIONS)
+    print(f"Sweeping {len(configs)} configs with leave-one-position-out on {len(X)} samples...")
+    try:
+        results = run_sweep(X, y, cache_path, configs, SWEEP_WORKERS)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    print("\n--- Sweep Results (leave-one-position-out) ---")
+    print(format_sweep_results(results))
 
 def train_and_save_model():
     """ฟังก์ชันหลักสำหรับฝึกสอนและบันทึกโมเดล"""
-    
-    # 1. โหลดข้อมูล
-    dataset = load_and_combine_data(DATA_FOLDER)
-    if dataset is None:
+    if SWEEP_MODE:
+        run_parameter_sweep()
+        return
+    if TRAIN_MODE in ('stream', 'append'):
+        train_streaming(TRAIN_MODE)
         return
-
-    # --- BUG FIX #1: จัดการค่าว่างใน Feature (X) ---
-    feature_columns = [col for col in dataset.columns if col not in ['pos_x', 'pos_y']]
-    dataset[feature_columns] = dataset[feature_columns].apply(pd.to_numeric, errors='coerce')
-    dataset.fillna(0, inplace=True)
-    print("\nCleaned feature data (X): Filled missing values with 0.")
     
-    # --- BUG FIX #2: ลบแถวที่ค่าพิกัด (y) เป็นค่าว่าง ---
-    initial_rows = len(dataset)
-    dataset.dropna(subset=['pos_x', 'pos_y'], inplace=True)
-    rows_dropped = initial_rows - len(dataset)
-    if rows_dropped > 0:
-        print(f"Cleaned label data (y): Dropped {rows_dropped} rows with missing coordinates.")
-
-    # 2. แยก Features (X) และ Labels (y)
-    X = dataset.drop(columns=['pos_x', 'pos_y']) 
-    y = dataset[['pos_x', 'pos_y']]
+    # 1-2. โหลดข้อมูล แล้วแยก Features (X) และ Labels (y)
+    X, y = load_dataset(DATA_FOLDER)
+    if X is None:
+        return
     
     # 3. แบ่งข้อมูลสำหรับ Train และ Test
     X_train, X_test, y_train, y_test = train_test_split(
@@ -74,21 +313,41 @@ def train_and_save_model():
     print(f"Data split into training ({len(X_train)} samples) and testing ({len(X_test)} samples).")
     
     # 4. สร้างและฝึกสอนโมเดล k-NN
-    print("\nTraining k-NN model...")
-    knn_model = KNeighborsRegressor(n_neighbors=5)
+    print(f"\nTraining k-NN model (backend: {MODEL_BACKEND})...")
+    knn_model = build_model()
     knn_model.fit(X_train, y_train)
     print("Model training complete!")
     
     # 5. ประเมินผลโมเดล
     y_pred = knn_model.predict(X_test)
-    avg_error_distance = np.mean(np.sqrt(np.sum((y_test.values - y_pred)**2, axis=1)))
+    avg_error_distance = np.mean(np.sqrt(np.sum((np.asarray(y_test) - y_pred)**2, axis=1)))
 
     print("\n--- Model Evaluation ---")
     print(f"Average Error Distance on Test Set: {avg_error_distance:.2f} meters")
+    print(f"Predict latency: {measure_latency(knn_model, X_test):.4f} ms/frame (batched)")
+    if hasattr(knn_model, 'nbytes'):
+        print(f"Model size in memory: {knn_model.nbytes() / 1024:.1f} KB")
+    if MODEL_BACKEND == 'ivf' and not COMPRESS_MODEL:
+        # เทียบกับการค้นหาแบบตรง เพื่อช่วยเลือก IVF_N_PROBE
+        exact = BruteForceIndex(N_NEIGHBORS).fit(X_train, y_train)
+        recall = recall_at_k(knn_model, exact, np.asarray(X_test, dtype=np.float32))
+        print(f"Recall@{N_NEIGHBORS} vs exact search (n_probe={IVF_N_PROBE}): {recall:.3f}")
+    
+    if REPORT_OPERATING_POINTS:
+        print("\n--- Accuracy vs. Model Size (PCA / prototypes per position) ---")
+        results = evaluate_operating_points(X_train, y_train, X_test, y_test,
+                                            OPERATING_POINTS_PCA, OPERATING_POINTS_PROTOTYPES,
+                                            backend='ivf' if MODEL_BACKEND == 'ivf' else 'brute',
+                                            n_neighbors=N_NEIGHBORS)
+        print(format_operating_points(results))
     
     # 6. บันทึกโมเดลที่ฝึกสอนแล้วลงไฟล์
+    if hasattr(knn_model, 'partial_fit'):
+        # จำไฟล์ที่ใช้ฝึก เพื่อให้ TRAIN_MODE = 'append' เพิ่มเฉพาะไฟล์ใหม่ได้ภายหลัง
+        knn_model.sources_ = [os.path.basename(p) for p in list_source_files(DATA_FOLDER)]
     joblib.dump(knn_model, MODEL_FILENAME)
     print(f"\nModel has been saved to '{MODEL_FILENAME}'")
+    export_model_artifact(knn_model, len(X_train), avg_error_distance)
     print("This file is your ready-to-use model!")
 
 if __name__ == "__main__":
@@ -1,22 +1,26 @@
 import serial
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-from collections import deque
 import time
 import threading
 
+from csi_hub import open_serial
+from csi_liveplot import TimeSeriesBuffer, update_time_series
+from csi_protocol import RECORD_DISTANCE, RECORD_DISTANCE_RSSI, parse_text_record
+
 # --- ตั้งค่า ---
 # TODO: แก้ไขให้ตรงกับ Port ของ ESP32 Gateway Node ของคุณ
 # Windows: 'COM3', 'COM4', ...
 # macOS: '/dev/cu.usbserial-xxxx'
 # Linux: '/dev/ttyUSB0', '/dev/ttyACM0', ...
+# หรือ 'hub://127.0.0.1:5760' เพื่ออ่านผ่าน csi_hub.py (ใช้ port เดียวกับโปรแกรมอื่นพร้อมกันได้)
 SERIAL_PORT = 'COM10'
 BAUD_RATE = 115200
-MAX_POINTS = 100000  # จำนวนจุดสูงสุดที่จะแสดงบนกราฟ
+MAX_POINTS = 100000  # จำนวนจุดย้อนหลังที่เก็บไว้ (เก็บใน numpy ring buffer)
+WINDOW_SEC = 20  # ช่วงเวลาล่าสุดที่แสดงบนกราฟ (วินาที)
 
 # --- ตัวแปรสำหรับเก็บข้อมูล ---
-times = deque(maxlen=MAX_POINTS)
-distances = deque(maxlen=MAX_POINTS)
+distances = TimeSeriesBuffer(MAX_POINTS)
 start_time = time.time()
 
 # --- ตั้งค่ากราฟ ---
@@ -36,39 +40,22 @@ def setup_plot():
 
 def update_plot(frame):
     """ฟังก์ชันสำหรับอัปเดตกราฟในแต่ละเฟรม"""
-    # ปรับปรุงขอบเขตแกน X ให้เลื่อนตามเวลา
-    if times:
-        last_time = times[-1]
-        if last_time > ax.get_xlim()[1]:
-             ax.set_xlim(last_time - (MAX_POINTS * 1.1), last_time + 5)
-    
-    # ปรับปรุงขอบเขตแกน Y อัตโนมัติ
-    if distances:
-        min_dist = min(distances)
-        max_dist = max(distances)
-        ax.set_ylim(min_dist - 1, max_dist + 1)
-
-    line.set_data(list(times), list(distances))
-    return line,
+    # แกน X เลื่อนตามเวลา (แสดง WINDOW_SEC วินาทีล่าสุด) แกน Y ปรับอัตโนมัติตามช่วงที่มองเห็น
+    return update_time_series(ax, line, distances, WINDOW_SEC)
 
 def serial_reader_thread(ser):
     """ฟังก์ชันสำหรับอ่านข้อมูลจาก Serial Port ใน Thread แยก"""
     while ser.is_open:
         try:
-            line_str = ser.readline().decode('utf-8').strip()
-            if line_str.startswith("Distance:"):
-                try:
-                    dist_val = float(line_str.split(':')[1])
-                    current_time = time.time() - start_time
-                    
-                    # เพิ่มข้อมูลใหม่เข้าไปใน Deque
-                    times.append(current_time)
-                    distances.append(dist_val)
-                    
-                    print(f"Time: {current_time:.2f}s, Distance: {dist_val:.2f}m")
-                except (ValueError, IndexError):
-                    # ข้ามบรรทัดที่ข้อมูลไม่สมบูรณ์
-                    pass
+            # รับทั้ง "Distance:<m>" (ESP32c3) และ "DISTANCE_RSSI,<m>" (esp32class) บรรทัดที่ไม่สมบูรณ์จะถูกข้าม
+            record = parse_text_record(ser.readline())
+            if record.kind in (RECORD_DISTANCE, RECORD_DISTANCE_RSSI):
+                current_time = time.time() - start_time
+                
+                # เพิ่มข้อมูลใหม่เข้าไปใน buffer
+                distances.append(current_time, record.value)
+                
+                print(f"Time: {current_time:.2f}s, Distance: {record.value:.2f}m")
         except serial.SerialException:
             print("Serial port disconnected. Exiting thread.")
             break
@@ -80,7 +67,7 @@ def serial_reader_thread(ser):
 if __name__ == '__main__':
     try:
         # เริ่มการเชื่อมต่อ Serial
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+        ser = open_serial(SERIAL_PORT, BAUD_RATE, timeout=1)
         print(f"Connected to {SERIAL_PORT} at {BAUD_RATE} bps.")
 
         # เริ่ม Thread สำหรับการอ่านข้อมูล Serial
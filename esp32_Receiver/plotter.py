@@ -1,23 +1,31 @@
 import serial
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-from collections import deque
+import sys
 import time
 import threading
 
+# ใช้ backend กราฟร่วมกับโฟลเดอร์ ESP32s3_Study (วิธีตั้ง PYTHONPATH ดูหัวไฟล์ ESP32s3_Study/csi_liveplot.py)
+try:
+    from csi_liveplot import TimeSeriesBuffer, update_time_series
+except ImportError:
+    print("Error: csi_liveplot not found. Add the ESP32s3_Study folder to PYTHONPATH, "
+          "e.g. PYTHONPATH=../ESP32s3_Study python plotter.py")
+    sys.exit(1)
+
 # --- การตั้งค่า (CONFIGURATION) ---
 # TODO: แก้ไขให้ตรงกับ Port ของ ESP32 Gateway Node ของคุณ
 SERIAL_PORT = 'COM3'  
 BAUD_RATE = 115200
 
 # ## ปรับแก้ที่นี่ ##
-# จำนวนจุดข้อมูลล่าสุดที่จะแสดงบนกราฟ
+# จำนวนจุดข้อมูลย้อนหลังที่เก็บไว้ (numpy ring buffer) และช่วงเวลาที่แสดงบนกราฟ
 # ยิ่งค่ามาก จุดยิ่งค้างอยู่บนกราฟนานขึ้น
 POINTS_TO_SHOW = 100000
+WINDOW_SEC = 20
 
 # --- ตัวแปรสำหรับเก็บข้อมูล ---
-times = deque(maxlen=POINTS_TO_SHOW)
-distances = deque(maxlen=POINTS_TO_SHOW)
+distances = TimeSeriesBuffer(POINTS_TO_SHOW)
 start_time = time.time()
 
 # --- ตั้งค่ากราฟ ---
@@ -38,19 +46,9 @@ def setup_plot():
 
 def update_plot(frame):
     """ฟังก์ชันสำหรับอัปเดตกราฟในแต่ละเฟรม"""
-    if times:
-        # ปรับปรุงขอบเขตแกน X ให้เป็นหน้าต่างที่เลื่อนตามเวลา
-        time_window = max(20, times[-1]) # ให้หน้าต่างกว้างอย่างน้อย 20 วินาที
-        ax.set_xlim(max(0, time_window - 20), time_window + 2)
-    
-        # ปรับปรุงขอบเขตแกน Y อัตโนมัติ
-        min_dist = min(distances)
-        max_dist = max(distances)
-        ax.set_ylim(min_dist - 1, max_dist + 1)
-
-    # วาดข้อมูลทั้งหมดที่อยู่ใน deque (ซึ่งมีจำนวนไม่เกิน POINTS_TO_SHOW)
-    line.set_data(list(times), list(distances))
-    return line,
+    # วาดเฉพาะ WINDOW_SEC วินาทีล่าสุด ย่อให้เหลือไม่เกิน 2 จุดต่อ pixel
+    # (เวลาที่ใช้วาดคงที่ ไม่ว่าจะเก็บข้อมูลไว้กี่จุด)
+    return update_time_series(ax, line, distances, WINDOW_SEC)
 
 def serial_reader_thread(ser):
     """ฟังก์ชันสำหรับอ่านข้อมูลจาก Serial Port ใน Thread แยก"""
@@ -63,8 +61,7 @@ def serial_reader_thread(ser):
                 try:
                     dist_val = float(line_str.split(':')[1])
                     current_time = time.time() - start_time
-                    times.append(current_time)
-                    distances.append(dist_val)
+                    distances.append(current_time, dist_val)
                 except (ValueError, IndexError):
                     pass
         except (serial.SerialException, TypeError, OSError):
@@ -1,10 +1,18 @@
 import serial
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-from collections import deque
+import sys
 import time
 import threading
 
+# ใช้ backend กราฟร่วมกับโฟลเดอร์ ESP32s3_Study (วิธีตั้ง PYTHONPATH ดูหัวไฟล์ ESP32s3_Study/csi_liveplot.py)
+try:
+    from csi_liveplot import TimeSeriesBuffer, update_time_series
+except ImportError:
+    print("Error: csi_liveplot not found. Add the ESP32s3_Study folder to PYTHONPATH, "
+          "e.g. PYTHONPATH=../ESP32s3_Study python plotter.py")
+    sys.exit(1)
+
 # --- ตั้งค่า ---
 # TODO: แก้ไขให้ตรงกับ Port ของ ESP32 Gateway Node ของคุณ
 # Windows: 'COM3', 'COM4', ...
@@ -12,11 +20,11 @@ import threading
 # Linux: '/dev/ttyUSB0', '/dev/ttyACM0', ...
 SERIAL_PORT = 'COM7'  
 BAUD_RATE = 115200
-MAX_POINTS = 50  # จำนวนจุดสูงสุดที่จะแสดงบนกราฟ
+MAX_POINTS = 50  # จำนวนจุดย้อนหลังที่เก็บไว้ (เก็บใน numpy ring buffer)
+WINDOW_SEC = 20  # ช่วงเวลาล่าสุดที่แสดงบนกราฟ (วินาที)
 
 # --- ตัวแปรสำหรับเก็บข้อมูล ---
-times = deque(maxlen=MAX_POINTS)
-distances = deque(maxlen=MAX_POINTS)
+distances = TimeSeriesBuffer(MAX_POINTS)
 start_time = time.time()
 
 # --- ตั้งค่ากราฟ ---
@@ -36,20 +44,8 @@ def setup_plot():
 
 def update_plot(frame):
     """ฟังก์ชันสำหรับอัปเดตกราฟในแต่ละเฟรม"""
-    # ปรับปรุงขอบเขตแกน X ให้เลื่อนตามเวลา
-    if times:
-        last_time = times[-1]
-        if last_time > ax.get_xlim()[1]:
-             ax.set_xlim(last_time - (MAX_POINTS * 1.1), last_time + 5)
-    
-    # ปรับปรุงขอบเขตแกน Y อัตโนมัติ
-    if distances:
-        min_dist = min(distances)
-        max_dist = max(distances)
-        ax.set_ylim(min_dist - 1, max_dist + 1)
-
-    line.set_data(list(times), list(distances))
-    return line,
+    # แกน X เลื่อนตามเวลา (แสดง WINDOW_SEC วินาทีล่าสุด) แกน Y ปรับอัตโนมัติตามช่วงที่มองเห็น
+    return update_time_series(ax, line, distances, WINDOW_SEC)
 
 def serial_reader_thread(ser):
     """ฟังก์ชันสำหรับอ่านข้อมูลจาก Serial Port ใน Thread แยก"""
@@ -61,9 +57,8 @@ def serial_reader_thread(ser):
                     dist_val = float(line_str.split(':')[1])
                     current_time = time.time() - start_time
                     
-                    # เพิ่มข้อมูลใหม่เข้าไปใน Deque
-                    times.append(current_time)
-                    distances.append(dist_val)
+                    # เพิ่มข้อมูลใหม่เข้าไปใน buffer
+                    distances.append(current_time, dist_val)
                     
                     print(f"Time: {current_time:.2f}s, Distance: {dist_val:.2f}m")
                 except (ValueError, IndexError):
@@ -10,12 +10,25 @@
 #include "esp_log.h"
 #include "nvs_flash.h"
 #include "esp_netif.h"
+#include "esp_timer.h"
+#include "driver/uart.h"
 
 // -- กำหนดค่า Wi-Fi --
 #define WIFI_SSID           "1729"
 #define WIFI_PASS           "88888888"
 #define WIFI_MAXIMUM_RETRY  5
 
+// -- รูปแบบการส่งข้อมูล CSI ออกทาง Serial --
+// 0 = ข้อความ "CSI_DATA,..." (เดิม), 1 = เฟรมไบนารีแบบมี CRC (ดู csi_protocol.py ฝั่ง Python)
+#define CSI_BINARY_OUTPUT   0
+// 1 = ส่ง I/Q ดิบ (int8 คู่ [imag, real] ต่อ subcarrier) แทน amplitude ให้ host คำนวณ amplitude / phase เอง
+//     (ไม่มีการคำนวณ float ต่อ subcarrier บนอุปกรณ์ ดู csi_phase.py) ต้องใช้คู่กับ CSI_BINARY_OUTPUT 1
+#define CSI_IQ_OUTPUT       0
+#define CSI_FLAG_IQ         0x01    // bit ใน flags ของ header (ต้องตรงกับ FLAG_IQ ใน csi_protocol.py)
+#define CSI_UART_PORT       UART_NUM_0
+#define CSI_AMP_SCALE       100.0f  // amplitude ถูกส่งเป็น int16 = amplitude x CSI_AMP_SCALE
+#define CSI_MAX_SUBCARRIERS 192
+
 // -- กำหนดค่าสำหรับ Log-Distance Path Loss Model --
 #define CAL_RSSI_AT_1M      -45.0 // (A) ค่า RSSI เฉลี่ยที่วัดได้ ณ ระยะ 1 เมตร (dBm)
 #define PATH_LOSS_N         2.5   // (n) ค่าคงที่การลดทอนของสัญญาณ
@@ -25,6 +38,8 @@
 typedef struct {
     uint8_t buf[MAX_CSI_BUF_LEN];
     uint16_t len;
+    int8_t rssi;
+    int64_t timestamp_us;
 } csi_data_t;
 
 static const char *TAG = "WIFI_CSI_APP";
@@ -32,6 +47,78 @@ static int s_retry_num = 0;
 static bool wifi_connected = false;
 static QueueHandle_t csi_queue; // <<< สร้างตัวแปร Queue
 
+#if CSI_IQ_OUTPUT && !CSI_BINARY_OUTPUT
+#error "CSI_IQ_OUTPUT requires CSI_BINARY_OUTPUT 1"
+#endif
+
+#if CSI_BINARY_OUTPUT
+// --- Header ของเฟรมไบนารี (ต้องตรงกับ HEADER ใน csi_protocol.py) ---
+typedef struct __attribute__((packed)) {
+    uint8_t  sync[2];       // 0xC5 0x1A
+    uint8_t  version;
+    uint8_t  flags;
+    uint16_t payload_len;   // n_sc * 2 (int16 amplitude หรือ int8 I/Q)
+    uint32_t seq;
+    uint64_t timestamp_us;
+    int8_t   rssi;
+    uint8_t  n_sc;
+} csi_frame_header_t;
+
+static uint32_t s_csi_seq = 0;
+static uint8_t s_frame_buf[sizeof(csi_frame_header_t) + CSI_MAX_SUBCARRIERS * 2 + 4] __attribute__((aligned(4)));
+
+// --- CRC32 (polynomial เดียวกับ zlib.crc32 ฝั่ง Python) ---
+static uint32_t crc32_le(uint32_t crc, const uint8_t *buf, size_t len) {
+    crc = ~crc;
+    while (len--) {
+        crc ^= *buf++;
+        for (int k = 0; k < 8; k++) {
+            crc = (crc >> 1) ^ (0xEDB88320 & -(crc & 1));
+        }
+    }
+    return ~crc;
+}
+
+// --- ส่ง CSI 1 เฟรมแบบไบนารี (int16 ต่อ subcarrier แทนข้อความ "%.2f,") ---
+static void send_csi_binary_frame(const int8_t *csi_buf, int len, int8_t rssi, int64_t timestamp_us) {
+    int n_sc = len / 2;
+    if (n_sc > CSI_MAX_SUBCARRIERS) {
+        n_sc = CSI_MAX_SUBCARRIERS;
+    }
+
+    csi_frame_header_t *hdr = (csi_frame_header_t *)s_frame_buf;
+    hdr->sync[0] = 0xC5;
+    hdr->sync[1] = 0x1A;
+    hdr->version = 1;
+    hdr->payload_len = n_sc * 2;
+    hdr->seq = s_csi_seq++;
+    hdr->timestamp_us = (uint64_t)timestamp_us;
+    hdr->rssi = rssi;
+    hdr->n_sc = n_sc;
+
+#if CSI_IQ_OUTPUT
+    // คัดลอก I/Q ตามที่ได้จาก driver ตรงๆ (2 ไบต์ต่อ subcarrier เท่ากับ int16 amplitude)
+    hdr->flags = CSI_FLAG_IQ;
+    memcpy(s_frame_buf + sizeof(csi_frame_header_t), csi_buf, n_sc * 2);
+#else
+    hdr->flags = 0;
+    int16_t *amp = (int16_t *)(s_frame_buf + sizeof(csi_frame_header_t));
+    for (int i = 0; i < n_sc; i++) {
+        float re = csi_buf[2 * i];
+        float im = csi_buf[2 * i + 1];
+        amp[i] = (int16_t)lrintf(sqrtf(re * re + im * im) * CSI_AMP_SCALE);
+    }
+#endif
+
+    size_t body_len = sizeof(csi_frame_header_t) + n_sc * 2;
+    uint32_t crc = crc32_le(0, s_frame_buf + 2, body_len - 2);
+    memcpy(s_frame_buf + body_len, &crc, sizeof(crc));
+
+    // ใช้ UART driver โดยตรง เพราะ printf/stdout อาจแปลง \n เป็น \r\n และทำให้ข้อมูลไบนารีเสีย
+    uart_write_bytes(CSI_UART_PORT, (const char *)s_frame_buf, body_len + sizeof(crc));
+}
+#endif
+
 // --- ฟังก์ชันคำนวณระยะทางจาก RSSI ---
 float estimate_distance_from_rssi(int rssi) {
     float distance = pow(10, (CAL_RSSI_AT_1M - (float)rssi) / (10.0 * PATH_LOSS_N));
@@ -47,6 +134,8 @@ void wifi_csi_rx_cb(void *ctx, wifi_csi_info_t *info) {
     // 1. สร้าง struct เพื่อคัดลอกข้อมูล
     csi_data_t csi_data;
     csi_data.len = info->len;
+    csi_data.rssi = info->rx_ctrl.rssi;
+    csi_data.timestamp_us = esp_timer_get_time();
     memcpy(csi_data.buf, info->buf, info->len);
 
     // 2. ส่งข้อมูลเข้า Queue โดยไม่รอ (Non-blocking)
@@ -62,14 +151,18 @@ void csi_processing_task(void *pvParameters) {
         // รอรับข้อมูลจาก Queue (จะ Block Task นี้ไว้จนกว่าจะมีข้อมูลมา)
         if (xQueueReceive(csi_queue, &received_data, portMAX_DELAY)) {
             
+            int8_t *csi_buf = (int8_t *)received_data.buf;
+#if CSI_BINARY_OUTPUT
+            send_csi_binary_frame(csi_buf, received_data.len, received_data.rssi, received_data.timestamp_us);
+#else
             // --- ส่วนนี้คือโค้ดที่ย้ายมาจาก Callback เดิม ---
             printf("CSI_DATA,");
-            int8_t *csi_buf = (int8_t *)received_data.buf;
             for (int i = 0; i < received_data.len; i += 2) {
                 float amplitude = sqrt(pow(csi_buf[i], 2) + pow(csi_buf[i+1], 2));
                 printf("%.2f%s", amplitude, (i < received_data.len - 2) ? "," : "");
             }
             printf("\n");
+#endif
             // ------------------------------------------------
         }
     }
@@ -139,6 +232,11 @@ void app_main(void)
       ret = nvs_flash_init();
     }
     ESP_ERROR_CHECK(ret);
+
+#if CSI_BINARY_OUTPUT
+    // ติดตั้ง UART driver สำหรับส่งเฟรมไบนารี (TX buffer ใหญ่พอไม่ให้ Task ต้องรอ)
+    ESP_ERROR_CHECK(uart_driver_install(CSI_UART_PORT, 1024, 4096, 0, NULL, 0));
+#endif
     
     // Initialize Network Stack
     ESP_ERROR_CHECK(esp_netif_init());